@@ -1,10 +1,10 @@
-import json
 import numpy as np
-import cv2
+from homography import bottom_middles, load_homography_matrix, transform_frames, transform_points
+from detection_store import DetectionStore, color_codes, is_store_path, read_frames, read_store, write_frames, write_store
 
 # File paths
-TRACKING_DATA_RIGHT = "right5.json"
-TRACKING_DATA_LEFT = "left5shifted.json"
+TRACKING_DATA_RIGHT = "right5.jsonl"
+TRACKING_DATA_LEFT = "left5shifted.jsonl"
 HOMOGRAPHY_MATRIX_LEFT = "al2_homography_matrix.txt"
 HOMOGRAPHY_MATRIX_RIGHT = "al1_homography_matrix.txt"
 DIMENSIONS_FILE = "dimensions.txt"
@@ -21,61 +21,51 @@ COLORS = {
     "left_non_intersection": "blue",
 }
 
-def load_dimensions_and_homographies():
+def load_dimensions_and_homographies(dimensions_file=DIMENSIONS_FILE, homography_left_file=HOMOGRAPHY_MATRIX_LEFT,
+                                     homography_right_file=HOMOGRAPHY_MATRIX_RIGHT):
     """Load blue line positions and homography matrices."""
-    with open(DIMENSIONS_FILE, "r") as f:
+    with open(dimensions_file, "r") as f:
         lines = f.readlines()
     blue_line_right, width_right = map(int, lines[0].split())
     blue_line_left, width_left = map(int, lines[1].split())
 
-    homography_matrix_left = np.loadtxt(HOMOGRAPHY_MATRIX_LEFT, delimiter=' ')
-    homography_matrix_right = np.loadtxt(HOMOGRAPHY_MATRIX_RIGHT, delimiter=' ')
+    homography_matrix_left = load_homography_matrix(homography_left_file)
+    homography_matrix_right = load_homography_matrix(homography_right_file)
 
     return blue_line_right, width_right, blue_line_left, width_left, homography_matrix_left, homography_matrix_right
 
-def transform_point(point, homography_matrix):
-    """Transform a single point using a homography matrix."""
-    point = np.array([[point]], dtype=np.float32)
-    transformed_point = cv2.perspectiveTransform(point, homography_matrix)
-    return transformed_point[0][0]
+from instrumentation import progress
 
-def is_point_within_bounds(point, frame_width, frame_height):
-    """Check if a point is within the bounds of the transformed image."""
-    x, y = point
-    return 0 <= x < frame_width and 0 <= y < frame_height
-
-from tqdm import tqdm  # Import tqdm
-
-def filter_objects(data, homography, red_line, frame_width, frame_height, is_right):
+def filter_objects(data, homography, red_line, frame_width, frame_height, is_right, colors=COLORS):
     """
     Filter bounding boxes into intersection and non-intersection groups with color added.
     """
     intersections = []
     non_intersections = []
 
-    for frame in tqdm(data, desc="Processing frames", total=len(data)):
+    # Project the bottom middle of every bbox in the match at once
+    transformed_frames = transform_frames(data, homography)
+
+    for frame, transformed in progress(zip(data, transformed_frames), desc="Processing frames", total=len(data)):
         frame_index = frame["frame_index"]
         intersecting_objects = []
         non_intersecting_objects = []
 
-        # Check bounding boxes
-        for obj in frame.get("objects", []):
-            bbox = obj["bbox"]
-            bottom_middle = [(bbox[0] + bbox[2]) / 2, bbox[3]]  # Centroid width coordinate
-            transformed_point = transform_point(bottom_middle, homography)
-            x_trans, y_trans = transformed_point
+        x_trans, y_trans = transformed[:, 0], transformed[:, 1]
+        within_bounds = (0 <= x_trans) & (x_trans < frame_width) & (0 <= y_trans) & (y_trans < frame_height)
 
-            # Determine if the object is in the intersection
-            if is_right:
-                in_intersection = (0 < x_trans < red_line and is_point_within_bounds(transformed_point, frame_width, frame_height))
-            else:
-                in_intersection = (red_line < x_trans < frame_width and is_point_within_bounds(transformed_point, frame_width, frame_height))
+        # Determine which objects are in the intersection
+        if is_right:
+            in_intersection = (0 < x_trans) & (x_trans < red_line) & within_bounds
+        else:
+            in_intersection = (red_line < x_trans) & (x_trans < frame_width) & within_bounds
 
-            if in_intersection:
-                obj["color"] = COLORS["right_intersection"] if is_right else COLORS["left_intersection"]
+        for obj, is_in in zip(frame.get("objects", []), in_intersection):
+            if is_in:
+                obj["color"] = colors["right_intersection"] if is_right else colors["left_intersection"]
                 intersecting_objects.append(obj)
             else:
-                obj["color"] = COLORS["right_non_intersection"] if is_right else COLORS["left_non_intersection"]
+                obj["color"] = colors["right_non_intersection"] if is_right else colors["left_non_intersection"]
                 non_intersecting_objects.append(obj)
 
         if intersecting_objects:
@@ -85,10 +75,33 @@ def filter_objects(data, homography, red_line, frame_width, frame_height, is_rig
 
     return intersections, non_intersections
 
-def main():
-    # Load dimensions, homographies, and offset
-    blue_line_right, width_right, blue_line_left, width_left, homography_left, homography_right = load_dimensions_and_homographies()
+def filter_store(store, homography, red_line, frame_width, frame_height, is_right, colors=COLORS):
+    """
+    filter_objects on a DetectionStore, with one projection and one mask for the whole match.
+    Returns (intersections, non_intersections) as stores without empty frames.
+    """
+    transformed = transform_points(bottom_middles(store.bbox), homography)
+    x_trans, y_trans = transformed[:, 0], transformed[:, 1]
+    within_bounds = (0 <= x_trans) & (x_trans < frame_width) & (0 <= y_trans) & (y_trans < frame_height)
+    side = "right" if is_right else "left"
+    if is_right:
+        in_intersection = (0 < x_trans) & (x_trans < red_line) & within_bounds
+    else:
+        in_intersection = (red_line < x_trans) & (x_trans < frame_width) & within_bounds
+    intersection_color, non_intersection_color = color_codes(
+        [colors[f"{side}_intersection"], colors[f"{side}_non_intersection"]]
+    )
+
+    colored = store.with_columns(color=np.where(in_intersection, intersection_color, non_intersection_color))
+    return colored.select(in_intersection, keep_empty=False), colored.select(~in_intersection, keep_empty=False)
 
+def split_intersections(data_right, data_left, blue_line_right, blue_line_left, homography_left, homography_right,
+                        frame_width=400, frame_height=300, colors=COLORS):
+    """
+    Split both cameras' detections into intersection and non-intersection groups.
+    Returns (right_intersections, right_non_intersections, left_intersections, left_non_intersections),
+    as DetectionStores if the detections are stores and as frame lists otherwise.
+    """
     # Offset for red line calculation
     offset_x = blue_line_right  # First number from the first line of dimensions.txt
 
@@ -96,61 +109,56 @@ def main():
     red_line_right = blue_line_right + offset_x
     red_line_left = blue_line_left - offset_x
 
-    # Transformed image dimensions
-    frame_width, frame_height = 400, 300
-
-    # Load tracking data
-    with open(TRACKING_DATA_RIGHT, "r") as f:
-        data_right = json.load(f)
-    with open(TRACKING_DATA_LEFT, "r") as f:
-        data_left = json.load(f)
-
     # Filter objects for right and left videos
-    right_intersections, right_non_intersections = filter_objects(
-        data_right, homography_right, red_line_right, frame_width, frame_height, is_right=True
+    filter_split = filter_store if isinstance(data_right, DetectionStore) else filter_objects
+    right_intersections, right_non_intersections = filter_split(
+        data_right, homography_right, red_line_right, frame_width, frame_height, is_right=True, colors=colors
     )
-    left_intersections, left_non_intersections = filter_objects(
-        data_left, homography_left, red_line_left, frame_width, frame_height, is_right=False
+    left_intersections, left_non_intersections = filter_split(
+        data_left, homography_left, red_line_left, frame_width, frame_height, is_right=False, colors=colors
+    )
+    return right_intersections, right_non_intersections, left_intersections, left_non_intersections
+
+def main(tracking_data_right=TRACKING_DATA_RIGHT, tracking_data_left=TRACKING_DATA_LEFT,
+         homography_matrix_left=HOMOGRAPHY_MATRIX_LEFT, homography_matrix_right=HOMOGRAPHY_MATRIX_RIGHT,
+         dimensions_file=DIMENSIONS_FILE, output_right_json=OUTPUT_RIGHT_JSON,
+         output_right_non_json=OUTPUT_RIGHT_NON_INTERSECTIONS_JSON, output_left_json=OUTPUT_LEFT_JSON,
+         output_left_non_json=OUTPUT_LEFT_NON_INTERSECTIONS_JSON):
+    # Load dimensions and homographies
+    blue_line_right, width_right, blue_line_left, width_left, homography_left, homography_right = \
+        load_dimensions_and_homographies(dimensions_file, homography_matrix_left, homography_matrix_right)
+
+    # Load tracking data; .npz detections are split in columnar form
+    columnar = is_store_path(tracking_data_right) or is_store_path(tracking_data_left)
+    read = read_store if columnar else read_frames
+    data_right = read(tracking_data_right)
+    data_left = read(tracking_data_left)
+
+    right_intersections, right_non_intersections, left_intersections, left_non_intersections = split_intersections(
+        data_right, data_left, blue_line_right, blue_line_left, homography_left, homography_right
     )
 
     # Save the filtered intersections and non-intersections
-    with open(OUTPUT_RIGHT_JSON, "w") as right_file:
-        json.dump(right_intersections, right_file, indent=2)
-    with open(OUTPUT_RIGHT_NON_INTERSECTIONS_JSON, "w") as right_non_file:
-        json.dump(right_non_intersections, right_non_file, indent=2)
-    with open(OUTPUT_LEFT_JSON, "w") as left_file:
-        json.dump(left_intersections, left_file, indent=2)
-    with open(OUTPUT_LEFT_NON_INTERSECTIONS_JSON, "w") as left_non_file:
-        json.dump(left_non_intersections, left_non_file, indent=2)
-
-    print(f"Right intersections saved to {OUTPUT_RIGHT_JSON}")
-    print(f"Right non-intersections saved to {OUTPUT_RIGHT_NON_INTERSECTIONS_JSON}")
-    print(f"Left intersections saved to {OUTPUT_LEFT_JSON}")
-    print(f"Left non-intersections saved to {OUTPUT_LEFT_NON_INTERSECTIONS_JSON}")
-
-import filterjson2
+    write = write_store if columnar else write_frames
+    write(right_intersections, output_right_json)
+    write(right_non_intersections, output_right_non_json)
+    write(left_intersections, output_left_json)
+    write(left_non_intersections, output_left_non_json)
 
-if __name__ == "__main__":
-    main()
-    print("First script completed. Now running the second script...")
-    filterjson2.main()  # Call the second script after finishing the first
+    print(f"Right intersections saved to {output_right_json}")
+    print(f"Right non-intersections saved to {output_right_non_json}")
+    print(f"Left intersections saved to {output_left_json}")
+    print(f"Left non-intersections saved to {output_left_non_json}")
 
 def run_homography_and_merge(
     tracking_data_right, tracking_data_left, homography_matrix_left, homography_matrix_right,
     dimensions_file, output_right_json, output_right_non_json, output_left_json, output_left_non_json
 ):
-    global TRACKING_DATA_RIGHT, TRACKING_DATA_LEFT, HOMOGRAPHY_MATRIX_LEFT, HOMOGRAPHY_MATRIX_RIGHT
-    global DIMENSIONS_FILE, OUTPUT_RIGHT_JSON, OUTPUT_RIGHT_NON_INTERSECTIONS_JSON
-    global OUTPUT_LEFT_JSON, OUTPUT_LEFT_NON_INTERSECTIONS_JSON, DEBUG_IMAGE_RIGHT, DEBUG_IMAGE_LEFT
-
-    TRACKING_DATA_RIGHT = tracking_data_right
-    TRACKING_DATA_LEFT = tracking_data_left
-    HOMOGRAPHY_MATRIX_LEFT = homography_matrix_left
-    HOMOGRAPHY_MATRIX_RIGHT = homography_matrix_right
-    DIMENSIONS_FILE = dimensions_file
-    OUTPUT_RIGHT_JSON = output_right_json
-    OUTPUT_RIGHT_NON_INTERSECTIONS_JSON = output_right_non_json
-    OUTPUT_LEFT_JSON = output_left_json
-    OUTPUT_LEFT_NON_INTERSECTIONS_JSON = output_left_non_json
-
-    main()
\ No newline at end of file
+    # The paths are passed down rather than stored in the module, so concurrent calls do not interfere
+    main(tracking_data_right, tracking_data_left, homography_matrix_left, homography_matrix_right, dimensions_file,
+         output_right_json, output_right_non_json, output_left_json, output_left_non_json)
+
+if __name__ == "__main__":
+    # Run every stage, passing data in memory instead of chaining main() calls
+    import pipeline
+    pipeline.main()
@@ -1,8 +1,9 @@
-import json
 import numpy as np
-import cv2
-import shutil
-from tqdm import tqdm  # Import tqdm for progress tracking
+from instrumentation import progress
+from homography import (
+    bottom_middles, frame_bboxes, inverse_transform_points, load_homography_matrix, transform_points
+)
+from detection_store import read_frames, write_frames
 
 # File paths
 JSON_LEFT_INTERSECTION = "filtered_left_intersections.json"
@@ -13,113 +14,115 @@ DIMENSIONS_FILE = "dimensions.txt"
 NEW_JSON_LEFT_INTERSECTION = "new_left_intersections.json"
 NEW_JSON_RIGHT_INTERSECTION = "new_right_intersections.json"
 
-def transform_point(point, homography_matrix):
-    """Transform a single point using a homography matrix."""
-    point = np.array([[point]], dtype=np.float32)
-    transformed_point = cv2.perspectiveTransform(point, homography_matrix)
-    return transformed_point[0][0]
-
-def inverse_transform_point(point, homography_matrix):
-    """Inverse transform a single point using a homography matrix."""
-    inverse_matrix = np.linalg.inv(homography_matrix)
-    return transform_point(point, inverse_matrix)
-
-def adjust_center_coordinates(bbox, center, blue_line_x_src, blue_line_x_dst, homography_matrix_src, homography_matrix_dst):
+def adjust_centers(bboxes, centers, transformed_middle_bottoms, blue_line_x_src, blue_line_x_dst, homography_matrix_dst):
     """
-    Adjust the coordinates of the new center based on the middle bottom of the bbox.
+    Move the objects of one frame across the blue line: each bbox middle bottom keeps its distance
+    to the source blue line in world coordinates, measured from the destination blue line instead,
+    and is projected back with the destination homography; the new center keeps its original
+    offset from the middle bottom.
+    - transformed_middle_bottoms: bbox middle bottoms already projected with the source homography.
+    Returns an (N, 2) float64 array of new centers.
     """
-    # Calculate middle bottom of the bbox
-    middle_bottom = [(bbox[0] + bbox[2]) / 2, bbox[3]]  # (mid_x, bottom_y)
-
-    # Compute difference vector between original center and middle bottom
-    difference_vector = [center[0] - middle_bottom[0], center[1] - middle_bottom[1]]
+    middle_bottoms = bottom_middles(bboxes)
+    difference_vectors = np.asarray(centers, dtype=np.float64).reshape(-1, 2) - middle_bottoms
 
-    # Transform the middle bottom to world coordinates
-    transformed_point = transform_point(middle_bottom, homography_matrix_src)
-    x_trans_src, y_trans_src = transformed_point
+    # Shift along the width axis from the source blue line to the destination one
+    shifted = transformed_middle_bottoms.copy()
+    shifted[:, 0] = blue_line_x_dst + (transformed_middle_bottoms[:, 0] - blue_line_x_src)
 
-    # Calculate new transformed coordinates
-    width_diff = x_trans_src - blue_line_x_src
-    new_x_trans_dst = blue_line_x_dst + width_diff
+    new_middle_bottoms = inverse_transform_points(shifted, homography_matrix_dst).astype(np.float64)
+    return new_middle_bottoms + difference_vectors
 
-    # Transform back to pixel coordinates
-    inverse_transformed_point = inverse_transform_point((new_x_trans_dst, y_trans_src), homography_matrix_dst)
-    new_middle_bottom_x, new_middle_bottom_y = map(float, inverse_transformed_point)
-
-    # Calculate the new center by adding the difference vector
-    new_center_x = new_middle_bottom_x + difference_vector[0]
-    new_center_y = new_middle_bottom_y + difference_vector[1]
-
-    return [new_center_x, new_center_y]
+def copy_crossing_objects(frame_data, homography_matrix_src, homography_matrix_dst, blue_line_src, blue_line_dst,
+                          destination_json, destination_frames, is_left_side):
+    """
+    Copy objects crossing the blue line to the opposite side with adjusted center coordinates.
+    - destination_json: frame list of the opposite side; missing frames are appended to it.
+    - destination_frames: frame_index -> frame index over destination_json.
+    """
+    objects = frame_data["objects"]
+    if not objects:
+        return
+    bboxes = frame_bboxes(objects)
+
+    # Check crossing based on middle bottom, projecting the whole frame at once
+    transformed = transform_points(bottom_middles(bboxes), homography_matrix_src)
+    x_trans = transformed[:, 0]
+
+    # Determine which objects cross the blue line
+    crossing = x_trans > blue_line_src if is_left_side else x_trans < blue_line_src
+    if not crossing.any():
+        return
+
+    crossing_indices = np.flatnonzero(crossing)
+    new_centers = adjust_centers(
+        bboxes[crossing_indices], [objects[i]["center"] for i in crossing_indices],
+        transformed[crossing_indices], blue_line_src, blue_line_dst, homography_matrix_dst
+    )
+
+    frame_index = frame_data["frame_index"]
+    frame_entry = destination_frames.get(frame_index)
+    if frame_entry is None:
+        # Create a new frame for the copied objects
+        frame_entry = {"frame_index": frame_index, "objects": []}
+        destination_frames[frame_index] = frame_entry
+        destination_json.append(frame_entry)
+
+    for i, new_center in zip(crossing_indices.tolist(), new_centers.tolist()):
+        new_obj = objects[i].copy()
+        new_obj["center"] = new_center
+        frame_entry["objects"].append(new_obj)
+
+def copy_frames(frames):
+    """
+    Copy frames down to the object dicts, enough for later stages to add or change object keys
+    without touching the originals. Returns the copies and a frame_index -> frame index over them.
+    """
+    copies = [{"frame_index": frame["frame_index"], "objects": [obj.copy() for obj in frame["objects"]]} for frame in frames]
+    index = {}
+    for frame in copies:
+        index.setdefault(frame["frame_index"], frame)  # First frame wins, like the old linear scan
+    return copies, index
 
-def create_new_jsons(blue_line_left, blue_line_right, homography_matrix_left, homography_matrix_right):
-    """Create new intersection JSONs by copying previous JSONs and inserting updated objects."""
-    # Load original JSONs
-    with open(JSON_LEFT_INTERSECTION, "r") as f:
-        left_intersection = json.load(f)
-    with open(JSON_RIGHT_INTERSECTION, "r") as f:
-        right_intersection = json.load(f)
-
-    # Copy original JSONs as base for new JSONs
-    shutil.copy(JSON_LEFT_INTERSECTION, NEW_JSON_LEFT_INTERSECTION)
-    shutil.copy(JSON_RIGHT_INTERSECTION, NEW_JSON_RIGHT_INTERSECTION)
-
-    # Reload new JSONs after copying
-    with open(NEW_JSON_LEFT_INTERSECTION, "r") as f:
-        new_left = json.load(f)
-    with open(NEW_JSON_RIGHT_INTERSECTION, "r") as f:
-        new_right = json.load(f)
-
-    # Helper function to copy and insert updated objects
-    def copy_crossing_objects(frame_data, homography_matrix_src, homography_matrix_dst, blue_line_src, blue_line_dst, destination_json, is_left_side):
-        """Copy objects crossing the blue line to the opposite JSON with adjusted center coordinates."""
-        for obj in tqdm(frame_data["objects"], desc="Copying Objects", leave=False, unit="object"):
-            bbox = obj["bbox"]
-            center = obj["center"]
-
-            # Check crossing based on middle bottom
-            middle_bottom = [(bbox[0] + bbox[2]) / 2, bbox[3]]  # (mid_x, bottom_y)
-            transformed_point = transform_point(middle_bottom, homography_matrix_src)
-            x_trans, _ = transformed_point
-
-            # Determine if the object crosses the blue line
-            if (is_left_side and x_trans > blue_line_src) or (not is_left_side and x_trans < blue_line_src):
-                new_center = adjust_center_coordinates(
-                    bbox, center, blue_line_src, blue_line_dst, homography_matrix_src, homography_matrix_dst
-                )
-                new_obj = obj.copy()
-                new_obj["center"] = new_center
-
-                # Check if the frame exists in the destination JSON
-                frame_entry = next((frame for frame in destination_json if frame["frame_index"] == frame_data["frame_index"]), None)
-                if frame_entry:
-                    # Add the object to the existing frame
-                    frame_entry["objects"].append(new_obj)
-                else:
-                    # Create a new frame and add the object
-                    new_frame = {
-                        "frame_index": frame_data["frame_index"],
-                        "objects": [new_obj]
-                    }
-                    destination_json.append(new_frame)
+def adjust_intersections(left_intersection, right_intersection, blue_line_left, blue_line_right, homography_matrix_left, homography_matrix_right):
+    """
+    Copy objects crossing the blue line into the opposite side's intersections.
+    The inputs are left untouched; returns (new_left, new_right) sorted by frame_index.
+    """
+    # Copy original intersections as base for the new ones, indexed by frame_index
+    new_left, new_left_frames = copy_frames(left_intersection)
+    new_right, new_right_frames = copy_frames(right_intersection)
 
     # Process left intersection frames
-    for frame_data in tqdm(left_intersection, desc="Processing Left Frames", unit="frame"):
+    for frame_data in progress(left_intersection, desc="Processing Left Frames", unit="frame"):
         copy_crossing_objects(
-            frame_data, homography_matrix_left, homography_matrix_right, blue_line_left, blue_line_right, new_right, is_left_side=True
+            frame_data, homography_matrix_left, homography_matrix_right, blue_line_left, blue_line_right, new_right, new_right_frames, is_left_side=True
         )
 
     # Process right intersection frames
-    for frame_data in tqdm(right_intersection, desc="Processing Right Frames", unit="frame"):
+    for frame_data in progress(right_intersection, desc="Processing Right Frames", unit="frame"):
         copy_crossing_objects(
-            frame_data, homography_matrix_right, homography_matrix_left, blue_line_right, blue_line_left, new_left, is_left_side=False
+            frame_data, homography_matrix_right, homography_matrix_left, blue_line_right, blue_line_left, new_left, new_left_frames, is_left_side=False
         )
 
+    # Frames added for copied objects were appended at the end; keep both lists ordered
+    new_left.sort(key=lambda frame: frame["frame_index"])
+    new_right.sort(key=lambda frame: frame["frame_index"])
+    return new_left, new_right
+
+def create_new_jsons(blue_line_left, blue_line_right, homography_matrix_left, homography_matrix_right):
+    """Create new intersection JSONs by copying previous JSONs and inserting updated objects."""
+    # Load original JSONs
+    left_intersection = read_frames(JSON_LEFT_INTERSECTION)
+    right_intersection = read_frames(JSON_RIGHT_INTERSECTION)
+
+    new_left, new_right = adjust_intersections(
+        left_intersection, right_intersection, blue_line_left, blue_line_right, homography_matrix_left, homography_matrix_right
+    )
+
     # Save updated JSONs
-    with open(NEW_JSON_LEFT_INTERSECTION, "w") as f:
-        json.dump(new_left, f, indent=2)
-    with open(NEW_JSON_RIGHT_INTERSECTION, "w") as f:
-        json.dump(new_right, f, indent=2)
+    write_frames(new_left, NEW_JSON_LEFT_INTERSECTION)
+    write_frames(new_right, NEW_JSON_RIGHT_INTERSECTION)
 
     print("Updated JSONs have been saved.")
 
@@ -130,17 +133,11 @@ def main():
     blue_line_right, _ = map(int, lines[0].split())
     blue_line_left, _ = map(int, lines[1].split())
 
-    homography_matrix_left = np.loadtxt(HOMOGRAPHY_MATRIX_LEFT, delimiter=' ')
-    homography_matrix_right = np.loadtxt(HOMOGRAPHY_MATRIX_RIGHT, delimiter=' ')
+    homography_matrix_left = load_homography_matrix(HOMOGRAPHY_MATRIX_LEFT)
+    homography_matrix_right = load_homography_matrix(HOMOGRAPHY_MATRIX_RIGHT)
 
     # Create updated JSONs
     create_new_jsons(blue_line_left, blue_line_right, homography_matrix_left, homography_matrix_right)
-    import bos
-    print("third script completed. Now running the fourth script...")
-    bos.main()  # Call the second script after finishing the first
-
-
-import bos
 
 
 if __name__ == "__main__":
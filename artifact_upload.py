@@ -0,0 +1,109 @@
+import gzip
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+WORKERS = 4  # Uploads in flight
+RETRIES = 3  # Extra attempts per file after a failure
+BACKOFF_SECONDS = 1.0  # First retry delay, doubled on every further attempt
+
+# Suffix added to the remote name of a compressed upload
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+class UploadError(Exception):
+    pass
+
+
+class BackblazeBackend:
+    """Uploads through backblaze_sdk.upload_json, which takes the payload from a local file."""
+
+    def __init__(self):
+        from backblaze_sdk import upload_json
+        self._upload_json = upload_json
+
+    def put(self, match_id, name, data):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, name)
+            with open(path, "wb") as f:
+                f.write(data)
+            result = self._upload_json(match_id, name, path)
+        if "error" in result:
+            raise UploadError(result["error"])
+        return result.get("final_file_url", "unknown URL")
+
+
+class LocalDirectoryBackend:
+    """Stand-in for the bucket: writes {root}/{match_id}/{name}, for tests and benchmarks."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def put(self, match_id, name, data):
+        directory = os.path.join(self.root, match_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return "file://" + os.path.abspath(path)
+
+
+def compress(data, compression):
+    """Payload and remote-name suffix for compression None, "gzip" or "zstd"."""
+    if compression is None:
+        return data, ""
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6, mtime=0), COMPRESSION_SUFFIXES["gzip"]
+    if compression == "zstd":
+        if zstandard is None:
+            raise UploadError("zstd compression needs the zstandard package")
+        return zstandard.ZstdCompressor(level=10).compress(data), COMPRESSION_SUFFIXES["zstd"]
+    raise ValueError(f"Unknown compression '{compression}'")
+
+
+def upload_file(backend, match_id, path, compression=None, retries=RETRIES, backoff=BACKOFF_SECONDS):
+    """
+    Upload one local file as {basename}{suffix}, retrying failed attempts with exponential backoff.
+    Returns {"name", "url", "bytes", "uploaded_bytes", "attempts"}; raises the last error.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    payload, suffix = compress(data, compression)
+    name = os.path.basename(path) + suffix
+
+    for attempt in range(retries + 1):
+        try:
+            url = backend.put(match_id, name, payload)
+            return {"name": name, "url": url, "bytes": len(data), "uploaded_bytes": len(payload),
+                    "attempts": attempt + 1}
+        except Exception:
+            if attempt == retries:
+                raise
+            # Jitter keeps concurrent retries from hitting the service in lockstep
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.0))
+
+
+def upload_files(backend, match_id, paths, compression=None, workers=WORKERS, retries=RETRIES,
+                 backoff=BACKOFF_SECONDS):
+    """
+    Upload paths concurrently, with at most workers uploads in flight.
+    Returns {path: upload_file result} for successes and {path: {"error": message}} for
+    files that still failed after all retries, in the order of paths.
+    """
+    def upload(path):
+        try:
+            return upload_file(backend, match_id, path, compression, retries, backoff)
+        except Exception as error:
+            return {"error": str(error)}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return dict(zip(paths, pool.map(upload, paths)))
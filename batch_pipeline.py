@@ -0,0 +1,245 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import ENTRY_YOLO_merge
+import pipeline
+import run_pipeline
+from artifact_upload import BackblazeBackend, LocalDirectoryBackend, upload_files
+from instrumentation import RunReport, SamplingProfiler, configure_progress, measure_call
+from stage_cache import StageCache, DEFAULT_MAX_BYTES
+
+# Files every match reads from the working directory, shared into each workspace
+SHARED_FILES = [
+    run_pipeline.MODEL_FILE,
+    ENTRY_YOLO_merge.DIMENSIONS_FILE,
+    ENTRY_YOLO_merge.HOMOGRAPHY_MATRIX_LEFT,
+    ENTRY_YOLO_merge.HOMOGRAPHY_MATRIX_RIGHT,
+]
+
+
+def prepare_workspace(workspace_root, match_id, shared_files=SHARED_FILES):
+    """
+    Create {workspace_root}/{match_id} with links to the shared calibration and model files,
+    so every stage can keep using its fixed file names inside its own directory.
+    """
+    workspace = os.path.abspath(os.path.join(workspace_root, match_id))
+    os.makedirs(workspace, exist_ok=True)
+    for file_name in shared_files:
+        target = os.path.join(workspace, file_name)
+        if os.path.lexists(target):
+            os.remove(target)
+        try:
+            os.symlink(os.path.abspath(file_name), target)
+        except OSError:  # No symlink permission (e.g. Windows)
+            shutil.copyfile(file_name, target)
+    return workspace
+
+
+def _pin_next_core_group(core_groups):
+    """Inference-pool initializer: each worker process takes the next free group of cores."""
+    run_pipeline.pin_to_cores(core_groups.get())
+
+
+def _detect_in_workspace(workspace, camera, device, detection_options, profile):
+    """Inference-pool task: run one camera's YOLO stage inside the match workspace; returns measure_call's pair."""
+    os.chdir(workspace)
+    detect = {name: detect for name, _, _, detect in run_pipeline.CAMERAS}[camera]
+    return measure_call(f"save_yolo_{camera}", detect, device=device,
+                        profiler=SamplingProfiler if profile else None, **detection_options)
+
+
+def _postprocess_in_workspace(workspace, profile):
+    """Post-processing-pool task: run ENTRY_YOLO_merge through match_codec on the match workspace."""
+    report = RunReport(profile=profile)
+    pipeline.run_default_pipeline(directory=workspace, report=report)
+    return report.stages
+
+
+class BatchRunner:
+    """
+    Process many matches at once, each in its own workspace, with one pool per kind of work:
+    - I/O threads for downloads and uploads,
+    - an inference process pool, each worker pinned to its own group of CPU cores,
+    - a process pool for the JSON post-processing.
+    Backpressure: at most download_ahead matches hold downloaded videos that are not yet through
+    inference, so downloads run ahead of YOLO without filling the disk; the pools queue the rest.
+    The cache (videos and detections) is only used from this process; post-processing in the
+    workers runs without the stage cache. Every workspace gets a run_report.json, measured in
+    the worker processes that ran the stages.
+    """
+
+    def __init__(self, workspace_root, device="cpu", detection_options=None, inference_workers=1,
+                 postprocess_workers=2, io_workers=4, download_ahead=None, video_source=None, storage=None,
+                 upload_compression=None, cache=None, keep_videos=False, profile=False):
+        self.workspace_root = workspace_root
+        self.device = device
+        self.detection_options = detection_options or {}
+        self.video_source = video_source
+        self.storage = storage
+        self.upload_compression = upload_compression
+        self.cache = cache
+        self.keep_videos = keep_videos
+        self.profile = profile
+        self.io_workers = io_workers
+        self.inference_workers = inference_workers
+        self.postprocess_workers = postprocess_workers
+
+        # spawn keeps CUDA and OpenCV state from being forked into the workers
+        context = multiprocessing.get_context("spawn")
+        core_groups = context.Queue()
+        for cores in run_pipeline.partition_cores(inference_workers):
+            core_groups.put(cores)
+        self._inference_pool = ProcessPoolExecutor(
+            max_workers=inference_workers, mp_context=context, initializer=_pin_next_core_group,
+            initargs=(core_groups,)
+        )
+        self._postprocess_pool = ProcessPoolExecutor(max_workers=postprocess_workers, mp_context=context)
+        self._io_pool = ThreadPoolExecutor(max_workers=io_workers)
+        self._download_slots = threading.Semaphore(download_ahead or inference_workers + 1)
+
+    def _fetch(self, match_id, workspace, video_file):
+        return run_pipeline.fetch_match_video(
+            match_id, video_file, self.video_source, self.cache, os.path.join(workspace, video_file)
+        )
+
+    def _start_detection(self, workspace, camera, video_file, output_file, report):
+        """
+        Restore one camera's detections from cache, or queue its inference.
+        Returns (future or None, cache key or None).
+        """
+        restored, key = run_pipeline.lookup_detections(
+            self.cache, camera, os.path.join(workspace, video_file), os.path.join(workspace, output_file),
+            self.device, self.detection_options, report
+        )
+        if restored:
+            return None, None
+        future = self._inference_pool.submit(
+            _detect_in_workspace, workspace, camera, self.device, self.detection_options, self.profile
+        )
+        return future, key
+
+    def run_match(self, match_id):
+        """All stages of one match; returns {"match_id", "ok", "error", "seconds"}."""
+        start = time.perf_counter()
+        workspace = prepare_workspace(self.workspace_root, match_id)
+        report = RunReport(match_id, self.profile)
+        try:
+            with self._download_slots:
+                downloads = {
+                    self._io_pool.submit(self._fetch, match_id, workspace, video_file): (camera, video_file, output_file)
+                    for camera, video_file, output_file, _ in run_pipeline.CAMERAS
+                }
+                detections = []
+                for future in as_completed(downloads):
+                    camera, video_file, output_file = downloads[future]
+                    result = future.result()
+                    if "error" in result:
+                        raise IOError(f"downloading {camera} video: {result['error']}")
+                    # The camera's inference is queued as soon as its own video is there
+                    detections.append((self._start_detection(workspace, camera, video_file, output_file, report),
+                                       os.path.join(workspace, output_file)))
+                for (future, key), output_path in detections:
+                    if future is not None:
+                        run_pipeline.add_detection_record(report, future.result())
+                    if key is not None:
+                        self.cache.put_files(key, {"detections": output_path})
+
+            if not self.keep_videos:
+                for _, video_file, _, _ in run_pipeline.CAMERAS:
+                    os.remove(os.path.join(workspace, video_file))
+
+            for values in self._postprocess_pool.submit(_postprocess_in_workspace, workspace, self.profile).result():
+                report.add(values)
+
+            paths = [os.path.join(workspace, fname) for fname in run_pipeline.FINAL_JSONS]
+            storage = self.storage or BackblazeBackend()
+            if not run_pipeline.report_uploads(upload_files(storage, match_id, paths, self.upload_compression,
+                                                            self.io_workers)):
+                raise IOError("uploading final JSONs")
+            return {"match_id": match_id, "ok": True, "error": None, "seconds": time.perf_counter() - start}
+        except Exception as error:
+            print(f"Match {match_id} failed: {error}")
+            return {"match_id": match_id, "ok": False, "error": str(error), "seconds": time.perf_counter() - start}
+        finally:
+            report.write(os.path.join(workspace, run_pipeline.RUN_REPORT_FILE))
+
+    def run(self, match_ids):
+        """Process every match; returns the run_match results in the order of match_ids."""
+        # Enough coordinators to keep every pool busy; the slots and pools bound the real work
+        coordinators = self.inference_workers + self.postprocess_workers + self.io_workers
+        with ThreadPoolExecutor(max_workers=coordinators) as matches:
+            return list(matches.map(self.run_match, match_ids))
+
+    def close(self):
+        self._inference_pool.shutdown()
+        self._postprocess_pool.shutdown()
+        self._io_pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline for many matches side by side.")
+    parser.add_argument("match_ids", nargs="*", help="Match folder IDs in Backblaze B2")
+    parser.add_argument("--match-file", help="File with one match ID per line")
+    parser.add_argument("--workspace-root", default="workspaces", help="Directory holding one workspace per match")
+    parser.add_argument("--device", choices=["cpu", "gpu"], default="cpu", help="Device for YOLO inference")
+    parser.add_argument("--inference-workers", type=int, default=1, help="YOLO runs at once (cores are split between them)")
+    parser.add_argument("--postprocess-workers", type=int, default=2, help="Matches post-processed at once")
+    parser.add_argument("--io-workers", type=int, default=4, help="Downloads and uploads in flight at once")
+    parser.add_argument("--download-ahead", type=int, help="Matches whose videos may wait for inference (default: inference workers + 1)")
+    parser.add_argument("--keep-videos", action="store_true", help="Keep the videos in the workspaces after inference")
+    parser.add_argument("--batch-size", type=int, default=1, help="Frames per YOLO forward pass")
+    parser.add_argument("--frame-stride", type=int, default=1, help="Run YOLO on every N-th frame only")
+    parser.add_argument("--imgsz", type=int, help="YOLO inference image size (model default if omitted)")
+    parser.add_argument("--pitch-roi", choices=["none", "crop", "mask"], default="none",
+                        help="Run YOLO only on the pitch region of each camera (mask: also grey out its surroundings)")
+    parser.add_argument("--cache-dir", help="Cache directory for videos fetched with --video-source and for detections")
+    parser.add_argument("--cache-gb", type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3, help="Cache size limit")
+    parser.add_argument("--video-source", help="Base URL or local directory for ranged video downloads")
+    parser.add_argument("--upload-compression", choices=["none", "gzip", "zstd"], default="none",
+                        help="Compress the final JSONs before uploading them")
+    parser.add_argument("--upload-dir", help="Write the final JSONs to this directory instead of Backblaze B2")
+    parser.add_argument("--profile", action="store_true", help="Add sampled hot functions of every stage to the reports")
+    parser.add_argument("--no-progress", action="store_true", help="Disable progress bars (headless runs)")
+    args = parser.parse_args()
+
+    match_ids = list(args.match_ids)
+    if args.match_file:
+        with open(args.match_file, "r") as f:
+            match_ids += [line.strip() for line in f if line.strip()]
+    if not match_ids:
+        parser.error("no match IDs given")
+    if args.no_progress:
+        configure_progress(enabled=False)  # Before the pools start, so the workers inherit it
+
+    detection_options = {"batch_size": args.batch_size, "stride": args.frame_stride, "imgsz": args.imgsz}
+    if args.pitch_roi != "none":
+        detection_options["roi"] = args.pitch_roi
+    with BatchRunner(
+        args.workspace_root, args.device, detection_options, args.inference_workers, args.postprocess_workers,
+        args.io_workers, args.download_ahead, run_pipeline.make_video_source(args.video_source),
+        LocalDirectoryBackend(args.upload_dir) if args.upload_dir else None,
+        None if args.upload_compression == "none" else args.upload_compression,
+        StageCache(args.cache_dir, int(args.cache_gb * 1024 ** 3)) if args.cache_dir else None,
+        args.keep_videos, args.profile,
+    ) as runner:
+        results = runner.run(match_ids)
+
+    for result in results:
+        status = "ok" if result["ok"] else f"failed ({result['error']})"
+        print(f"{result['match_id']}: {status} in {result['seconds']:.0f}s")
+    print(f"✅ {sum(result['ok'] for result in results)}/{len(results)} matches complete")
+
+
+if __name__ == "__main__":
+    main()
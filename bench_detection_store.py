@@ -0,0 +1,70 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+import filterjson3
+import ioudelete
+from detection_store import is_store_path, read_frames, read_store, write_frames
+from instrumentation import configure_progress
+from synthetic_match import make_stage_output
+
+FORMATS = (".json", ".jsonl", ".npz")
+
+
+def measure(func):
+    """
+    Wall time of func, and the peak of its traced allocations (Python and NumPy) in bytes from a
+    second run under tracemalloc, which would slow the timed run down.
+    """
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):  # The stage functions print summaries
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time reading and two file-to-file stages on the same detections stored as .json, .jsonl and "
+                    ".npz. With .npz input filterjson3 and ioudelete run on the columnar store, otherwise on dicts.")
+    parser.add_argument("--frames", type=int, default=20000, help="Number of synthetic frames")
+    parser.add_argument("--objects", type=int, default=20, help="Players on the pitch")
+    args = parser.parse_args()
+
+    configure_progress(enabled=False)
+    # unifyforbytetrack's output for a synthetic match, the input of filterjson3
+    frames = make_stage_output("merged", args.frames, args.objects)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for extension in FORMATS:
+            paths[extension] = os.path.join(tmp, "detections" + extension)
+            write_frames(frames, paths[extension])
+        del frames
+
+        print(f"{'format':<8}{'size MB':>9}  {'path':<28}{'seconds':>9}{'peak MB':>9}")
+        for extension, path in paths.items():
+            output = os.path.join(tmp, "output" + extension)
+            runs = {
+                "read_frames": lambda: read_frames(path),
+                **({"read_store": lambda: read_store(path)} if is_store_path(path) else {}),
+                "filterjson3 (file to file)": lambda: filterjson3.filter_json_by_border(
+                    path, output, filterjson3.VIDEO_WIDTH, filterjson3.VIDEO_HEIGHT, filterjson3.BORDER_THRESHOLD),
+                "ioudelete (file to file)": lambda: ioudelete.remove_low_conf_objects(path, output),
+            }
+            first = True
+            for label, func in runs.items():
+                elapsed, peak = measure(func)
+                size = f"{os.path.getsize(path) / 1e6:.1f}" if first else ""
+                print(f"{extension if first else '':<8}{size:>9}  {label:<28}{elapsed:>9.3f}{peak / 1e6:>9.1f}")
+                first = False
+
+
+if __name__ == "__main__":
+    main()
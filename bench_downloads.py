@@ -0,0 +1,100 @@
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import video_download
+from video_download import HttpRangeSource, download_ranged
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Static file server with single-range GETs and a B2-style SHA-1 header, standing in for the bucket."""
+
+    latency = 0.0  # Seconds added to every request, to mimic a remote service
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        time.sleep(self.latency)
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range")
+        if range_header:
+            first, last = range_header.split("=", 1)[1].split("-")
+            start, end = int(first), min(int(last), size - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+            with open(path, "rb") as f:
+                self.send_header("x-bz-content-sha1", hashlib.sha1(f.read()).hexdigest())
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        f = open(path, "rb")
+        f.seek(start)
+        self.range_left = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        outputfile.write(source.read(self.range_left))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory, latency):
+    RangeRequestHandler.latency = latency
+    handler = lambda *args, **kwargs: RangeRequestHandler(*args, directory=directory, **kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time ranged video downloads against a local HTTP stand-in.")
+    parser.add_argument("--mb", type=int, default=256, help="Size of the synthetic video")
+    parser.add_argument("--chunk-mb", type=int, default=8, help="Bytes per range request")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds of latency per request")
+    args = parser.parse_args()
+    video_download.CHUNK_BYTES = args.chunk_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as remote, tempfile.TemporaryDirectory() as local:
+        os.makedirs(os.path.join(remote, "match"))
+        with open(os.path.join(remote, "match", "left_video.mp4"), "wb") as f:
+            f.write(os.urandom(args.mb * 1024 * 1024))
+        server = serve(remote, args.latency)
+        source = HttpRangeSource(f"http://127.0.0.1:{server.server_port}")
+        target = os.path.join(local, "left_video.mp4")
+
+        for workers in (1, 4, 8):
+            start = time.perf_counter()
+            download_ranged(source, "match", "left_video.mp4", target, workers=workers)
+            print(f"{workers} range request(s) in flight: {time.perf_counter() - start:6.2f}s")
+            os.remove(target)
+
+        # Interrupt after a few chunks, then resume
+        read_range = source.read_range
+        calls = []
+        def failing_read_range(*range_args):
+            calls.append(range_args)
+            if len(calls) > 4:
+                raise IOError("connection dropped")
+            return read_range(*range_args)
+        source.read_range = failing_read_range
+        try:
+            download_ranged(source, "match", "left_video.mp4", target, workers=1)
+        except IOError:
+            pass
+        source.read_range = read_range
+        result = download_ranged(source, "match", "left_video.mp4", target, workers=8)
+        print(f"Resumed with {result['resumed_bytes'] / 1e6:.0f} MB already on disk; checksum verified")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import time
+import numpy as np
+import cv2
+
+from homography import transform_frames
+from synthetic_match import load_geometry, make_detections
+
+# A 90-minute match at 25 fps
+FULL_MATCH_FRAMES = 90 * 60 * 25
+
+
+def legacy_transform_point(point, homography_matrix):
+    """The per-object helper every stage used before homography.py."""
+    point = np.array([[point]], dtype=np.float32)
+    transformed_point = cv2.perspectiveTransform(point, homography_matrix)
+    return transformed_point[0][0]
+
+
+def bench_legacy(frames, homography_matrix):
+    start = time.perf_counter()
+    for frame in frames:
+        for obj in frame["objects"]:
+            bbox = obj["bbox"]
+            legacy_transform_point([(bbox[0] + bbox[2]) / 2, bbox[3]], homography_matrix)
+    return time.perf_counter() - start
+
+
+def bench_batched(frames, homography_matrix):
+    start = time.perf_counter()
+    transform_frames(frames, homography_matrix)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-point and batched homography projection.")
+    parser.add_argument("--frames", type=int, default=10000, help="Number of synthetic frames to project")
+    parser.add_argument("--objects", type=int, default=20, help="Players on the pitch")
+    args = parser.parse_args()
+
+    homographies = load_geometry()
+    homography_matrix = homographies[1]
+    _, frames = make_detections(args.frames, args.objects, homographies=homographies)  # The right camera's detections
+    num_points = sum(len(frame["objects"]) for frame in frames)
+
+    legacy_time = bench_legacy(frames, homography_matrix)
+    batched_time = bench_batched(frames, homography_matrix)
+
+    scale = FULL_MATCH_FRAMES / args.frames
+    print(f"Points projected: {num_points}")
+    print(f"Per-point:  {legacy_time:.3f}s ({legacy_time / num_points * 1e6:.2f} us/point)")
+    print(f"Batched:    {batched_time:.3f}s ({batched_time / num_points * 1e6:.2f} us/point)")
+    print(f"Speedup:    {legacy_time / batched_time:.1f}x")
+    print(f"Estimated per-match projection time ({FULL_MATCH_FRAMES} frames): "
+          f"{legacy_time * scale:.1f}s per-point vs {batched_time * scale:.1f}s batched")
+
+
+if __name__ == "__main__":
+    main()
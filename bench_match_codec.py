@@ -0,0 +1,53 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import jsoncompress
+from instrumentation import configure_progress
+from match_codec import iter_match_frames, write_match
+from synthetic_match import make_stage_output
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<24} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the compressed JSON upload with the binary match format.")
+    parser.add_argument("--frames", type=int, default=20000, help="Number of synthetic frames")
+    parser.add_argument("--objects", type=int, default=20, help="Players on the pitch")
+    args = parser.parse_args()
+
+    configure_progress(enabled=False)
+    # ioudelete's output for a synthetic match, from the real stages
+    data = jsoncompress.compress_frames(make_stage_output("final", args.frames, args.objects))
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "95_iou_compressed.json")
+        binary_path = os.path.join(tmp, "95_iou_compressed.bin")
+
+        def write_json():
+            with open(json_path, "w") as f:
+                json.dump(data, f, indent=4)
+
+        def read_json():
+            with open(json_path, "r") as f:
+                return json.load(f)
+
+        timed("write JSON (indent=4)", write_json)
+        timed("write binary", lambda: write_match(data, binary_path))
+        timed("read JSON", read_json)
+        timed("stream binary", lambda: sum(1 for _ in iter_match_frames(binary_path)))
+
+        json_size = os.path.getsize(json_path)
+        binary_size = os.path.getsize(binary_path)
+        print(f"JSON size:   {json_size / 1e6:8.2f} MB")
+        print(f"Binary size: {binary_size / 1e6:8.2f} MB ({json_size / binary_size:.0f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+import ENTRY_YOLO_merge
+import adjust2Dmerged
+import bos
+import filterjson2
+import filterjson3
+import ioudelete
+import unifyforbytetrack
+from detection_store import read_frames, write_frames
+from instrumentation import configure_progress
+from synthetic_match import load_geometry, write_match
+
+RESULTS_FILE = "bench_results.jsonl"  # One JSON record per benchmark run
+REGRESSION_RATIO = 1.25  # Slower than the previous comparable run by more than this is flagged
+
+FINAL_JSON = "95_final.json"  # ioudelete output name in the stage scripts
+FUSED_VIDEO = "bench_fused.mp4"
+
+
+def best_of(repeat, setup, func):
+    """Minimum seconds of func(*setup()) over repeat runs (setup is not timed); also returns the last result."""
+    best, result = math.inf, None
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):  # The stage functions print summaries
+        for _ in range(repeat):
+            args = setup()
+            start = time.perf_counter()
+            result = func(*args)
+            best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_json_stages(repeat, homography_left, homography_right):
+    """
+    Time the stage functions on the synthetic match in the working directory, in pipeline
+    order; each stage reads the files the previous one wrote, like the stage scripts.
+    Returns {function name: seconds}.
+    """
+    blue_line_right, _, blue_line_left, _, _, _ = ENTRY_YOLO_merge.load_dimensions_and_homographies()
+    timings = {}
+
+    timings["split_intersections"], split = best_of(
+        repeat, lambda: (read_frames(ENTRY_YOLO_merge.TRACKING_DATA_RIGHT), read_frames(ENTRY_YOLO_merge.TRACKING_DATA_LEFT)),
+        lambda right, left: ENTRY_YOLO_merge.split_intersections(
+            right, left, blue_line_right, blue_line_left, homography_left, homography_right
+        ),
+    )
+    for frames, path in zip(split, (ENTRY_YOLO_merge.OUTPUT_RIGHT_JSON, ENTRY_YOLO_merge.OUTPUT_RIGHT_NON_INTERSECTIONS_JSON,
+                                    ENTRY_YOLO_merge.OUTPUT_LEFT_JSON, ENTRY_YOLO_merge.OUTPUT_LEFT_NON_INTERSECTIONS_JSON)):
+        write_frames(frames, path)
+
+    timings["compare_and_filter_objects"], (filtered_left, filtered_right) = best_of(
+        repeat, lambda: (read_frames(filterjson2.INPUT_LEFT_JSON), read_frames(filterjson2.INPUT_RIGHT_JSON)),
+        lambda left, right: filterjson2.compare_and_filter_objects(
+            left, right, homography_left, homography_right, filterjson2.OFFSET, filterjson2.N, filterjson2.ASSIGNMENT
+        ),
+    )
+    write_frames(filtered_left, filterjson2.OUTPUT_LEFT_JSON)
+    write_frames(filtered_right, filterjson2.OUTPUT_RIGHT_JSON)
+
+    timings["create_new_jsons"], _ = best_of(
+        repeat, tuple,
+        lambda: adjust2Dmerged.create_new_jsons(blue_line_left, blue_line_right, homography_left, homography_right),
+    )
+    timings["merge_jsons"], _ = best_of(
+        repeat, tuple,
+        lambda: unifyforbytetrack.save_json(
+            unifyforbytetrack.merge_jsons(unifyforbytetrack.JSON_FILES, homography_left, homography_right),
+            unifyforbytetrack.OUTPUT_JSON,
+        ),
+    )
+    timings["filter_json_by_border"], _ = best_of(
+        repeat, tuple,
+        lambda: filterjson3.filter_json_by_border(filterjson3.INPUT_JSON_FILE, filterjson3.OUTPUT_JSON_FILE,
+                                                  filterjson3.VIDEO_WIDTH, filterjson3.VIDEO_HEIGHT,
+                                                  filterjson3.BORDER_THRESHOLD),
+    )
+    timings["remove_low_conf_objects"], _ = best_of(
+        repeat, tuple, lambda: ioudelete.remove_low_conf_objects(filterjson3.OUTPUT_JSON_FILE, FINAL_JSON),
+    )
+    return timings
+
+
+def bench_video(repeat, homography_left, homography_right, workers):
+    """Seconds of bos's fused warp-and-stitch path on the videos in the working directory."""
+    blue_line_right, _, blue_line_left, _, _, _ = ENTRY_YOLO_merge.load_dimensions_and_homographies()
+    seconds, _ = best_of(
+        repeat, tuple,
+        lambda: bos.process_fused_video(bos.VIDEO_LEFT, bos.VIDEO_RIGHT, homography_left, homography_right,
+                                        FUSED_VIDEO, 400, 300, blue_line_left, blue_line_right, workers),
+    )
+    return seconds
+
+
+def scaling_exponent(points):
+    """Slope of log(seconds) over log(frames) between the smallest and largest size (1.0 = linear)."""
+    (small_frames, small_seconds), (large_frames, large_seconds) = points[0], points[-1]
+    if large_frames == small_frames or min(small_seconds, large_seconds) <= 0:
+        return None
+    return math.log(large_seconds / small_seconds) / math.log(large_frames / small_frames)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_record(results_file, record):
+    """Latest earlier record from the same host with the same workload parameters, or None."""
+    if not os.path.exists(results_file):
+        return None
+    previous = None
+    with open(results_file, "r") as f:
+        for line in f:
+            candidate = json.loads(line)
+            if candidate["host"] == record["host"] and candidate["params"] == record["params"]:
+                previous = candidate
+    return previous
+
+
+def print_report(record, previous):
+    """Scaling table per function, with the change against the previous comparable run."""
+    baseline = {(result["function"], result["frames"]): result["seconds"]
+                for result in previous["results"]} if previous else {}
+    regressions = []
+    functions = list(dict.fromkeys(result["function"] for result in record["results"]))
+    print(f"{'function':<28}{'frames':>8}{'seconds':>10}{'us/frame':>10}{'vs prev':>9}")
+    for function in functions:
+        points = [(result["frames"], result["seconds"]) for result in record["results"] if result["function"] == function]
+        for frames, seconds in points:
+            change = ""
+            if (function, frames) in baseline:
+                ratio = seconds / baseline[function, frames]
+                change = f"{ratio:.2f}x"
+                if ratio > REGRESSION_RATIO:
+                    regressions.append((function, frames, ratio))
+                    change += " !"
+            print(f"{function:<28}{frames:>8}{seconds:>10.4f}{seconds / frames * 1e6:>10.1f}{change:>9}")
+        exponent = scaling_exponent(points)
+        if exponent is not None:
+            print(f"{'':<28}{'scaling exponent':>28} {exponent:.2f}")
+    if previous:
+        print(f"Compared with {previous['commit'] or 'unknown commit'} from {previous['timestamp']}")
+    for function, frames, ratio in regressions:
+        print(f"Regression: {function} at {frames} frames is {ratio:.2f}x slower")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the post-YOLO stages and the bos video path on synthetic "
+                                                 "matches of several sizes and record the results.")
+    parser.add_argument("--frames", default="250,1000,4000", help="Comma-separated match lengths in frames")
+    parser.add_argument("--video-frames", default="25,100", help="Comma-separated video lengths for bos (empty skips it)")
+    parser.add_argument("--objects", type=int, default=20, help="Players on the pitch")
+    parser.add_argument("--overlap", type=float, default=0.2, help="Share of players in the band both cameras see")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the fastest is kept")
+    parser.add_argument("--workers", type=int, default=bos.WORKERS, help="bos warp processes")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSON-lines file the results are appended to")
+    parser.add_argument("--no-record", action="store_true", help="Compare with the results file but do not append")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if a regression is flagged")
+    args = parser.parse_args()
+
+    configure_progress(enabled=False)
+    frame_sizes = [int(size) for size in args.frames.split(",") if size]
+    video_sizes = [int(size) for size in args.video_frames.split(",") if size]
+    homography_left, homography_right = load_geometry()
+    results = []
+    working_dir = os.getcwd()
+    results_file = os.path.abspath(args.results)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            for frames in frame_sizes:
+                directory = write_match(os.path.join(tmp, f"match_{frames}"), frames, args.objects, args.overlap)
+                os.chdir(directory)
+                for function, seconds in bench_json_stages(args.repeat, homography_left, homography_right).items():
+                    results.append({"function": function, "frames": frames, "seconds": seconds})
+                os.chdir(working_dir)
+            for frames in video_sizes:
+                directory = write_match(os.path.join(tmp, f"video_{frames}"), 0, args.objects, args.overlap,
+                                        video_frames=frames)
+                os.chdir(directory)
+                seconds = bench_video(args.repeat, homography_left, homography_right, args.workers)
+                results.append({"function": "bos.process_fused_video", "frames": frames, "seconds": seconds})
+                os.chdir(working_dir)
+        finally:
+            os.chdir(working_dir)
+
+    record = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "params": {"objects": args.objects, "overlap": args.overlap, "repeat": args.repeat, "workers": args.workers},
+        "results": results,
+    }
+    regressions = print_report(record, previous_record(results_file, record))
+    if not args.no_record:
+        with open(results_file, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"Results appended to {results_file}")
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
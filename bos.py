@@ -1,8 +1,13 @@
+import argparse
 import cv2
 import numpy as np
 import os
-import threading
-from tqdm import tqdm  # Import tqdm for progress bar
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from instrumentation import progress
+
+from frame_source import FrameSource, iter_frame_sets
 
 # File paths
 VIDEO_LEFT = "left5shifted.mp4"
@@ -14,6 +19,11 @@ OUTPUT_LEFT_VIDEO = "transformed_left_output2.mp4"
 OUTPUT_RIGHT_VIDEO = "transformed_right_output2.mp4"
 OUTPUT_MERGED_VIDEO = "transformed_merged_output.mp4"
 
+WORKERS = os.cpu_count() or 1  # Processes warping frames; 1 warps in the calling process
+CHUNK_FRAMES = 120  # Consecutive frames a worker decodes and warps per task
+WORKER_PREFETCH = 8  # Frames each worker decodes ahead of its warping, per camera
+FUSED_STITCH = False  # Default of main(fused): True only writes the merged video, warped and stitched in one pass
+
 def adjust_blue_lines(blue_line_left, blue_line_right, frame_width):
     """
     Adjust the blue line positions by moving them dynamically.
@@ -24,65 +34,192 @@ def adjust_blue_lines(blue_line_left, blue_line_right, frame_width):
     new_blue_line_right = int(blue_line_right - 0.01 * frame_width)
     return new_blue_line_left, new_blue_line_right
 
-def process_video(video_file, homography_matrix, output_file, frame_width, frame_height):
+def build_remap_maps(homography_matrix, frame_width, frame_height):
     """
-    Process a single video and save the transformed output.
+    Source pixel of every output pixel for a fixed homography, computed once per calibration
+    in the fixed-point form cv2.warpPerspective derives internally on every frame:
+    integer source coordinates plus a 5-bit sub-pixel interpolation index.
+    cv2.remap with these maps is bilinear-equivalent to cv2.warpPerspective (INTER_LINEAR) up to
+    rounding. With the pinned OpenCV 4.11 the pixels are identical; OpenCV 5 computes the warp's
+    coordinates differently, so there a few pixels per frame differ by some intensity levels.
     """
-    # Open the video file
-    cap = cv2.VideoCapture(video_file)
-    if not cap.isOpened():
-        print(f"Error: Cannot open video file '{video_file}'.")
-        return
+    _, inverse = cv2.invert(np.asarray(homography_matrix, dtype=np.float64), flags=cv2.DECOMP_LU)
+    xs = np.arange(frame_width, dtype=np.float64)[None, :]
+    ys = np.arange(frame_height, dtype=np.float64)[:, None]
+
+    # Same operation order as OpenCV's per-row warp loop
+    w = (inverse[2, 1] * ys + inverse[2, 2]) + inverse[2, 0] * xs
+    w = np.divide(cv2.INTER_TAB_SIZE, w, out=np.zeros_like(w), where=w != 0)
+    limit = np.iinfo(np.int32)
+    fixed_x = np.rint(np.clip(((inverse[0, 1] * ys + inverse[0, 2]) + inverse[0, 0] * xs) * w, limit.min, limit.max))
+    fixed_y = np.rint(np.clip(((inverse[1, 1] * ys + inverse[1, 2]) + inverse[1, 0] * xs) * w, limit.min, limit.max))
+    fixed_x = fixed_x.astype(np.int32)
+    fixed_y = fixed_y.astype(np.int32)
+
+    short = np.iinfo(np.int16)
+    map_xy = np.dstack((
+        np.clip(fixed_x >> cv2.INTER_BITS, short.min, short.max),
+        np.clip(fixed_y >> cv2.INTER_BITS, short.min, short.max),
+    )).astype(np.int16)
+    map_fraction = ((fixed_y & (cv2.INTER_TAB_SIZE - 1)) * cv2.INTER_TAB_SIZE
+                    + (fixed_x & (cv2.INTER_TAB_SIZE - 1))).astype(np.uint16)
+    return map_xy, map_fraction
+
+def warp_frame(frame, remap_maps):
+    """Warp one frame with maps from build_remap_maps (bilinear, black outside the source)."""
+    map_xy, map_fraction = remap_maps
+    return cv2.remap(frame, map_xy, map_fraction, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+def crop_remap_maps(remap_maps, columns):
+    """Keep only the output columns selected by the slice columns, so nothing else is ever warped."""
+    return tuple(np.ascontiguousarray(remap_map[:, columns]) for remap_map in remap_maps)
+
+def warp_and_stitch(frames, remap_maps):
+    """Warp frames[k] with remap_maps[k] and place the results side by side."""
+    warped = [warp_frame(frame, maps) for frame, maps in zip(frames, remap_maps)]
+    return warped[0] if len(warped) == 1 else np.hstack(warped)
+
+def open_sources(video_files, **kwargs):
+    """Open a FrameSource per video, or print an error and return None if one cannot be opened."""
+    sources = []
+    for video_file in video_files:
+        try:
+            sources.append(FrameSource(video_file, **kwargs))
+        except IOError:
+            print(f"Error: Cannot open video file '{video_file}'.")
+            for source in sources:
+                source.close()
+            return None
+    return sources
+
+# Per-process state of the warp workers, set up once by _init_warp_worker
+_worker = {}
+
+def _init_warp_worker(video_files, remap_maps):
+    _worker["video_files"] = video_files
+    _worker["remap_maps"] = remap_maps
+
+def _warp_chunk(start, count):
+    """Decode and warp frames start .. start + count - 1; fewer are returned if a video ends."""
+    sources = [FrameSource(video_file, start=start, stop=start + count, prefetch=WORKER_PREFETCH)
+               for video_file in _worker["video_files"]]
+    try:
+        return [warp_and_stitch(frame_set, _worker["remap_maps"]) for _, frame_set in iter_frame_sets(sources)]
+    finally:
+        for source in sources:
+            source.close()
+
+def render_warped_video(video_files, remap_maps, output_file, output_size, workers=WORKERS, desc=None):
+    """
+    Decode the videos together, warp (and stitch) each set of frames and encode the result.
+    - workers: with more than one, chunks of CHUNK_FRAMES frames are decoded and warped in a
+      process pool while this process writes the finished chunks in frame order.
+    Returns False if a video cannot be opened.
+    """
+    sources = open_sources(video_files)
+    if sources is None:
+        return False
 
     # Get video properties
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = int(sources[0].fps)
+    total_frames = min(source.frame_count for source in sources)
 
     # Define the codec and create VideoWriter object
     fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    out = cv2.VideoWriter(output_file, fourcc, fps, (frame_width, frame_height))
+    out = cv2.VideoWriter(output_file, fourcc, fps, output_size)
+    desc = desc or f"Processing {output_file}"
 
-    # Process each frame with a progress bar
-    for frame_index in tqdm(range(total_frames), desc=f"Processing {output_file}"):
-        ret, frame = cap.read()
-        if not ret:
-            break
+    if workers <= 1:
+        # Process each frame with a progress bar; the sources decode ahead on their own threads
+        frame_sets = iter_frame_sets(sources)
+        for _, frame_set in progress(frame_sets, total=total_frames, desc=desc):
+            # Transform the frames and write them to the output video
+            out.write(warp_and_stitch(frame_set, remap_maps))
+        for source in sources:
+            source.close()
+    else:
+        # The workers open their own sources for each chunk
+        for source in sources:
+            source.close()
+        # spawn keeps OpenCV's decoder state from being forked into the workers
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_warp_worker,
+                                 initargs=(video_files, remap_maps)) as pool, \
+                progress(total=total_frames, desc=desc) as bar:
+            pending = deque()  # (future, frame count) in frame order
+            next_start = 0
+            while pending or next_start < total_frames:
+                # Keep every worker busy without holding more than two chunks per worker in memory
+                while next_start < total_frames and len(pending) < 2 * workers:
+                    count = min(CHUNK_FRAMES, total_frames - next_start)
+                    pending.append((pool.submit(_warp_chunk, next_start, count), count))
+                    next_start += count
 
-        # Transform the frame
-        transformed_frame = cv2.warpPerspective(frame, homography_matrix, (frame_width, frame_height))
+                future, count = pending.popleft()
+                frames = future.result()
+                for transformed_frame in frames:
+                    out.write(transformed_frame)
+                bar.update(len(frames))
 
-        # Write the transformed frame to the output video
-        out.write(transformed_frame)
+                if len(frames) < count:
+                    # A video ended before its reported frame count
+                    for future, _ in pending:
+                        future.cancel()
+                    break
 
     # Release resources
-    cap.release()
     out.release()
-    print(f"\nProcessing complete. Output saved as {output_file}")
+    return True
+
+def process_video(video_file, homography_matrix, output_file, frame_width, frame_height, workers=WORKERS):
+    """
+    Process a single video and save the transformed output.
+    """
+    remap_maps = [build_remap_maps(homography_matrix, frame_width, frame_height)]
+    if render_warped_video([video_file], remap_maps, output_file, (frame_width, frame_height), workers):
+        print(f"\nProcessing complete. Output saved as {output_file}")
+
+def process_fused_video(video_left, video_right, homography_matrix_left, homography_matrix_right, output_file,
+                        frame_width, frame_height, blue_line_left, blue_line_right, workers=WORKERS):
+    """
+    Warp both videos and stitch them at the adjusted blue lines in one pass, without writing
+    and re-reading the per-camera videos. Only the columns that survive the crop are warped.
+    Frames match merge_videos_with_adjusted_blue_lines on the separate outputs, minus their
+    extra encode/decode round trip.
+    """
+    # Adjust blue lines dynamically
+    adjusted_blue_line_left, adjusted_blue_line_right = adjust_blue_lines(blue_line_left, blue_line_right, frame_width)
+    remap_maps = [
+        crop_remap_maps(build_remap_maps(homography_matrix_left, frame_width, frame_height),
+                        slice(None, adjusted_blue_line_left)),
+        crop_remap_maps(build_remap_maps(homography_matrix_right, frame_width, frame_height),
+                        slice(adjusted_blue_line_right, None)),
+    ]
+    output_width = sum(maps[0].shape[1] for maps in remap_maps)
+    if render_warped_video([video_left, video_right], remap_maps, output_file, (output_width, frame_height),
+                           workers, desc="Warping and merging videos"):
+        print(f"Merged video through adjusted blue lines saved as {output_file}")
 
 def merge_videos_with_adjusted_blue_lines(output_file, left_video, right_video, frame_width, frame_height, blue_line_left, blue_line_right):
     """
     Merge left and right videos through dynamically adjusted blue lines.
     """
-    cap_left = cv2.VideoCapture(left_video)
-    cap_right = cv2.VideoCapture(right_video)
+    sources = open_sources([left_video, right_video])
+    if sources is None:
+        return
 
     # Adjust blue lines dynamically
     adjusted_blue_line_left, adjusted_blue_line_right = adjust_blue_lines(blue_line_left, blue_line_right, frame_width)
 
     # Get properties
-    fps = int(cap_left.get(cv2.CAP_PROP_FPS))
-    total_frames = int(min(cap_left.get(cv2.CAP_PROP_FRAME_COUNT), cap_right.get(cv2.CAP_PROP_FRAME_COUNT)))
+    fps = int(sources[0].fps)
+    total_frames = min(source.frame_count for source in sources)
 
     fourcc = cv2.VideoWriter_fourcc(*"mp4v")
     output_width = adjusted_blue_line_left + (frame_width - adjusted_blue_line_right)
     out = cv2.VideoWriter(output_file, fourcc, fps, (output_width, frame_height))
 
-    for _ in tqdm(range(total_frames), desc="Merging videos"):
-        ret_left, frame_left = cap_left.read()
-        ret_right, frame_right = cap_right.read()
-        if not ret_left or not ret_right:
-            break
-
+    for _, (frame_left, frame_right) in progress(iter_frame_sets(sources), total=total_frames, desc="Merging videos"):
         # Crop frames based on adjusted blue line
         left_cropped = frame_left[:, :adjusted_blue_line_left]
         right_cropped = frame_right[:, adjusted_blue_line_right:]
@@ -91,12 +228,17 @@ def merge_videos_with_adjusted_blue_lines(output_file, left_video, right_video,
         combined_frame = np.hstack((left_cropped, right_cropped))
         out.write(combined_frame)
 
-    cap_left.release()
-    cap_right.release()
+    for source in sources:
+        source.close()
     out.release()
     print(f"Merged video through adjusted blue lines saved as {output_file}")
 
-def main():
+def main(fused=FUSED_STITCH):
+    """
+    Render the bird's-eye videos of both cameras and the merged video.
+    - fused: warp and stitch both cameras in one pass (process_fused_video); only
+      OUTPUT_MERGED_VIDEO is written then, not OUTPUT_LEFT_VIDEO and OUTPUT_RIGHT_VIDEO.
+    """
     # Check if files exist
     required_files = [
         VIDEO_LEFT, VIDEO_RIGHT, HOMOGRAPHY_MATRIX_LEFT, HOMOGRAPHY_MATRIX_RIGHT, DIMENSIONS_FILE
@@ -119,28 +261,24 @@ def main():
     frame_width = 400  # Adjust as needed
     frame_height = 300  # Adjust as needed
 
-    # Create threads for video processing
-    left_thread = threading.Thread(target=process_video, args=(VIDEO_LEFT, homography_matrix_left, OUTPUT_LEFT_VIDEO, frame_width, frame_height))
-    right_thread = threading.Thread(target=process_video, args=(VIDEO_RIGHT, homography_matrix_right, OUTPUT_RIGHT_VIDEO, frame_width, frame_height))
-
-    # Start both threads
-    left_thread.start()
-    right_thread.start()
+    if fused:
+        process_fused_video(VIDEO_LEFT, VIDEO_RIGHT, homography_matrix_left, homography_matrix_right, OUTPUT_MERGED_VIDEO,
+                            frame_width, frame_height, blue_line_left, blue_line_right)
+        return
 
-    # Wait for both threads to complete
-    left_thread.join()
-    right_thread.join()
+    # Each video is spread over all cores, so they are processed one after the other
+    process_video(VIDEO_LEFT, homography_matrix_left, OUTPUT_LEFT_VIDEO, frame_width, frame_height)
+    process_video(VIDEO_RIGHT, homography_matrix_right, OUTPUT_RIGHT_VIDEO, frame_width, frame_height)
 
     # Merge the processed videos
     merge_videos_with_adjusted_blue_lines(OUTPUT_MERGED_VIDEO, OUTPUT_LEFT_VIDEO, OUTPUT_RIGHT_VIDEO, frame_width, frame_height, blue_line_left, blue_line_right)
 
-    import unifyforbytetrack
-    print("fourth script completed. Now running the fifth script...")
-    unifyforbytetrack.main()  # Call the second script after finishing the first
-
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Render the bird's-eye camera videos and the merged video.")
+    parser.add_argument("--fused", action="store_true",
+                        help=f"Only write {OUTPUT_MERGED_VIDEO}, warping and stitching both cameras in one pass")
+    main(fused=parser.parse_args().fused)
     
 
     
\ No newline at end of file
@@ -0,0 +1,255 @@
+import json
+import os
+import numpy as np
+
+# Integer codes for the string fields (-1 means the object has no such field)
+COLOR_CODES = {"orange": 0, "red": 1, "purple": 2, "blue": 3, "yellow": 4, "pink": 5}
+SOURCE_CODES = {"left": 0, "right": 1}  # Same coding jsoncompress uses for "src"
+COLOR_NAMES = {code: name for name, code in COLOR_CODES.items()}
+SOURCE_NAMES = {code: name for name, code in SOURCE_CODES.items()}
+
+COLUMNS = ("frame_index", "offsets", "class_id", "confidence", "bbox", "center", "color", "source", "transformed_center")
+
+
+class DetectionStore:
+    """
+    Columnar form of the per-frame detection lists passed between stages.
+    The array-heavy stages (ENTRY_YOLO_merge's split, filterjson3, ioudelete) run directly on a
+    store when their input file is .npz (see read_store); the others, and the in-memory
+    pipeline, use the list-of-dicts form read_frames gives.
+
+    Frame k owns the objects offsets[k]:offsets[k + 1] of every per-object column:
+    - class_id (int16), confidence (float64), bbox (N, 4), center (N, 2)
+    - color / source as int8 codes, transformed_center (N, 2, NaN when absent)
+    Frames without objects are kept, so to_frames() gives back the input list.
+    """
+
+    def __init__(self, frame_index, offsets, class_id, confidence, bbox, center, color, source, transformed_center):
+        self.frame_index = np.asarray(frame_index, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.class_id = np.asarray(class_id, dtype=np.int16)
+        self.confidence = np.asarray(confidence, dtype=np.float64)
+        self.bbox = np.asarray(bbox, dtype=np.float64).reshape(-1, 4)
+        self.center = np.asarray(center, dtype=np.float64).reshape(-1, 2)
+        self.color = np.asarray(color, dtype=np.int8)
+        self.source = np.asarray(source, dtype=np.int8)
+        self.transformed_center = np.asarray(transformed_center, dtype=np.float64).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.frame_index)
+
+    @property
+    def num_objects(self):
+        return int(self.offsets[-1])
+
+    @classmethod
+    def from_frames(cls, frames):
+        """Build a store from the list-of-dicts form used in the JSON files."""
+        objects = [obj for frame in frames for obj in frame.get("objects", [])]
+        counts = [len(frame.get("objects", [])) for frame in frames]
+        nan_point = [np.nan, np.nan]
+        return cls(
+            frame_index=[frame["frame_index"] for frame in frames],
+            offsets=np.concatenate(([0], np.cumsum(counts, dtype=np.int64))),
+            class_id=[obj.get("class_id", -1) for obj in objects],
+            confidence=[obj.get("confidence", np.nan) for obj in objects],
+            bbox=[obj["bbox"] for obj in objects],
+            center=[obj.get("center", nan_point) for obj in objects],
+            color=[COLOR_CODES.get(obj.get("color"), -1) for obj in objects],
+            source=[SOURCE_CODES.get(obj.get("source"), -1) for obj in objects],
+            transformed_center=[obj.get("transformed_center", nan_point) for obj in objects],
+        )
+
+    def to_frames(self):
+        """Convert back to the list-of-dicts form, omitting fields an object never had."""
+        class_id = self.class_id.tolist()
+        confidence = self.confidence.tolist()
+        bbox = self.bbox.tolist()
+        center = self.center.tolist()
+        color = self.color.tolist()
+        source = self.source.tolist()
+        transformed_center = self.transformed_center.tolist()
+        has_center = ~np.isnan(self.center[:, 0])
+        has_transformed_center = ~np.isnan(self.transformed_center[:, 0])
+
+        frames = []
+        offsets = self.offsets.tolist()
+        for k, frame_index in enumerate(self.frame_index.tolist()):
+            objects = []
+            for i in range(offsets[k], offsets[k + 1]):
+                obj = {}
+                if class_id[i] != -1:
+                    obj["class_id"] = class_id[i]
+                if confidence[i] == confidence[i]:  # Skip NaN
+                    obj["confidence"] = confidence[i]
+                obj["bbox"] = bbox[i]
+                if has_center[i]:
+                    obj["center"] = center[i]
+                if color[i] != -1:
+                    obj["color"] = COLOR_NAMES[color[i]]
+                if source[i] != -1:
+                    obj["source"] = SOURCE_NAMES[source[i]]
+                if has_transformed_center[i]:
+                    obj["transformed_center"] = transformed_center[i]
+                objects.append(obj)
+            frames.append({"frame_index": frame_index, "objects": objects})
+        return frames
+
+    def select(self, mask, keep_empty=True):
+        """
+        Keep only the objects where mask is True. Frames left without objects are kept,
+        unless keep_empty is False.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        # Number of kept objects before each offset gives the new offset table
+        kept_before = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+        offsets = kept_before[self.offsets]
+        frame_index = self.frame_index
+        if not keep_empty:
+            non_empty = np.diff(offsets) > 0
+            frame_index = frame_index[non_empty]
+            offsets = np.concatenate(([0], offsets[1:][non_empty]))
+        return DetectionStore(
+            frame_index, offsets,
+            self.class_id[mask], self.confidence[mask], self.bbox[mask], self.center[mask],
+            self.color[mask], self.source[mask], self.transformed_center[mask],
+        )
+
+    def with_columns(self, **columns):
+        """Copy of the store with the given per-object columns replaced (e.g. color=codes)."""
+        unknown = set(columns) - set(COLUMNS[2:])
+        if unknown:
+            raise ValueError(f"Unknown per-object columns: {', '.join(sorted(unknown))}")
+        return DetectionStore(**{name: columns.get(name, getattr(self, name)) for name in COLUMNS})
+
+    def save(self, path):
+        """Save all columns to an uncompressed .npz file."""
+        np.savez(path, **{name: getattr(self, name) for name in COLUMNS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in COLUMNS})
+
+
+def is_store_path(path):
+    return os.fspath(path).endswith(".npz")
+
+
+def is_jsonl_path(path):
+    return os.fspath(path).endswith(".jsonl")
+
+
+class DetectionWriter:
+    """
+    Append-only JSON Lines writer: one frame per line, flushed every flush_every frames.
+    Frames already written survive a crash, and memory does not grow with the match.
+    """
+
+    def __init__(self, path, flush_every=100):
+        self.path = path
+        self.flush_every = flush_every
+        self.frames_written = 0
+        self.objects_written = 0
+        self._file = open(path, "w")
+
+    def write(self, frame):
+        self._file.write(json.dumps(frame, separators=(",", ":")))
+        self._file.write("\n")
+        self.frames_written += 1
+        self.objects_written += len(frame.get("objects", ()))
+        if self.frames_written % self.flush_every == 0:
+            self._file.flush()
+
+    def flush(self):
+        """Make every frame written so far visible to readers of the file."""
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_frames(path):
+    """
+    Yield the frames of a detection file one at a time.
+    JSON Lines files are streamed; a truncated last line left by a crash is skipped.
+    """
+    if is_jsonl_path(path):
+        with open(path, "r") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        yield from read_frames(path)
+
+
+def read_store(path):
+    """Read a detection file as a DetectionStore; only an .npz file skips the list-of-dicts form."""
+    if is_store_path(path):
+        return DetectionStore.load(path)
+    return DetectionStore.from_frames(read_frames(path))
+
+
+def write_store(store, path, indent=2):
+    """Write a DetectionStore to path; other formats than .npz go through to_frames()."""
+    if is_store_path(path):
+        store.save(path)
+    else:
+        write_frames(store.to_frames(), path, indent=indent)
+
+
+def color_codes(colors):
+    """COLOR_CODES of a set of colour names; ValueError for a name the store has no code for."""
+    unknown = set(colors) - set(COLOR_CODES)
+    if unknown:
+        raise ValueError(f"Colours without a DetectionStore code: {', '.join(sorted(unknown))}")
+    return [COLOR_CODES[color] for color in colors]
+
+
+def read_frames(path):
+    """
+    Read a detection file (.json list-of-dicts, .jsonl or columnar .npz) as a list of frames;
+    an .npz file is converted to the same dicts.
+    """
+    if is_store_path(path):
+        return DetectionStore.load(path).to_frames()
+    if is_jsonl_path(path):
+        return list(iter_frames(path))
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_frames(frames, path, indent=2):
+    """
+    Write frames to path; .npz stores them in columnar form and .jsonl as JSON Lines.
+    frames may also be an iterator: JSON and JSON Lines output is then written frame by frame.
+    """
+    if is_store_path(path):
+        DetectionStore.from_frames(list(frames)).save(path)
+        return
+    if is_jsonl_path(path):
+        with DetectionWriter(path) as writer:
+            for frame in frames:
+                writer.write(frame)
+        return
+    with open(path, "w") as f:
+        if isinstance(frames, list):
+            json.dump(frames, f, indent=indent)
+            return
+        # Same text json.dump gives for the whole list, one frame at a time
+        prefix = " " * indent
+        separator = "[\n"
+        for frame in frames:
+            f.write(separator)
+            f.write(prefix + json.dumps(frame, indent=indent).replace("\n", "\n" + prefix))
+            separator = ",\n"
+        f.write("[]" if separator == "[\n" else "\n]")
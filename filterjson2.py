@@ -1,6 +1,6 @@
-import json
 import numpy as np
-import cv2
+from homography import load_homography_matrix, transform_frames
+from detection_store import read_frames, write_frames
 
 # File paths
 INPUT_LEFT_JSON = "left_intersections.json"
@@ -12,13 +12,8 @@ OUTPUT_RIGHT_JSON = "filtered_right_intersections.json"
 
 OFFSET = 340  # Offset in width for right video objects
 N = 10  # Distance threshold for transformed coordinates comparison
-
-
-def transform_point(point, homography_matrix):
-    """Transform a single point using a homography matrix."""
-    point = np.array([[point]], dtype=np.float32)
-    transformed_point = cv2.perspectiveTransform(point, homography_matrix)
-    return transformed_point[0][0]
+ASSIGNMENT = "greedy"  # "greedy": each right object takes its nearest left object; "optimal": one-to-one
+GRID_MIN_POINTS = 32  # Below this many left objects a dense distance matrix is faster than the grid
 
 
 def count_objects_by_color(objects, color):
@@ -26,64 +21,144 @@ def count_objects_by_color(objects, color):
     return sum(1 for obj in objects if obj.get("color") == color)
 
 
-from tqdm import tqdm  # Import tqdm
+def point_distances(points_a, points_b):
+    """Euclidean distances between every row of points_a and every row of points_b, as an (A, B) matrix."""
+    differences = points_a[:, None, :] - points_b[None, :, :]
+    return np.sqrt(np.sum(differences * differences, axis=-1))
+
+
+def nearest_within_dense(query_points, reference_points, threshold):
+    """Index of the nearest reference point closer than threshold for every query point (-1 if none)."""
+    nearest = np.full(len(query_points), -1, dtype=np.int64)
+    if len(query_points) == 0 or len(reference_points) == 0:
+        return nearest
+    distances = point_distances(query_points, reference_points)
+    closest = np.argmin(distances, axis=1)  # First index wins ties
+    within = distances[np.arange(len(query_points)), closest] < threshold
+    nearest[within] = closest[within]
+    return nearest
+
+
+def nearest_within_grid(query_points, reference_points, threshold):
+    """
+    Same result as nearest_within_dense, using a grid hash with threshold-sized cells:
+    any reference point closer than threshold lies in the query's cell or one of its 8 neighbours,
+    so each query only looks at a handful of candidates instead of every reference point.
+    """
+    nearest = np.full(len(query_points), -1, dtype=np.int64)
+    if len(query_points) == 0 or len(reference_points) == 0:
+        return nearest
+
+    cells = {}
+    for index, (cell_x, cell_y) in enumerate(np.floor(reference_points / threshold).astype(np.int64).tolist()):
+        cells.setdefault((cell_x, cell_y), []).append(index)
+
+    query_cells = np.floor(query_points / threshold).astype(np.int64).tolist()
+    for query_index, (cell_x, cell_y) in enumerate(query_cells):
+        candidates = [
+            index
+            for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+            for index in cells.get((cell_x + dx, cell_y + dy), ())
+        ]
+        if not candidates:
+            continue
+        candidates.sort()  # Keep the dense matcher's lowest-index tie-breaking
+        distances = point_distances(query_points[query_index:query_index + 1], reference_points[candidates])[0]
+        closest = int(np.argmin(distances))
+        if distances[closest] < threshold:
+            nearest[query_index] = candidates[closest]
+    return nearest
+
+
+def nearest_within(query_points, reference_points, threshold):
+    """
+    Pick the dense or grid matcher depending on how crowded the frame is.
+    No point is closer than a threshold <= 0, and the grid could not be sized by one.
+    """
+    if threshold <= 0:
+        return np.full(len(query_points), -1, dtype=np.int64)
+    if len(reference_points) < GRID_MIN_POINTS:
+        return nearest_within_dense(query_points, reference_points, threshold)
+    return nearest_within_grid(query_points, reference_points, threshold)
+
+
+def assign_one_to_one(query_points, reference_points, threshold):
+    """
+    Globally optimal one-to-one matching: the largest number of pairs closer than threshold,
+    with the smallest total distance among those. Returns the matched reference index per query (-1 if none).
+    """
+    nearest = np.full(len(query_points), -1, dtype=np.int64)
+    if len(query_points) == 0 or len(reference_points) == 0:
+        return nearest
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError as e:
+        raise ImportError("The 'optimal' assignment mode needs scipy (pip install scipy).") from e
+
+    distances = point_distances(query_points, reference_points).astype(np.float64)
+    feasible = distances < threshold
+    # Infeasible pairs cost more than any full set of feasible ones, so the solver maximises matches first
+    penalty = threshold * (min(distances.shape) + 1)
+    query_indices, reference_indices = linear_sum_assignment(np.where(feasible, distances, penalty))
+    keep = feasible[query_indices, reference_indices]
+    nearest[query_indices[keep]] = reference_indices[keep]
+    return nearest
+
+
+from instrumentation import progress
+
+def compare_and_filter_objects(left_json, right_json, homography_matrix_left, homography_matrix_right, offset, threshold,
+                               assignment="greedy"):
+    """
+    Match right intersection objects to left ones in the shared transformed space.
+    - assignment="greedy": each right object takes its nearest left object within threshold
+      (several right objects may share one left object).
+    - assignment="optimal": one-to-one matching with the most pairs and least total distance.
+    """
+    if assignment not in ("greedy", "optimal"):
+        raise ValueError(f"Unknown assignment mode '{assignment}'")
 
-def compare_and_filter_objects(left_json, right_json, homography_matrix_left, homography_matrix_right, offset, threshold):
     filtered_left = []
     filtered_right = []
 
     left_frames = {frame["frame_index"]: frame for frame in left_json}
     right_frames = {frame["frame_index"]: frame for frame in right_json}
 
+    # Project the bottom middle of every bbox on each side once for the whole match
+    empty_points = np.empty((0, 2), dtype=np.float32)
+    left_points = {frame["frame_index"]: points for frame, points in zip(left_json, transform_frames(left_json, homography_matrix_left))}
+    right_points = {frame["frame_index"]: points for frame, points in zip(right_json, transform_frames(right_json, homography_matrix_right))}
+
     all_frame_indices = set(left_frames.keys()).union(right_frames.keys())
 
     total_left_purple = sum(1 for frame in left_json for obj in frame["objects"] if obj.get("color") == "purple")
     total_right_orange = sum(1 for frame in right_json for obj in frame["objects"] if obj.get("color") == "orange")
-    matched_left_indices = set()
-
     total_right_objects = 0
     matched_right_objects = 0
 
-    for frame_index in tqdm(all_frame_indices, desc="Processing frames", total=len(all_frame_indices)):
+    for frame_index in progress(sorted(all_frame_indices), desc="Processing frames", total=len(all_frame_indices)):
         left_objects = left_frames.get(frame_index, {"objects": []})["objects"]
         right_objects = right_frames.get(frame_index, {"objects": []})["objects"]
 
         total_right_objects += len(right_objects)
         new_right_objects = []
 
-        for right_obj_index, right_obj in enumerate(right_objects):
-            # Calculate middle bottom of right bbox
-            right_bbox = right_obj["bbox"]
-            right_bottom = [(right_bbox[0] + right_bbox[2]) / 2, right_bbox[3]]
-
-            # Transform the middle bottom point of the right bbox
-            right_transformed = transform_point(right_bottom, homography_matrix_right)
-            right_transformed_with_offset = [right_transformed[0] + offset, right_transformed[1]]
+        left_transformed = left_points.get(frame_index, empty_points)
+        right_transformed = right_points.get(frame_index, empty_points).copy()
+        right_transformed[:, 0] += offset
 
-            closest_left_index = None
-            min_distance = threshold
+        # Closest left object for every right object in this frame
+        if assignment == "optimal":
+            closest_left = assign_one_to_one(right_transformed, left_transformed, threshold)
+        else:
+            closest_left = nearest_within(right_transformed, left_transformed, threshold)
+        matched_left_indices = set(closest_left[closest_left >= 0].tolist())
 
-            for left_obj_index, left_obj in enumerate(left_objects):
-                # Calculate middle bottom of left bbox
-                left_bbox = left_obj["bbox"]
-                left_bottom = [(left_bbox[0] + left_bbox[2]) / 2, left_bbox[3]]
-
-                # Transform the middle bottom point of the left bbox
-                left_transformed = transform_point(left_bottom, homography_matrix_left)
-
-                # Calculate distance between transformed points
-                distance = np.linalg.norm(
-                    np.array(right_transformed_with_offset) - np.array(left_transformed)
-                )
-
-                if distance < min_distance:
-                    closest_left_index = left_obj_index
-                    min_distance = distance
+        for right_obj_index, right_obj in enumerate(right_objects):
+            right_transformed_with_offset = right_transformed[right_obj_index]
+            closest_left_index = closest_left[right_obj_index] if closest_left[right_obj_index] >= 0 else None
 
             if closest_left_index is not None:
-                # Mark left object as matched by its index
-                matched_left_indices.add(closest_left_index)
-
                 # Add the right object with yellow color to the new right JSON
                 right_obj["color"] = "yellow"
                 new_right_objects.append(right_obj)
@@ -121,32 +196,23 @@ def compare_and_filter_objects(left_json, right_json, homography_matrix_left, ho
 
 def main():
     # Load JSON data
-    with open(INPUT_LEFT_JSON, "r") as f:
-        left_json = json.load(f)
-    with open(INPUT_RIGHT_JSON, "r") as f:
-        right_json = json.load(f)
+    left_json = read_frames(INPUT_LEFT_JSON)
+    right_json = read_frames(INPUT_RIGHT_JSON)
 
     # Load homography matrices
-    homography_matrix_left = np.loadtxt(HOMOGRAPHY_MATRIX_LEFT, delimiter=' ')
-    homography_matrix_right = np.loadtxt(HOMOGRAPHY_MATRIX_RIGHT, delimiter=' ')
+    homography_matrix_left = load_homography_matrix(HOMOGRAPHY_MATRIX_LEFT)
+    homography_matrix_right = load_homography_matrix(HOMOGRAPHY_MATRIX_RIGHT)
 
     # Compare and modify objects
     filtered_left, filtered_right = compare_and_filter_objects(
-        left_json, right_json, homography_matrix_left, homography_matrix_right, OFFSET, N
+        left_json, right_json, homography_matrix_left, homography_matrix_right, OFFSET, N, ASSIGNMENT
     )
 
     # Save modified JSONs
-    with open(OUTPUT_LEFT_JSON, "w") as f:
-        json.dump(filtered_left, f, indent=2)
-    with open(OUTPUT_RIGHT_JSON, "w") as f:
-        json.dump(filtered_right, f, indent=2)
-
-    import adjust2Dmerged
-
+    write_frames(filtered_left, OUTPUT_LEFT_JSON)
+    write_frames(filtered_right, OUTPUT_RIGHT_JSON)
 
     print("Modified JSONs have been saved.")
-    print("second script completed. Now running the third script...")
-    adjust2Dmerged.main()  # Call the second script after finishing the first
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
-import json
 import os
-from tqdm import tqdm
+from instrumentation import progress
+import numpy as np
+from detection_store import SOURCE_CODES, is_store_path, read_store, read_frames, write_frames, write_store
 
 # Input JSON file
 INPUT_JSON_FILE = "merged_output_with_transformed_center.json"
@@ -31,22 +32,14 @@ def is_near_border(center, width, height, threshold, source):
         )
     return False
 
-def filter_json_by_border(input_file, output_file, width, height, threshold):
+def filter_frames_by_border(data, width, height, threshold):
     """
-    Filter objects from the input JSON file if their transformed_center
-    coordinates are near the border, considering their source.
+    Drop objects whose transformed_center is near the border, considering their source.
+    Frames left without objects are dropped too.
     """
-    if not os.path.exists(input_file):
-        print(f"Error: File '{input_file}' not found.")
-        return
-
-    # Load JSON data
-    with open(input_file, "r") as f:
-        data = json.load(f)
-
     filtered_data = []
 
-    for frame in tqdm(data, desc="Processing frames", unit="frame"):
+    for frame in progress(data, desc="Processing frames", unit="frame"):
         frame_index = frame["frame_index"]
         objects = frame.get("objects", [])
 
@@ -60,9 +53,43 @@ def filter_json_by_border(input_file, output_file, width, height, threshold):
         if filtered_objects:
             filtered_data.append({"frame_index": frame_index, "objects": filtered_objects})
 
+    return filtered_data
+
+def filter_store_by_border(store, width, height, threshold):
+    """
+    filter_frames_by_border on a DetectionStore, with one mask for the whole match.
+    Objects without transformed_center count as at (0, 0), as in the frame version.
+    """
+    x, y = np.nan_to_num(store.transformed_center, nan=0.0).T
+    near_top_or_bottom = (y <= threshold) | (y >= height - threshold)
+    near_border = np.where(
+        store.source == SOURCE_CODES["left"], (x <= threshold) | near_top_or_bottom,
+        np.where(store.source == SOURCE_CODES["right"], (x >= width - threshold) | near_top_or_bottom, False)
+    )
+    return store.select(~near_border, keep_empty=False)
+
+def filter_json_by_border(input_file, output_file, width, height, threshold):
+    """
+    Filter objects from the input JSON file if their transformed_center
+    coordinates are near the border, considering their source.
+    An .npz input is filtered in columnar form.
+    """
+    if not os.path.exists(input_file):
+        print(f"Error: File '{input_file}' not found.")
+        return
+
+    if is_store_path(input_file):
+        write_store(filter_store_by_border(read_store(input_file), width, height, threshold), output_file)
+        print(f"Filtered JSON saved to '{output_file}'.")
+        return
+
+    # Load JSON data
+    data = read_frames(input_file)
+
+    filtered_data = filter_frames_by_border(data, width, height, threshold)
+
     # Save the filtered JSON data
-    with open(output_file, "w") as f:
-        json.dump(filtered_data, f, indent=2)
+    write_frames(filtered_data, output_file)
 
     print(f"Filtered JSON saved to '{output_file}'.")
 
@@ -70,11 +97,7 @@ def filter_json_by_border(input_file, output_file, width, height, threshold):
 
 def main():
     filter_json_by_border(INPUT_JSON_FILE, OUTPUT_JSON_FILE, VIDEO_WIDTH, VIDEO_HEIGHT, BORDER_THRESHOLD)
-    import ioudelete
-    print("sixth script completed. Now running the seventh script...")
-    ioudelete.main()  # Call the second script after finishing the first
     
 if __name__ == "__main__":
     filter_json_by_border(INPUT_JSON_FILE, OUTPUT_JSON_FILE, VIDEO_WIDTH, VIDEO_HEIGHT, BORDER_THRESHOLD)
     
-
@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+import cv2
+
+_END = object()  # Queued by the decoder thread after the last frame
+
+
+class FrameSource:
+    """
+    Iterate over (frame_index, frame) pairs of a video while a background thread decodes ahead.
+
+    - start / stop: frame range [start, stop); stop=None reads to the end of the video.
+    - stride: keep every stride-th frame of the range; skipped frames are only grabbed, not decoded.
+    - prefetch: frames decoded ahead of the consumer; bounds the memory held by the queue.
+    Decoding (released GIL inside OpenCV) then overlaps with whatever the consumer does per frame.
+    The decoder thread only starts on the first iteration, so the video properties can be read
+    without decoding anything. stats() reports queue depth and how often either side waited.
+    """
+
+    def __init__(self, video_path, start=0, stop=None, stride=1, prefetch=32):
+        if stride < 1:
+            raise ValueError("stride must be at least 1")
+        self.video_path = video_path
+        self.start = start
+        self.stop = stop
+        self.stride = stride
+
+        self._cap = cv2.VideoCapture(video_path)
+        if not self._cap.isOpened():
+            raise IOError(f"Cannot open video file '{video_path}'.")
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        self._queue = queue.Queue(maxsize=max(1, prefetch))
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._error = None
+
+        self._frames = 0
+        self._depth_total = 0
+        self._depth_max = 0
+        self._consumer_stalls = 0
+        self._consumer_stall_seconds = 0.0
+        self._producer_stalls = 0
+        self._producer_stall_seconds = 0.0
+        self._decode_seconds = 0.0
+        self._seek_fallbacks = 0
+
+    def __len__(self):
+        """Number of frames the source yields if the reported frame count is right."""
+        stop = self.frame_count if self.stop is None else min(self.stop, self.frame_count)
+        return max(0, -(-(stop - self.start) // self.stride))
+
+    def _put(self, item):
+        """Queue item, waiting while the queue is full; returns False once the source is closed."""
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        self._producer_stalls += 1
+        waited_from = time.perf_counter()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self._producer_stall_seconds += time.perf_counter() - waited_from
+
+    def _seek(self, cap):
+        """
+        Position cap on frame start and return the capture to decode from. A CAP_PROP_POS_FRAMES
+        seek can land next to the requested frame in inter-coded video (mp4v, H.264); if the
+        position it reports afterwards is not start, the video is reopened and decoded forward
+        with grab() from frame 0 instead, so frame_index always matches the decoded frame.
+        """
+        cap.set(cv2.CAP_PROP_POS_FRAMES, self.start)
+        if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == self.start:
+            return cap
+        cap.release()
+        cap = cv2.VideoCapture(self.video_path)
+        for _ in range(self.start):
+            if not cap.grab():
+                break
+        self._seek_fallbacks += 1
+        return cap
+
+    def _decode(self):
+        cap = self._cap
+        try:
+            if self.start:
+                cap = self._seek(cap)
+            frame_index = self.start
+            while not self._stop_event.is_set() and (self.stop is None or frame_index < self.stop):
+                decode_from = time.perf_counter()
+                if (frame_index - self.start) % self.stride:
+                    ret, frame = cap.grab(), None
+                else:
+                    ret, frame = cap.read()
+                self._decode_seconds += time.perf_counter() - decode_from
+                if not ret:
+                    break
+                if frame is not None and not self._put((frame_index, frame)):
+                    return
+                frame_index += 1
+        except Exception as error:  # Re-raised in the consumer
+            self._error = error
+        finally:
+            cap.release()
+        self._put(_END)
+
+    def __iter__(self):
+        if self._thread is not None:
+            raise RuntimeError("A FrameSource can only be iterated once.")
+        self._thread = threading.Thread(target=self._decode, name=f"FrameSource({self.video_path})", daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                depth = self._queue.qsize()
+                self._depth_total += depth
+                self._depth_max = max(self._depth_max, depth)
+                if depth == 0:
+                    self._consumer_stalls += 1
+                    waited_from = time.perf_counter()
+                    item = self._queue.get()
+                    self._consumer_stall_seconds += time.perf_counter() - waited_from
+                else:
+                    item = self._queue.get()
+                if item is _END:
+                    break
+                self._frames += 1
+                yield item
+            if self._error is not None:
+                raise self._error
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the decoder thread and release the video."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self._cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def stats(self):
+        """Queue-depth and stall statistics of the frames consumed so far."""
+        return {
+            "frames": self._frames,
+            "queue_depth_mean": self._depth_total / self._frames if self._frames else 0.0,
+            "queue_depth_max": self._depth_max,
+            "consumer_stalls": self._consumer_stalls,
+            "consumer_stall_seconds": self._consumer_stall_seconds,
+            "producer_stalls": self._producer_stalls,
+            "producer_stall_seconds": self._producer_stall_seconds,
+            "decode_seconds": self._decode_seconds,
+            "seek_fallbacks": self._seek_fallbacks,
+        }
+
+
+def iter_frame_sets(sources):
+    """Yield (frame_index of the first source, frames) with the next frame of every source, until any of them ends."""
+    for items in zip(*sources):
+        yield items[0][0], [frame for _, frame in items]
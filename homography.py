@@ -0,0 +1,59 @@
+import numpy as np
+import cv2
+
+
+def load_homography_matrix(path):
+    """Load a 3x3 homography matrix saved by calibrateONCE.py."""
+    return np.loadtxt(path, delimiter=' ')
+
+
+def transform_points(points, homography_matrix):
+    """
+    Transform many points with a single cv2.perspectiveTransform call.
+    - points: anything convertible to an (N, 2) array.
+    Returns an (N, 2) float32 array (same precision as the old per-point helper).
+    """
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+    if len(points) == 0:
+        return np.empty((0, 2), dtype=np.float32)
+    return cv2.perspectiveTransform(points, homography_matrix).reshape(-1, 2)
+
+
+def inverse_transform_points(points, homography_matrix):
+    """Transform many points with the inverse of a homography matrix."""
+    return transform_points(points, np.linalg.inv(homography_matrix))
+
+
+def transform_point(point, homography_matrix):
+    """Transform a single point using a homography matrix."""
+    return transform_points([point], homography_matrix)[0]
+
+
+def bottom_middles(bboxes):
+    """
+    Middle of the bottom edge of each [x1, y1, x2, y2] box, as an (N, 2) array.
+    This is the point every stage projects to decide where a player stands.
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    return np.column_stack(((bboxes[:, 0] + bboxes[:, 2]) / 2, bboxes[:, 3]))
+
+
+def frame_bboxes(objects):
+    """Stack the bboxes of one frame's objects into an (N, 4) array."""
+    return np.array([obj["bbox"] for obj in objects], dtype=np.float64).reshape(-1, 4)
+
+
+def transform_frames(data, homography_matrix, key="bbox"):
+    """
+    Project every object of every frame in one call.
+    - key="bbox": project the bottom middle of each bbox.
+    - any other key: project that [x, y] field directly (e.g. "center").
+    Returns a list with one (n_objects, 2) array per frame, aligned with data.
+    """
+    counts = [len(frame.get("objects", [])) for frame in data]
+    if key == "bbox":
+        points = bottom_middles([obj["bbox"] for frame in data for obj in frame.get("objects", [])])
+    else:
+        points = np.array([obj[key] for frame in data for obj in frame.get("objects", [])], dtype=np.float64).reshape(-1, 2)
+    transformed = transform_points(points, homography_matrix)
+    return np.split(transformed, np.cumsum(counts)[:-1]) if counts else []
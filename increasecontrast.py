@@ -1,36 +1,101 @@
+import argparse
+import time
+from functools import lru_cache
 import cv2
 import numpy as np
+from instrumentation import progress
+
+from frame_source import FrameSource
+
+# Greenish hue range (approx. 30–90 in OpenCV’s 0-179 scale, both ends excluded)
+GREEN_HUE_MIN = 31
+GREEN_HUE_MAX = 89
+
+@lru_cache(maxsize=None)
+def green_fade_luts(green_saturation_factor=0.5, non_green_brightness_factor=1.2):
+    """
+    Per-channel uint8 lookup tables (1x256x3, for cv2.LUT on an HSV frame) for greenish and
+    non-greenish pixels: greenish ones get their saturation scaled, the others their brightness.
+    Values are scaled in float32, clipped and truncated exactly like the float HSV version.
+    """
+    identity = np.arange(256, dtype=np.float32)
+    def scaled(factor):
+        return np.clip(identity * np.float32(factor), 0, 255).astype(np.uint8)
+    green = np.dstack((identity.astype(np.uint8), scaled(green_saturation_factor), identity.astype(np.uint8)))
+    non_green = np.dstack((identity.astype(np.uint8), identity.astype(np.uint8), scaled(non_green_brightness_factor)))
+    return green, non_green
+
+class GreenFadeFilter:
+    """
+    uint8 version of the green fade that reuses its buffers between frames of the same size.
+    The hue decides which of the two lookup tables applies to a pixel, so a frame costs two
+    colour conversions, two cv2.LUT passes, an inRange and a masked copy, with no float images.
+    """
+
+    def __init__(self, green_saturation_factor=0.5, non_green_brightness_factor=1.2):
+        self.green_lut, self.non_green_lut = green_fade_luts(green_saturation_factor, non_green_brightness_factor)
+        self._shape = None
+
+    def _allocate(self, shape):
+        self._shape = shape
+        self._hsv = np.empty(shape, dtype=np.uint8)
+        self._green = np.empty(shape, dtype=np.uint8)
+        self._result = np.empty(shape, dtype=np.uint8)
+        self._mask = np.empty(shape[:2], dtype=np.uint8)
+
+    def __call__(self, frame, out=None):
+        """Filter a BGR frame; the result is written to out if given, else to a new array."""
+        if frame.shape != self._shape:
+            self._allocate(frame.shape)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=self._hsv)
+        cv2.inRange(self._hsv, (GREEN_HUE_MIN, 0, 0), (GREEN_HUE_MAX, 255, 255), dst=self._mask)
+        cv2.LUT(self._hsv, self.green_lut, dst=self._green)
+        cv2.LUT(self._hsv, self.non_green_lut, dst=self._result)
+        cv2.copyTo(self._green, self._mask, dst=self._result)
+        if out is None:
+            return cv2.cvtColor(self._result, cv2.COLOR_HSV2BGR)
+        cv2.cvtColor(self._result, cv2.COLOR_HSV2BGR, dst=out)
+        return out
 
 def fade_green_colors(frame, green_saturation_factor=0.5, non_green_brightness_factor=1.2):
     """
     Process a frame by desaturating greenish colors while enhancing non-green brightness.
     - green_saturation_factor: Multiplier for saturation of greenish colors.
     - non_green_brightness_factor: Multiplier for brightness of non-green colors.
+    Gives the same pixels as the float32 HSV implementation; use GreenFadeFilter directly
+    to also reuse the intermediate buffers across frames.
     """
-    # Convert to HSV
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV).astype(np.float32)
-
-    # Extract H, S, V channels
-    h, s, v = cv2.split(hsv)
+    return GreenFadeFilter(green_saturation_factor, non_green_brightness_factor)(frame)
 
-    # Define greenish hue range (approx. 30–90 in OpenCV’s 0-179 scale)
-    green_mask = (h > 30) & (h < 90)
-
-    # Reduce saturation for greenish colors
-    s[green_mask] *= green_saturation_factor
+def render_filtered_video(video_path, output_path, green_saturation_factor=0.5, non_green_brightness_factor=1.2):
+    """
+    Headless batch mode: filter every frame of video_path and encode it to output_path.
+    Returns {"frames", "seconds", "fps"}.
+    """
+    try:
+        source = FrameSource(video_path)
+    except IOError:
+        print("Error opening video file.")
+        return None
 
-    # Boost brightness for non-green areas
-    v[~green_mask] *= non_green_brightness_factor
+    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+    out = cv2.VideoWriter(output_path, fourcc, source.fps, (source.width, source.height))
+    fade = GreenFadeFilter(green_saturation_factor, non_green_brightness_factor)
+    filtered = np.empty((source.height, source.width, 3), dtype=np.uint8)
 
-    # Clip values to valid range
-    s = np.clip(s, 0, 255)
-    v = np.clip(v, 0, 255)
+    frames = 0
+    start = time.perf_counter()
+    for _, frame in progress(source, total=len(source), desc=f"Filtering {video_path}"):
+        if frame.shape != filtered.shape:
+            filtered = np.empty(frame.shape, dtype=np.uint8)
+        out.write(fade(frame, out=filtered))
+        frames += 1
+    elapsed = time.perf_counter() - start
+    out.release()
 
-    # Merge back and convert to BGR
-    hsv_processed = cv2.merge([h, s, v])
-    frame_processed = cv2.cvtColor(hsv_processed.astype(np.uint8), cv2.COLOR_HSV2BGR)
-    
-    return frame_processed
+    fps = frames / elapsed if elapsed > 0 else 0.0
+    print(f"Filtered {frames} frames in {elapsed:.1f}s ({fps:.1f} frames/sec). Output saved as {output_path}")
+    return {"frames": frames, "seconds": elapsed, "fps": fps}
 
 def play_video_with_filter(video_path, green_saturation_factor=0.5, non_green_brightness_factor=1.2):
     """
@@ -38,21 +103,19 @@ def play_video_with_filter(video_path, green_saturation_factor=0.5, non_green_br
     Press 'f' to toggle the filter ON/OFF.
     Press 'q' to quit.
     """
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+    try:
+        source = FrameSource(video_path)
+    except IOError:
         print("Error opening video file.")
         return
 
     filter_enabled = False
+    fade = GreenFadeFilter(green_saturation_factor, non_green_brightness_factor)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
+    for _, frame in source:
         # Apply the filter only if enabled
         if filter_enabled:
-            frame = fade_green_colors(frame, green_saturation_factor, non_green_brightness_factor)
+            frame = fade(frame)
 
         # Display the frame
         cv2.imshow("Video Player (Press 'f' to Toggle Filter, 'q' to Quit)", frame)
@@ -65,12 +128,21 @@ def play_video_with_filter(video_path, green_saturation_factor=0.5, non_green_br
         elif key == ord('q'):  # Quit
             break
 
-    cap.release()
+    source.close()
     cv2.destroyAllWindows()
 
 def main():
-    input_file = "transformed_merged_output.mp4"
-    play_video_with_filter(input_file)
+    parser = argparse.ArgumentParser(description="Fade the green of the pitch in a video.")
+    parser.add_argument("input_file", nargs="?", default="transformed_merged_output.mp4", help="Video to filter")
+    parser.add_argument("--output", help="Write the filtered video here instead of playing it")
+    parser.add_argument("--green-saturation", type=float, default=0.5, help="Saturation multiplier for greenish colors")
+    parser.add_argument("--non-green-brightness", type=float, default=1.2, help="Brightness multiplier for other colors")
+    args = parser.parse_args()
+
+    if args.output:
+        render_filtered_video(args.input_file, args.output, args.green_saturation, args.non_green_brightness)
+    else:
+        play_video_with_filter(args.input_file, args.green_saturation, args.non_green_brightness)
 
 if __name__ == "__main__":
     main()
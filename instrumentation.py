@@ -0,0 +1,288 @@
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+from tqdm import tqdm
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Progress settings live in the environment so spawned worker processes inherit them
+PROGRESS_ENV = "FIELDSTATS_PROGRESS"  # "0" disables every progress bar
+PROGRESS_INTERVAL_ENV = "FIELDSTATS_PROGRESS_INTERVAL"  # Seconds between bar refreshes
+TTY_INTERVAL = 0.5  # Default refresh interval on a terminal
+LOG_INTERVAL = 30.0  # Default refresh interval when stderr is a log file or pipe
+
+# measure() scopes open in this process; the peak-RSS counter is only restarted when there are none
+_open_scopes = set()
+_open_scopes_lock = threading.Lock()
+
+PROFILE_INTERVAL = 0.005  # Seconds between stack samples
+PROFILE_TOP = 25  # Functions listed per stage in the report
+
+
+def configure_progress(enabled=None, min_interval=None):
+    """Enable/disable progress bars and set their refresh interval, for this process and its children."""
+    if enabled is not None:
+        os.environ[PROGRESS_ENV] = "1" if enabled else "0"
+    if min_interval is not None:
+        os.environ[PROGRESS_INTERVAL_ENV] = str(min_interval)
+
+
+def progress(iterable=None, **kwargs):
+    """
+    tqdm with the configured settings: disabled when FIELDSTATS_PROGRESS is "0", and refreshed
+    at most every FIELDSTATS_PROGRESS_INTERVAL seconds (default: TTY_INTERVAL on a terminal,
+    LOG_INTERVAL otherwise, so headless logs get a line now and then instead of a stream).
+    """
+    if os.environ.get(PROGRESS_ENV, "1") == "0":
+        kwargs["disable"] = True
+    interval = os.environ.get(PROGRESS_INTERVAL_ENV)
+    if interval is not None:
+        kwargs.setdefault("mininterval", float(interval))
+    else:
+        kwargs.setdefault("mininterval", TTY_INTERVAL if sys.stderr.isatty() else LOG_INTERVAL)
+    return tqdm(iterable, **kwargs)
+
+
+def count_items(value):
+    """
+    (frames, objects) held by an artifact: a frame list or a {"frames": [...]} dict, with
+    objects under "objects" or jsoncompress's "obj". None for anything else.
+    """
+    if isinstance(value, dict) and "frames" in value:
+        value = value["frames"]
+    if isinstance(value, list) and all(isinstance(frame, dict) for frame in value[:1]):
+        return len(value), sum(len(frame.get("objects", frame.get("obj", ()))) for frame in value)
+    return None
+
+
+def _sum_counts(values):
+    counts = [count for count in map(count_items, values) if count is not None]
+    if not counts:
+        return None
+    return {"frames": sum(frames for frames, _ in counts), "objects": sum(objects for _, objects in counts)}
+
+
+def _io_counters():
+    """Bytes this process read and wrote so far through read/write calls (Linux only, else None)."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _reset_peak_rss():
+    """
+    Restart the kernel's peak-RSS counter (Linux only); returns False where unsupported.
+    The counter is process-wide, so measure() only calls this while no other scope is open.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes():
+    """Peak resident set size: since the last _reset_peak_rss on Linux, since start elsewhere."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for one thread: a background thread samples its Python stack every
+    interval seconds. Cheap enough to leave on for a whole match; results are approximate.
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = 0
+        self._self = Counter()
+        self._total = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self._self[_function_key(frame.f_code)] += 1
+            seen = set()
+            while frame is not None:
+                key = _function_key(frame.f_code)
+                if key not in seen:  # Recursive calls count once per sample
+                    seen.add(key)
+                    self._total[key] += 1
+                frame = frame.f_back
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling; returns the PROFILE_TOP functions by samples spent in their own code."""
+        self._stop.set()
+        self._thread.join()
+        return {
+            "interval": self.interval,
+            "samples": self.samples,
+            "functions": [
+                {"function": key, "self_samples": self._self[key], "total_samples": total}
+                for key, total in sorted(self._total.items(), key=lambda item: (self._self[item[0]], item[1]),
+                                         reverse=True)[:PROFILE_TOP]
+            ],
+        }
+
+
+def _function_key(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+
+class StageRecord:
+    """Measurements of one stage; outputs() adds the frame/object counts of what it produced."""
+
+    def __init__(self, name, inputs=()):
+        self.name = name
+        self.values = {"stage": name, "inputs": _sum_counts(inputs)}
+        self.overlapped = False  # Another measure() scope was open at some point during this one
+
+    def outputs(self, values):
+        self.values["outputs"] = _sum_counts(values)
+
+    def __setitem__(self, key, value):
+        self.values[key] = value
+
+
+@contextmanager
+def measure(name, inputs=(), profiler=None):
+    """
+    Measure the enclosed block as stage name: wall and CPU seconds, peak RSS, bytes read and
+    written and, with profiler (a SamplingProfiler factory taking a thread id), its hottest
+    functions. inputs are counted in frames and objects. Yields the StageRecord; its values
+    are complete when the block exits. CPU time, RSS and I/O are process-wide, so stages run
+    concurrently in one process are attributed each other's work.
+    The peak-RSS counter is only restarted when no other scope is open, so concurrent scopes
+    never clear each other's peaks. peak_rss_scope tells what the peak covers: "stage" for
+    this stage alone, "shared" if other scopes were open during it (the peak then includes
+    their memory and may start before this stage), "process" where it cannot be restarted.
+    """
+    record = StageRecord(name, inputs)
+    with _open_scopes_lock:
+        peak_reset = not _open_scopes and _reset_peak_rss()
+        for other in _open_scopes:
+            other.overlapped = True
+        record.overlapped = bool(_open_scopes)
+        _open_scopes.add(record)
+    io_before = _io_counters()
+    running_profiler = profiler(threading.get_ident()).start() if profiler else None
+    started_at = datetime.now(timezone.utc).isoformat()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield record
+    finally:
+        record["wall_seconds"] = time.perf_counter() - wall_start
+        record["cpu_seconds"] = time.process_time() - cpu_start
+        record["started_at"] = started_at
+        with _open_scopes_lock:
+            _open_scopes.discard(record)
+            record["peak_rss_bytes"] = _peak_rss_bytes()
+            if record.overlapped:
+                record["peak_rss_scope"] = "shared"
+            else:
+                record["peak_rss_scope"] = "stage" if peak_reset else "process"
+        io_after = _io_counters()
+        if io_before and io_after:
+            record["bytes_read"] = io_after[0] - io_before[0]
+            record["bytes_written"] = io_after[1] - io_before[1]
+        if running_profiler:
+            record["profile"] = running_profiler.stop()
+
+
+def measure_call(name, func, *args, profiler=None, **kwargs):
+    """
+    Run func(*args, **kwargs) under measure(); returns (result, record values). For work done
+    in a worker process, whose own resources the parent cannot see.
+    """
+    with measure(name, profiler=profiler) as record:
+        result = func(*args, **kwargs)
+    return result, record.values
+
+
+class RunReport:
+    """
+    Per-match run report: one entry per measured stage plus totals, written as JSON.
+    - profile: sample every stage's Python stack (see SamplingProfiler).
+    """
+
+    def __init__(self, match_id=None, profile=False):
+        self.match_id = match_id
+        self.profiler = SamplingProfiler if profile else None
+        self.stages = []
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self._wall_start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, inputs=()):
+        """measure() a stage and add it to the report (also when it fails)."""
+        with measure(name, inputs, self.profiler) as record:
+            try:
+                yield record
+            except BaseException as error:
+                record["error"] = repr(error)
+                raise
+            finally:
+                self.stages.append(record.values)
+
+    def add(self, values):
+        """Add a stage measured elsewhere (measure_call values from a worker process)."""
+        self.stages.append(values)
+
+    def to_dict(self):
+        return {
+            "match_id": self.match_id,
+            "started_at": self.started_at,
+            "wall_seconds": time.perf_counter() - self._wall_start,
+            "stage_cpu_seconds": sum(stage.get("cpu_seconds", 0.0) for stage in self.stages),
+            "host": {"python": platform.python_version(), "platform": platform.platform(),
+                     "cpus": os.cpu_count()},
+            "stages": self.stages,
+        }
+
+    def write(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+
+def stage_scope(report, name, inputs=()):
+    """report.stage(name, inputs), or a no-op context yielding None when report is None."""
+    return report.stage(name, inputs) if report is not None else nullcontext()
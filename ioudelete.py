@@ -1,6 +1,6 @@
-import json
-import itertools
-from tqdm import tqdm
+import numpy as np
+from instrumentation import progress
+from detection_store import COLOR_CODES, is_store_path, read_store, read_frames, write_frames, write_store
 
 
 def calculate_iou(bbox1, bbox2):
@@ -20,43 +20,194 @@ def calculate_iou(bbox1, bbox2):
 
     return intersection / union if union != 0 else 0
 
-def remove_low_conf_objects(json_file, output_file, iou_threshold=0.95):
-    with open(json_file, 'r') as file:
-        data = json.load(file)
+GROUP1_COLORS = {"yellow", "red", "orange"}
+GROUP2_COLORS = {"blue", "purple", "pink"}
+
+IOU_THRESHOLD = 0.95  # Objects overlapping with a higher IoU are duplicates; the lower-confidence one is removed
+IOU_METHOD = "auto"  # "matrix": all pairs per frame, "sweep": sweep line over x, "auto": sweep for dense frames only
+SWEEP_MIN_OBJECTS = 64  # Frames with at least this many objects use the sweep line in "auto" mode
+PAIR_CHUNK = 2_000_000  # Max candidate pairs evaluated at once in "matrix" mode
+
+
+def color_groups(objects, group1=GROUP1_COLORS, group2=GROUP2_COLORS):
+    """Colour group of every object: 1 for group1 colours, 2 for group2 colours, 0 otherwise."""
+    return np.array(
+        [1 if obj['color'] in group1 else 2 if obj['color'] in group2 else 0 for obj in objects],
+        dtype=np.int8
+    )
+
+
+def pairwise_iou(bboxes_a, bboxes_b):
+    """IoU of bboxes_a[k] and bboxes_b[k] for every k, computed exactly like calculate_iou."""
+    x1 = np.maximum(bboxes_a[:, 0], bboxes_b[:, 0])
+    y1 = np.maximum(bboxes_a[:, 1], bboxes_b[:, 1])
+    x2 = np.minimum(bboxes_a[:, 2], bboxes_b[:, 2])
+    y2 = np.minimum(bboxes_a[:, 3], bboxes_b[:, 3])
+
+    intersection = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+
+    area_a = (bboxes_a[:, 2] - bboxes_a[:, 0]) * (bboxes_a[:, 3] - bboxes_a[:, 1])
+    area_b = (bboxes_b[:, 2] - bboxes_b[:, 0]) * (bboxes_b[:, 3] - bboxes_b[:, 1])
+
+    union = area_a + area_b - intersection
+
+    iou = np.zeros(len(union))
+    np.divide(intersection, union, out=iou, where=union != 0)
+    return iou
+
+
+def expand_pairs(first, ends):
+    """
+    All pairs (i, j) with first[k] = i and i < j < ends[k], as two index arrays.
+    Pairs come out grouped by i and sorted by j, without a Python loop.
+    """
+    counts = np.maximum(ends - first - 1, 0)
+    i = np.repeat(first, counts)
+    # Position of each pair inside its group, turned into j = i + 1 + position
+    group_starts = np.repeat(np.cumsum(counts) - counts, counts)
+    j = i + 1 + (np.arange(len(i)) - group_starts)
+    return i, j
+
+
+def frame_pairs(offsets):
+    """Every pair (i, j), i < j, of objects in the same frame, for frames given by an offsets table."""
+    counts = np.diff(offsets)
+    ends = np.repeat(offsets[1:], counts)
+    return expand_pairs(np.arange(offsets[-1]), ends)
+
+
+def sweep_pairs(bboxes):
+    """
+    Pairs (i, j), i < j, of one frame's boxes that overlap along x. Boxes are sorted by x1;
+    each box is only paired with the following boxes that start before it ends.
+    Pairs that do not overlap along x have zero IoU, so nothing above a threshold >= 0 is missed.
+    """
+    order = np.argsort(bboxes[:, 0], kind="stable")
+    sorted_x1 = bboxes[order, 0]
+    ends = np.searchsorted(sorted_x1, bboxes[order, 2], side="left")
+    p, q = expand_pairs(np.arange(len(order)), ends)
+    a, b = order[p], order[q]
+    return np.minimum(a, b), np.maximum(a, b)
+
+
+def duplicate_removals(i, j, bboxes, confidences, groups, iou_threshold, remove):
+    """
+    Mark in remove the lower-confidence object of every candidate pair (i, j), i < j, whose IoU
+    exceeds iou_threshold, skipping pairs with one object in each colour group.
+    On equal confidence the later object (j) is the one removed, as in the original double loop.
+    """
+    same_group = groups[i] * groups[j] != 2  # Only a group1/group2 pair multiplies to 2
+    i, j = i[same_group], j[same_group]
+    duplicate = pairwise_iou(bboxes[i], bboxes[j]) > iou_threshold
+    i, j = i[duplicate], j[duplicate]
+    remove_first = confidences[i] < confidences[j]
+    remove[i[remove_first]] = True
+    remove[j[~remove_first]] = True
+
+
+def duplicate_mask(offsets, bboxes, confidences, groups, iou_threshold=IOU_THRESHOLD, method=IOU_METHOD):
+    """
+    Objects to remove: in each frame (frame k owns objects offsets[k]:offsets[k + 1]), the
+    lower-confidence object of every pair of same-group objects whose IoU exceeds iou_threshold.
+    - method: "matrix" checks every pair in a frame, with the pairs of many frames evaluated
+      in one batch; "sweep" only checks pairs overlapping along x; "auto" uses the sweep
+      line for frames with at least SWEEP_MIN_OBJECTS objects and the matrix for the rest.
+    - groups: colour group of every object, as color_groups gives.
+    Removed objects still take part in later pairs, exactly like the original double loop.
+    """
+    if method not in ("matrix", "sweep", "auto"):
+        raise ValueError(f"Unknown IoU method '{method}'")
+    if iou_threshold < 0:
+        method = "matrix"  # Non-overlapping pairs can exceed a negative threshold
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    remove = np.zeros(len(bboxes), dtype=bool)
+
+    if method == "sweep":
+        use_sweep = counts > 1
+    elif method == "auto":
+        use_sweep = counts >= SWEEP_MIN_OBJECTS
+    else:
+        use_sweep = np.zeros(len(counts), dtype=bool)
+
+    with progress(total=len(counts), desc="Processing frames", unit="frame") as bar:
+        # Dense frames: one sweep per frame
+        for k in np.flatnonzero(use_sweep).tolist():
+            start = offsets[k]
+            i, j = sweep_pairs(bboxes[start:offsets[k + 1]])
+            duplicate_removals(i + start, j + start, bboxes, confidences, groups, iou_threshold, remove)
+            bar.update(1)
+
+        # Remaining frames: every pair, batched over consecutive frames up to PAIR_CHUNK pairs
+        matrix_frames = np.flatnonzero(~use_sweep)
+        pair_counts = counts[matrix_frames] * (counts[matrix_frames] - 1) // 2
+        chunk_start = 0
+        while chunk_start < len(matrix_frames):
+            chunk_pairs = np.cumsum(pair_counts[chunk_start:])
+            chunk_end = chunk_start + max(1, int(np.searchsorted(chunk_pairs, PAIR_CHUNK, side="right")))
+            frames = matrix_frames[chunk_start:chunk_end]
+            chunk_offsets = np.concatenate(([0], np.cumsum(counts[frames])))
+            # Global index of each object in the chunk, frame after frame
+            members = np.concatenate([np.arange(offsets[k], offsets[k + 1]) for k in frames.tolist()])
+            i, j = frame_pairs(chunk_offsets)
+            duplicate_removals(members[i], members[j], bboxes, confidences, groups, iou_threshold, remove)
+            bar.update(len(frames))
+            chunk_start = chunk_end
+
+    return remove
+
+
+def remove_low_conf_frames(data, iou_threshold=IOU_THRESHOLD, method=IOU_METHOD, group1=GROUP1_COLORS, group2=GROUP2_COLORS):
+    """
+    In each frame, drop the lower-confidence object of every pair of same-group
+    objects whose IoU exceeds iou_threshold (see duplicate_mask for method).
+    Frames are updated in place and returned.
+    - group1, group2: colour sets; pairs with one object from each group are never compared.
+    """
+    objects = [obj for frame in data for obj in frame['objects']]
+    counts = np.array([len(frame['objects']) for frame in data], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    bboxes = np.array([obj['bbox'] for obj in objects], dtype=np.float64).reshape(-1, 4)
+    confidences = np.array([obj['confidence'] for obj in objects], dtype=np.float64)
+    groups = color_groups(objects, group1, group2)
+    remove = duplicate_mask(offsets, bboxes, confidences, groups, iou_threshold, method)
+
+    for k, frame in enumerate(data):
+        frame_remove = remove[offsets[k]:offsets[k + 1]]
+        if frame_remove.any():
+            frame['objects'] = [obj for obj, removed in zip(frame['objects'], frame_remove.tolist()) if not removed]
+
+    return data
+
+
+def remove_low_conf_store(store, iou_threshold=IOU_THRESHOLD, method=IOU_METHOD, group1=GROUP1_COLORS,
+                          group2=GROUP2_COLORS):
+    """remove_low_conf_frames on a DetectionStore; returns a new store with every frame kept."""
+    group1_codes = [COLOR_CODES[color] for color in group1 if color in COLOR_CODES]
+    group2_codes = [COLOR_CODES[color] for color in group2 if color in COLOR_CODES]
+    groups = np.where(np.isin(store.color, group1_codes), 1, np.where(np.isin(store.color, group2_codes), 2, 0))
+    remove = duplicate_mask(store.offsets, store.bbox, store.confidence, groups.astype(np.int8), iou_threshold, method)
+    return store.select(~remove)
+
+def remove_low_conf_objects(json_file, output_file, iou_threshold=IOU_THRESHOLD):
+    if is_store_path(json_file):  # Columnar input is filtered without building dicts
+        store = read_store(json_file)
+        filtered = remove_low_conf_store(store, iou_threshold)
+        write_store(filtered, output_file, indent=4)
+        print(f"Total objects before: {store.num_objects}")
+        print(f"Total objects after: {filtered.num_objects}")
+        return
+
+    data = read_frames(json_file)
 
     total_objects_before = sum(len(frame['objects']) for frame in data)
 
-    group1_colors = {"yellow", "red", "orange"}
-    group2_colors = {"blue", "purple", "pink"}
-
-    for frame in tqdm(data, desc="Processing frames", unit="frame"):
-
-        objects = frame['objects']
-        to_remove = set()
-
-        for i, obj1 in enumerate(objects):
-            for j, obj2 in enumerate(objects):
-                if i >= j:  # Avoid duplicate comparisons
-                    continue
-
-                # Skip comparison if objects belong to different color groups
-                if (obj1['color'] in group1_colors and obj2['color'] in group2_colors) or \
-                   (obj1['color'] in group2_colors and obj2['color'] in group1_colors):
-                    continue
-
-                iou = calculate_iou(obj1['bbox'], obj2['bbox'])
-                if iou > iou_threshold:
-                    if obj1['confidence'] < obj2['confidence']:
-                        to_remove.add(i)
-                    else:
-                        to_remove.add(j)
-
-        frame['objects'] = [obj for idx, obj in enumerate(objects) if idx not in to_remove]
+    remove_low_conf_frames(data, iou_threshold)
 
     total_objects_after = sum(len(frame['objects']) for frame in data)
 
-    with open(output_file, 'w') as file:
-        json.dump(data, file, indent=4)
+    write_frames(data, output_file, indent=4)
 
     print(f"Total objects before: {total_objects_before}")
     print(f"Total objects after: {total_objects_after}")
@@ -67,13 +218,8 @@ def main():
 
     remove_low_conf_objects(input_file, output_file)
 
-    import jsoncompress
-    print("seventh script completed. Now running the eighth script...")
-    jsoncompress.main()  # Call the second script after finishing the first
-
 if __name__ == "__main__":
     input_file = "borderfiltered_merged_output_with_transformed_center.json"  # Replace with the path to your JSON file
     output_file = "98.json"  # Replace with the desired output file name
 
     remove_low_conf_objects(input_file, output_file)
-
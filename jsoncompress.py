@@ -1,5 +1,7 @@
 import json
-from tqdm import tqdm  # Import tqdm for progress bars
+from instrumentation import progress
+from detection_store import read_frames
+from match_codec import write_match
 
 def round_floats(obj):
     """
@@ -17,14 +19,12 @@ def round_floats(obj):
     else:
         return obj
 
-def main():
-    input_file = "95_final.json"
-    output_file = "95_iou_compressed.json"
-
-    # Read the original JSON file
-    with open(input_file, "r") as f:
-        data = json.load(f)
-    
+def compress_frames(data):
+    """
+    Convert the final detections into the compact upload format:
+    short keys, dropped fields, floats rounded to one decimal place.
+    Returns None if the structure is not recognised.
+    """
     # Check if the JSON is a list (frames only) or a dict with metadata and frames.
     if isinstance(data, list):
         frames = data
@@ -36,10 +36,10 @@ def main():
         new_data = {"metadata": metadata, "frames": frames}
     else:
         print("Unexpected JSON structure.")
-        return
+        return None
 
-    # Process each frame with tqdm progress bar
-    for frame in tqdm(new_data["frames"], desc="Processing Frames"):
+    # Process each frame with a progress bar
+    for frame in progress(new_data["frames"], desc="Processing Frames"):
         # Rename 'frame_index' to 'fr'
         if "frame_index" in frame:
             frame["fr"] = frame.pop("frame_index")
@@ -48,7 +48,7 @@ def main():
         if "objects" in frame:
             frame["obj"] = frame.pop("objects")
         
-        # Process each object in the frame with tqdm progress bar
+        # Process each object in the frame
         for obj in frame.get("obj", []):
             # Remove unwanted keys
             for key in ["class_id", "confidence", "center", "color"]:
@@ -64,7 +64,19 @@ def main():
                 obj["t_c"] = obj.pop("transformed_center")
 
     # Recursively round all floating-point numbers to one decimal place.
-    new_data = round_floats(new_data)
+    return round_floats(new_data)
+
+def main():
+    input_file = "95_final.json"
+    output_file = "95_iou_compressed.json"
+    binary_output_file = "95_iou_compressed.bin"  # Same frames in the match_codec binary format
+
+    # Read the original JSON file
+    data = read_frames(input_file)
+
+    new_data = compress_frames(data)
+    if new_data is None:
+        return
 
     # Write the modified JSON data to the output file.
     with open(output_file, "w") as f:
@@ -72,7 +84,8 @@ def main():
 
     print("JSON conversion complete. New file saved as", output_file)
 
-    print("eighth script completed. ALL COMPLETED!!!!!!")
+    write_match(new_data, binary_output_file)
+    print("Binary match file saved as", binary_output_file)
 
 if __name__ == "__main__":
     main()
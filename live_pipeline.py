@@ -0,0 +1,261 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+import ENTRY_YOLO_merge
+import pipeline
+import run_pipeline
+from detection_store import DetectionWriter, read_frames
+from instrumentation import configure_progress
+from yolo_detection import run_detection
+
+FPS = 25  # Camera frame rate: frame_index / FPS is the frame's time in the match
+WINDOW_SECONDS = 10.0  # Length of the frame windows the chain is run on
+POLL_INTERVAL = 0.2  # Seconds between checks of the detection files for new frames
+IDLE_TIMEOUT = 60.0  # Without a finished() callback, files that stop growing this long are complete
+DETECTION_FLUSH_FRAMES = 5  # YOLO flushes its detection file this often, so frames are seen quickly
+
+# ENTRY_YOLO_merge through ioudelete handle one frame at a time, so they can run window by window;
+# jsoncompress and match_codec run once on the whole match when it has ended
+_STAGE_NAMES = [stage.name for stage in pipeline.STAGES]
+WINDOW_STAGES = pipeline.STAGES[:_STAGE_NAMES.index("ioudelete") + 1]
+FINAL_STAGES = pipeline.STAGES[len(WINDOW_STAGES):]
+
+# Artifacts appended to their live file after every window
+WINDOW_OUTPUTS = ["right_intersections", "right_non_intersections", "left_intersections", "left_non_intersections",
+                  "final"]
+
+# Detection files of the cameras, as run_stages names them
+DETECTION_FILES = {
+    "right_detections": ENTRY_YOLO_merge.TRACKING_DATA_RIGHT,
+    "left_detections": ENTRY_YOLO_merge.TRACKING_DATA_LEFT,
+}
+HOMOGRAPHY_FILES = {
+    "right_detections": ENTRY_YOLO_merge.HOMOGRAPHY_MATRIX_RIGHT,
+    "left_detections": ENTRY_YOLO_merge.HOMOGRAPHY_MATRIX_LEFT,
+}
+
+
+def live_file(name, directory=None):
+    """JSON Lines file an artifact is appended to in live mode, e.g. right_intersections.jsonl."""
+    return os.path.join(directory or "", os.path.splitext(pipeline.OUTPUT_FILES[name])[0] + ".jsonl")
+
+
+class FrameFollower:
+    """
+    Read the frames appended to a JSON Lines detection file while another process writes it.
+    A partly written last line is held back until its newline arrives.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.last_frame_index = -1  # Highest frame_index read so far
+        self._file = None
+        self._partial = ""
+
+    def read_new(self):
+        """Frames appended since the last call, in file order (none if the file does not exist yet)."""
+        if self._file is None:
+            if not os.path.exists(self.path):
+                return []
+            self._file = open(self.path, "r")
+        frames = []
+        for line in iter(self._file.readline, ""):
+            self._partial += line
+            if not self._partial.endswith("\n"):
+                break
+            if self._partial.strip():
+                frames.append(json.loads(self._partial))
+            self._partial = ""
+        if frames:
+            self.last_frame_index = max(self.last_frame_index, frames[-1]["frame_index"])
+        return frames
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def _take_before(frames, stop):
+    """Remove and return the leading frames of frames with frame_index below stop."""
+    split = next((i for i, frame in enumerate(frames) if frame["frame_index"] >= stop), len(frames))
+    taken = frames[:split]
+    del frames[:split]
+    return taken
+
+
+def process_window(calibration, right_frames, left_frames, config=None):
+    """Run WINDOW_STAGES on one window of detections; returns {name: frames} for WINDOW_OUTPUTS."""
+    artifacts = {"calibration": calibration, "right_detections": right_frames, "left_detections": left_frames}
+    produced = pipeline.run_stages(WINDOW_STAGES, artifacts, save_outputs=(), config=config,
+                                   keep_outputs=WINDOW_OUTPUTS)
+    return {name: produced[name] for name in WINDOW_OUTPUTS}
+
+
+def run_live(directory=None, window_seconds=WINDOW_SECONDS, fps=FPS, poll_interval=POLL_INTERVAL,
+             idle_timeout=IDLE_TIMEOUT, finished=None, config=None, finalize=True):
+    """
+    Follow both cameras' detection files in directory (default: working directory) while they
+    grow, run ENTRY_YOLO_merge through ioudelete on consecutive windows of window_seconds and
+    append each window's outputs to the live files (see live_file). Every stage of that chain
+    handles one frame at a time, so the live files hold exactly what a full run produces.
+    - finished: callable returning True once nothing more will be written to the detection
+      files; without it they are complete after idle_timeout seconds without new frames.
+    - config: the PipelineConfig to run with (default values if None).
+    - finalize: once the files are complete, also write the regular outputs (the intersection
+      JSONs and 95_iou_compressed.json/.bin), as run_default_pipeline does.
+    A window is processed as soon as both cameras have passed its last frame, so a frame's
+    result is appended at most window_seconds + poll_interval + the window's processing time
+    after its detections are flushed. Returns one summary dict per processed window.
+    """
+    calibration = pipeline.load_calibration(directory)
+    window_frames = max(1, round(window_seconds * fps))
+    followers = {name: FrameFollower(os.path.join(directory or "", file_name))
+                 for name, file_name in DETECTION_FILES.items()}
+    pending = {name: [] for name in followers}
+    writers = {name: DetectionWriter(live_file(name, directory)) for name in WINDOW_OUTPUTS}
+    windows = []
+    window_start = 0
+    last_growth = time.monotonic()
+    try:
+        with open(os.devnull, "w") as devnull:
+            while True:
+                # Asked before reading, so frames written just before the end are still read
+                done = finished() if finished else time.monotonic() - last_growth > idle_timeout
+                for name, follower in followers.items():
+                    frames = follower.read_new()
+                    if frames:
+                        pending[name].extend(frames)
+                        last_growth = time.monotonic()
+                read_at = time.monotonic()
+
+                while any(pending.values()):
+                    # Skip windows neither camera has frames in
+                    first = min(frames[0]["frame_index"] for frames in pending.values() if frames)
+                    window_start = max(window_start, first - first % window_frames)
+                    window_stop = window_start + window_frames
+                    if not done and any(follower.last_frame_index < window_stop - 1 for follower in followers.values()):
+                        break  # A camera may still add frames to this window
+
+                    right_frames = _take_before(pending["right_detections"], window_stop)
+                    left_frames = _take_before(pending["left_detections"], window_stop)
+                    with redirect_stdout(devnull):  # The stages print summaries for every window
+                        outputs = process_window(calibration, right_frames, left_frames, config)
+                    for name, frames in outputs.items():
+                        for frame in frames:
+                            writers[name].write(frame)
+                        writers[name].flush()
+
+                    window = {
+                        "start": window_start,
+                        "stop": window_stop,
+                        "frames": len({frame["frame_index"] for frame in right_frames + left_frames}),
+                        "objects": sum(len(frame["objects"]) for frame in outputs["final"]),
+                        "lag_seconds": time.monotonic() - read_at,
+                    }
+                    windows.append(window)
+                    print(f"Window {window_start}-{window_stop - 1}: {window['frames']} frames, "
+                          f"{window['objects']} final objects, ready {window['lag_seconds']:.2f}s after its last frame arrived")
+                    window_start = window_stop
+
+                if done:
+                    break
+                time.sleep(poll_interval)
+    finally:
+        for follower in followers.values():
+            follower.close()
+        for writer in writers.values():
+            writer.close()
+
+    if windows:
+        print(f"{len(windows)} windows processed, longest wait after the last frame of a window: "
+              f"{max(window['lag_seconds'] for window in windows):.2f}s")
+    if finalize:
+        finalize_outputs(directory, config)
+    return windows
+
+
+def finalize_outputs(directory=None, config=None):
+    """Write the regular output files from the live files once the match has ended."""
+    for name in WINDOW_OUTPUTS:
+        if name in pipeline.FINAL_OUTPUTS:
+            pipeline.write_artifact(name, read_frames(live_file(name, directory)), directory)
+    pipeline.run_stages(FINAL_STAGES, {"final": read_frames(live_file("final", directory))}, config=config,
+                        output_dir=directory)
+
+
+def start_detection(videos, directory=None, device="cpu", detection_options=None):
+    """
+    Start YOLO on each camera's video in its own worker process, pinned to its own group of
+    cores and flushing its detection file every DETECTION_FLUSH_FRAMES frames. A pitch ROI in
+    detection_options uses the camera's homography matrix in directory.
+    - videos: {"right_detections": video, "left_detections": video}; a stream URL works too,
+      since OpenCV cannot read an mp4 file that is still being recorded.
+    Returns (pools, futures); the futures end with run_detection's stats.
+    """
+    detection_options = detection_options or {}
+    core_groups = run_pipeline.partition_cores(len(videos))
+    # spawn keeps CUDA and OpenCV state from being forked into the workers
+    context = multiprocessing.get_context("spawn")
+    pools, futures = [], []
+    for (name, video), cores in zip(videos.items(), core_groups):
+        output_file = os.path.join(directory or "", DETECTION_FILES[name])
+        if os.path.exists(output_file):
+            os.remove(output_file)  # Never follow the detections of an earlier run
+        pool = ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=run_pipeline.pin_to_cores,
+                                   initargs=(cores,))
+        homography_file = os.path.join(directory or "", HOMOGRAPHY_FILES[name])
+        futures.append(pool.submit(run_detection, video, os.path.join(directory or "", run_pipeline.MODEL_FILE),
+                                   output_file, device, flush_every=DETECTION_FLUSH_FRAMES,
+                                   homography_path=homography_file, **detection_options))
+        pools.append(pool)
+    return pools, futures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Near-live mode: run the merge/filter/dedup chain on rolling windows of growing detection files.")
+    parser.add_argument("--directory", help="Match directory with the calibration and detection files (default: .)")
+    parser.add_argument("--left-video", help="Run YOLO on this left camera video or stream URL as well")
+    parser.add_argument("--right-video", help="Run YOLO on this right camera video or stream URL as well")
+    parser.add_argument("--device", choices=["cpu", "gpu"], default="cpu", help="Device for YOLO inference")
+    parser.add_argument("--batch-size", type=int, default=1, help="Frames per YOLO forward pass")
+    parser.add_argument("--imgsz", type=int, help="YOLO inference image size (model default if omitted)")
+    parser.add_argument("--pitch-roi", choices=["none", "crop", "mask"], default="none",
+                        help="Run YOLO only on the pitch region of each camera (mask: also grey out its surroundings)")
+    parser.add_argument("--window-seconds", type=float, default=WINDOW_SECONDS, help="Length of each window")
+    parser.add_argument("--fps", type=float, default=FPS, help="Camera frame rate")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="Seconds between checks for new frames")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="Without --left/right-video: seconds without new frames after which the match has ended")
+    parser.add_argument("--no-finalize", action="store_true", help="Only write the live .jsonl files")
+    args = parser.parse_args()
+
+    if bool(args.left_video) != bool(args.right_video):
+        parser.error("--left-video and --right-video go together")
+    configure_progress(enabled=False)  # One bar per stage and window would flood the log
+
+    pools, futures = [], []
+    if args.left_video:
+        detection_options = {"batch_size": args.batch_size, "imgsz": args.imgsz,
+                             "roi": None if args.pitch_roi == "none" else args.pitch_roi}
+        pools, futures = start_detection({"right_detections": args.right_video, "left_detections": args.left_video},
+                                         args.directory, args.device, detection_options)
+    try:
+        run_live(args.directory, args.window_seconds, args.fps, args.poll_interval, args.idle_timeout,
+                 finished=(lambda: all(future.done() for future in futures)) if futures else None,
+                 finalize=not args.no_finalize)
+        for future in futures:
+            future.result()  # Re-raises a detection error
+    finally:
+        for pool in pools:
+            pool.shutdown()
+    print("✅ Live run complete")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import io
+import json
+import struct
+import zlib
+import numpy as np
+
+MAGIC = b"FSMC"
+VERSION = 1
+SCALE = 10  # Fixed-point steps per unit: one decimal place, like jsoncompress.round_floats
+BLOCK_FRAMES = 256  # Frames per independently compressed block
+
+# Object flags: low two bits hold the "src" code, bit 2 marks a present "t_c"
+SRC_MASK = 0b011
+SRC_NONE = 2
+HAS_TC = 0b100
+
+# Width in bytes of the signed integer type each column is stored with
+INT_TYPES = {1: np.int8, 2: np.int16, 4: np.int32, 8: np.int64}
+
+
+def _pack_ints(values):
+    """Store an int64 array with the narrowest signed type that holds all of it."""
+    values = np.asarray(values, dtype=np.int64)
+    low, high = (values.min(), values.max()) if len(values) else (0, 0)
+    size = next(size for size, dtype in INT_TYPES.items()
+                if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max)
+    return struct.pack("<B", size) + values.astype(f"<i{size}").tobytes()
+
+
+def _unpack_ints(buffer, offset, count):
+    """Inverse of _pack_ints; returns (int64 array, offset after it)."""
+    size = buffer[offset]
+    offset += 1
+    values = np.frombuffer(buffer, dtype=f"<i{size}", count=count, offset=offset).astype(np.int64)
+    return values, offset + size * count
+
+
+def _slot_grid(counts):
+    """
+    Positions of a block's objects in a (frames, max objects) grid, plus whether the same
+    slot was filled in the previous frame (the reference an object is delta-coded against).
+    """
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    frame_of_object = np.repeat(np.arange(len(counts)), counts)
+    slot = np.arange(offsets[-1]) - offsets[frame_of_object]
+    has_previous = (frame_of_object > 0) & (slot < counts[np.maximum(frame_of_object - 1, 0)])
+    return frame_of_object, slot, has_previous
+
+
+def _encode_block(frames):
+    counts = np.array([len(frame.get("obj", [])) for frame in frames], dtype=np.int64)
+    frame_index = np.array([frame["fr"] for frame in frames], dtype=np.int64)
+    objects = [obj for frame in frames for obj in frame.get("obj", [])]
+
+    flags = np.zeros(len(objects), dtype=np.int64)
+    values = np.zeros((len(objects), 6), dtype=np.float64)  # bbox (4) and t_c (2)
+    for i, obj in enumerate(objects):
+        src = obj.get("src")
+        flags[i] = src if src in (0, 1) else SRC_NONE
+        values[i, :4] = obj["bbox"]
+        if obj.get("t_c") is not None:
+            flags[i] |= HAS_TC
+            values[i, 4:] = obj["t_c"]
+    quantized = np.rint(values * SCALE).astype(np.int64)
+
+    # Delta-code each object against the same slot of the previous frame
+    frame_of_object, slot, has_previous = _slot_grid(counts)
+    grid = np.zeros((len(frames), counts.max(initial=0), 6), dtype=np.int64)
+    grid[frame_of_object, slot] = quantized
+    deltas = quantized.copy()
+    deltas[has_previous] -= grid[frame_of_object[has_previous] - 1, slot[has_previous]]
+
+    frame_deltas = np.diff(frame_index, prepend=0)
+    payload = (struct.pack("<II", len(frames), len(objects)) + _pack_ints(frame_deltas) + _pack_ints(counts)
+               + _pack_ints(flags) + _pack_ints(deltas.ravel()))
+    return zlib.compress(payload, 9)
+
+
+def _decode_block(payload):
+    buffer = zlib.decompress(payload)
+    num_frames, num_objects = struct.unpack_from("<II", buffer)
+    offset = struct.calcsize("<II")
+    frame_deltas, offset = _unpack_ints(buffer, offset, num_frames)
+    counts, offset = _unpack_ints(buffer, offset, num_frames)
+    flags, offset = _unpack_ints(buffer, offset, num_objects)
+    deltas, offset = _unpack_ints(buffer, offset, num_objects * 6)
+    deltas = deltas.reshape(-1, 6)
+
+    # Undo the slot deltas: a running sum down each slot, restarted wherever a chain begins
+    frame_of_object, slot, has_previous = _slot_grid(counts)
+    grid = np.zeros((num_frames, counts.max(initial=0), 6), dtype=np.int64)
+    grid[frame_of_object, slot] = deltas
+    running = np.cumsum(grid, axis=0)
+    chain_start = np.zeros(grid.shape[:2], dtype=np.int64)
+    chain_start[frame_of_object[~has_previous], slot[~has_previous]] = frame_of_object[~has_previous]
+    chain_start = np.maximum.accumulate(chain_start, axis=0)
+    before_chain = np.where((chain_start > 0)[..., None],
+                            running[np.maximum(chain_start - 1, 0), np.arange(grid.shape[1])], 0)
+    values = ((running - before_chain)[frame_of_object, slot] / SCALE).tolist()
+
+    frame_index = np.cumsum(frame_deltas).tolist()
+    flags = flags.tolist()
+    frames = []
+    position = 0
+    for fr, count in zip(frame_index, counts.tolist()):
+        objects = []
+        for i in range(position, position + count):
+            obj = {"bbox": values[i][:4]}
+            if flags[i] & SRC_MASK != SRC_NONE:
+                obj["src"] = flags[i] & SRC_MASK
+            if flags[i] & HAS_TC:
+                obj["t_c"] = values[i][4:]
+            objects.append(obj)
+        frames.append({"fr": fr, "obj": objects})
+        position += count
+    return frames
+
+
+def encode_match(data, block_frames=BLOCK_FRAMES):
+    """
+    Encode jsoncompress output ({"metadata", "frames"} with "fr"/"obj" frames) as bytes.
+
+    Layout: MAGIC, version, a length-prefixed JSON header (metadata, frame count, scale) and
+    length-prefixed zlib blocks of block_frames frames. Inside a block, "bbox" and "t_c" are
+    fixed-point integers delta-coded against the same object slot of the previous frame and
+    stored column by column with the narrowest integer type that fits. Objects keep only
+    "bbox", "src" (0/1) and "t_c", the fields jsoncompress leaves in place.
+    """
+    frames = data.get("frames", [])
+    header = json.dumps({
+        "metadata": data.get("metadata", {}),
+        "frame_count": len(frames),
+        "scale": SCALE,
+    }, separators=(",", ":")).encode()
+
+    out = io.BytesIO()
+    out.write(MAGIC + struct.pack("<BI", VERSION, len(header)) + header)
+    for start in range(0, len(frames), block_frames):
+        block = _encode_block(frames[start:start + block_frames])
+        out.write(struct.pack("<I", len(block)) + block)
+    return out.getvalue()
+
+
+def write_match(data, path, block_frames=BLOCK_FRAMES):
+    with open(path, "wb") as f:
+        f.write(encode_match(data, block_frames))
+
+
+def read_header(f):
+    """Read and check the header of an open binary match file; returns the header dict."""
+    magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError("Not a binary match file.")
+    version, header_length = struct.unpack("<BI", f.read(struct.calcsize("<BI")))
+    if version != VERSION:
+        raise ValueError(f"Unsupported binary match version {version}.")
+    header = json.loads(f.read(header_length))
+    if header["scale"] != SCALE:
+        raise ValueError(f"Unsupported fixed-point scale {header['scale']}.")
+    return header
+
+
+def iter_match_frames(path):
+    """
+    Stream the frames of a binary match file, decoding one block at a time.
+    Frames look like the jsoncompress output frames.
+    """
+    with open(path, "rb") as f:
+        read_header(f)
+        while True:
+            length = f.read(4)
+            if not length:
+                break
+            (block_length,) = struct.unpack("<I", length)
+            for frame in _decode_block(f.read(block_length)):
+                yield frame
+
+
+def read_match(path):
+    """Decode a whole binary match file back to {"metadata", "frames"}."""
+    with open(path, "rb") as f:
+        metadata = read_header(f)["metadata"]
+    return {"metadata": metadata, "frames": list(iter_match_frames(path))}
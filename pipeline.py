@@ -0,0 +1,533 @@
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+
+import ENTRY_YOLO_merge
+import filterjson2
+import adjust2Dmerged
+import bos
+import unifyforbytetrack
+import filterjson3
+import ioudelete
+import jsoncompress
+import match_codec
+import homography
+from detection_store import read_frames, write_frames
+from instrumentation import RunReport, configure_progress, stage_scope
+from stage_cache import StageCache, DEFAULT_MAX_BYTES, hash_value, module_digest
+
+CHECKPOINT_MANIFEST = "manifest.json"
+
+SHARD_MIN_FRAMES = 250  # Smaller frame shards cost more to send to a worker than they save
+SHARDS_PER_WORKER = 4  # Several shards per worker even out frames with more or fewer objects
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    """
+    Tunable values of the post-YOLO stages. Defaults are the stage modules' constants; the
+    stages read their values from the config passed to run_stages, never from the modules,
+    so runs with different configs can share one process. Use replace() to derive a variant.
+    """
+    colors: dict = field(default_factory=lambda: dict(ENTRY_YOLO_merge.COLORS))
+    frame_width: int = 400
+    frame_height: int = 300
+    offset: int = filterjson2.OFFSET
+    distance_threshold: float = filterjson2.N
+    assignment: str = filterjson2.ASSIGNMENT
+    border_width: int = filterjson3.VIDEO_WIDTH
+    border_height: int = filterjson3.VIDEO_HEIGHT
+    border_threshold: float = filterjson3.BORDER_THRESHOLD
+    iou_threshold: float = ioudelete.IOU_THRESHOLD
+    iou_method: str = ioudelete.IOU_METHOD
+    group1_colors: frozenset = frozenset(ioudelete.GROUP1_COLORS)
+    group2_colors: frozenset = frozenset(ioudelete.GROUP2_COLORS)
+    block_frames: int = match_codec.BLOCK_FRAMES
+
+    def replace(self, **changes):
+        return replace(self, **changes)
+
+
+class Stage:
+    """
+    One node of the pipeline graph.
+    - func is called with the artifacts named in inputs (in order), plus the keyword
+      arguments from params, and returns the artifacts named in outputs (a tuple when
+      there is more than one).
+    - params: callable taking a PipelineConfig and returning the keyword arguments the stage
+      needs from it, and modules: the modules whose code it runs; both are part of its cache key,
+      as is this module, which holds the stage adapters and the frame sharding.
+    - frame_inputs: inputs that are frame lists the stage handles one frame at a time, with
+      every output a frame list as well; such stages can run in frame shards (see run_sharded).
+    """
+
+    def __init__(self, name, func, inputs, outputs, params=None, modules=(), frame_inputs=()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.params = params or (lambda config: {})
+        self.modules = tuple(modules)
+        self.frame_inputs = tuple(frame_inputs)
+
+    def cache_key(self, digests, config):
+        """Digest of everything the outputs depend on, or None if an input has no digest."""
+        if any(name not in digests for name in self.inputs):
+            return None
+        return hash_value(
+            self.name, self.params(config), [module_digest(module) for module in self.modules],
+            module_digest(sys.modules[__name__]), [digests[name] for name in self.inputs],
+        )
+
+    def run(self, artifacts, config, pool=None, workers=1):
+        """Run func on the inputs; with a pool, stages with frame_inputs run in frame shards on it."""
+        missing = [name for name in self.inputs if name not in artifacts]
+        if missing:
+            raise KeyError(f"Stage '{self.name}' is missing inputs: {', '.join(missing)}")
+        if pool is not None and self.frame_inputs:
+            result = run_sharded(self, artifacts, self.params(config), pool, workers)
+        else:
+            result = self.func(*(artifacts[name] for name in self.inputs), **self.params(config))
+        if len(self.outputs) == 0:
+            return {}
+        if len(self.outputs) == 1:
+            result = (result,)
+        return dict(zip(self.outputs, result))
+
+
+def frame_shards(frame_lists, shards):
+    """
+    Split frame lists into at most shards pieces along frame_index: piece k of every list
+    covers the same frame_index range, and the ranges hold about equally many frames.
+    Returns a list of pieces, each a list with one slice per frame list, or None if a frame
+    list is not sorted by frame_index.
+    """
+    keys = [[frame["frame_index"] for frame in frames] for frames in frame_lists]
+    if any(a > b for frame_keys in keys for a, b in zip(frame_keys, frame_keys[1:])):
+        return None
+    indices = sorted(set().union(*keys))
+    step = -(-len(indices) // shards)  # Ceiling division
+    starts = indices[step::step]  # First frame_index of every piece after the first
+    cuts = [[0] + [bisect_left(frame_keys, start) for start in starts] + [len(frame_keys)] for frame_keys in keys]
+    return [
+        [frames[frame_cuts[piece]:frame_cuts[piece + 1]] for frames, frame_cuts in zip(frame_lists, cuts)]
+        for piece in range(len(starts) + 1)
+    ]
+
+
+def _init_shard_worker():
+    # Shards would print partial summaries and draw one progress bar each
+    configure_progress(enabled=False)
+    sys.stdout = open(os.devnull, "w")
+
+
+def _run_shard(func, args, kwargs):
+    return func(*args, **kwargs)
+
+
+@contextmanager
+def shard_pool(workers):
+    """Process pool for run_sharded, or None when workers is 1 (stages run in this process)."""
+    if workers <= 1:
+        yield None
+        return
+    # spawn, like bos's warp workers, so no OpenCV or tqdm state is forked into the workers
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_shard_worker) as pool:
+        yield pool
+
+
+def run_sharded(stage, artifacts, params, pool, workers):
+    """
+    Run a stage with frame_inputs on consecutive frame shards in pool, and join the shards'
+    outputs in frame order. Since the stage handles every frame on its own, the result equals
+    stage.func on the whole match; unlike it, the input artifacts are not modified, and the
+    stage's printed summaries are dropped. Matches too short for two shards of
+    SHARD_MIN_FRAMES frames run in this process.
+    """
+    frame_lists = [artifacts[name] for name in stage.frame_inputs]
+    num_frames = len({frame["frame_index"] for frames in frame_lists for frame in frames})
+    shards = min(workers * SHARDS_PER_WORKER, num_frames // SHARD_MIN_FRAMES)
+    pieces = frame_shards(frame_lists, shards) if shards > 1 else None
+    if pieces is None:
+        return stage.func(*(artifacts[name] for name in stage.inputs), **params)
+
+    print(f"Stage '{stage.name}' split into {len(pieces)} frame shards")
+    futures = []
+    for piece in pieces:
+        shard = dict(artifacts, **dict(zip(stage.frame_inputs, piece)))
+        futures.append(pool.submit(_run_shard, stage.func, [shard[name] for name in stage.inputs], params))
+    results = [future.result() for future in futures]
+    if len(stage.outputs) == 1:
+        return [frame for result in results for frame in result]
+    return tuple([frame for result in results for frame in result[output]] for output in range(len(stage.outputs)))
+
+
+def _path(directory, file_name):
+    return os.path.join(directory, file_name) if directory else file_name
+
+
+def calibration_files(directory=None):
+    """dimensions.txt and the two homography matrices, in directory (default: working directory)."""
+    return [_path(directory, file_name) for file_name in (
+        ENTRY_YOLO_merge.DIMENSIONS_FILE, ENTRY_YOLO_merge.HOMOGRAPHY_MATRIX_LEFT,
+        ENTRY_YOLO_merge.HOMOGRAPHY_MATRIX_RIGHT,
+    )]
+
+
+def load_calibration(directory=None):
+    """Load blue lines and homography matrices used by every geometry stage."""
+    blue_line_right, _, blue_line_left, _, homography_left, homography_right = \
+        ENTRY_YOLO_merge.load_dimensions_and_homographies(*calibration_files(directory))
+    return {
+        "blue_line_left": blue_line_left,
+        "blue_line_right": blue_line_right,
+        "homography_left": homography_left,
+        "homography_right": homography_right,
+    }
+
+
+def input_digests(cache, directory=None):
+    """Content digests of the files load_calibration and load_detections read."""
+    return {
+        "calibration": hash_value([cache.hash_file(path) for path in calibration_files(directory)]),
+        "right_detections": cache.hash_file(_path(directory, ENTRY_YOLO_merge.TRACKING_DATA_RIGHT)),
+        "left_detections": cache.hash_file(_path(directory, ENTRY_YOLO_merge.TRACKING_DATA_LEFT)),
+    }
+
+
+def load_detections(directory=None):
+    """Load the YOLO outputs the first stage consumes."""
+    return {
+        "right_detections": read_frames(_path(directory, ENTRY_YOLO_merge.TRACKING_DATA_RIGHT)),
+        "left_detections": read_frames(_path(directory, ENTRY_YOLO_merge.TRACKING_DATA_LEFT)),
+    }
+
+
+def _merge(right_detections, left_detections, calibration, colors, frame_width, frame_height):
+    return ENTRY_YOLO_merge.split_intersections(
+        right_detections, left_detections, calibration["blue_line_right"], calibration["blue_line_left"],
+        calibration["homography_left"], calibration["homography_right"], frame_width, frame_height, colors
+    )
+
+
+def _compare(left_intersections, right_intersections, calibration, offset, threshold, assignment):
+    return filterjson2.compare_and_filter_objects(
+        left_intersections, right_intersections, calibration["homography_left"], calibration["homography_right"],
+        offset, threshold, assignment
+    )
+
+
+def _adjust(filtered_left_intersections, filtered_right_intersections, calibration):
+    return adjust2Dmerged.adjust_intersections(
+        filtered_left_intersections, filtered_right_intersections, calibration["blue_line_left"],
+        calibration["blue_line_right"], calibration["homography_left"], calibration["homography_right"]
+    )
+
+
+def _unify(new_left_intersections, left_non_intersections, new_right_intersections, right_non_intersections, calibration):
+    sources = [
+        ("new_left_intersections", new_left_intersections, "left"),
+        ("left_non_intersections", left_non_intersections, "left"),
+        ("new_right_intersections", new_right_intersections, "right"),
+        ("right_non_intersections", right_non_intersections, "right"),
+    ]
+    return unifyforbytetrack.merge_frames(sources, calibration["homography_left"], calibration["homography_right"])
+
+
+STAGES = [
+    Stage("merge", _merge, ["right_detections", "left_detections", "calibration"],
+          ["right_intersections", "right_non_intersections", "left_intersections", "left_non_intersections"],
+          params=lambda config: {"colors": config.colors, "frame_width": config.frame_width,
+                                 "frame_height": config.frame_height},
+          modules=[ENTRY_YOLO_merge, homography], frame_inputs=["right_detections", "left_detections"]),
+    Stage("filterjson2", _compare, ["left_intersections", "right_intersections", "calibration"],
+          ["filtered_left_intersections", "filtered_right_intersections"],
+          params=lambda config: {"offset": config.offset, "threshold": config.distance_threshold,
+                                 "assignment": config.assignment},
+          modules=[filterjson2, homography], frame_inputs=["left_intersections", "right_intersections"]),
+    Stage("adjust2Dmerged", _adjust, ["filtered_left_intersections", "filtered_right_intersections", "calibration"],
+          ["new_left_intersections", "new_right_intersections"], modules=[adjust2Dmerged, homography]),
+    Stage("unifyforbytetrack", _unify,
+          ["new_left_intersections", "left_non_intersections", "new_right_intersections", "right_non_intersections", "calibration"],
+          ["merged"], modules=[unifyforbytetrack, homography]),
+    Stage("filterjson3", filterjson3.filter_frames_by_border, ["merged"], ["border_filtered"],
+          params=lambda config: {"width": config.border_width, "height": config.border_height,
+                                 "threshold": config.border_threshold},
+          modules=[filterjson3], frame_inputs=["merged"]),
+    Stage("ioudelete", ioudelete.remove_low_conf_frames, ["border_filtered"], ["final"],
+          params=lambda config: {"iou_threshold": config.iou_threshold, "method": config.iou_method,
+                                 "group1": config.group1_colors, "group2": config.group2_colors},
+          modules=[ioudelete], frame_inputs=["border_filtered"]),
+    Stage("jsoncompress", jsoncompress.compress_frames, ["final"], ["compressed"], modules=[jsoncompress]),
+    Stage("match_codec", match_codec.encode_match, ["compressed"], ["compressed_binary"],
+          params=lambda config: {"block_frames": config.block_frames}, modules=[match_codec]),
+]
+
+# Optional stage rendering the bird's-eye videos; it has no in-memory outputs
+VIDEO_STAGE = Stage("bos", bos.main, [], [])
+
+# File each artifact was written to when every stage was a separate script
+OUTPUT_FILES = {
+    "right_intersections": ENTRY_YOLO_merge.OUTPUT_RIGHT_JSON,
+    "right_non_intersections": ENTRY_YOLO_merge.OUTPUT_RIGHT_NON_INTERSECTIONS_JSON,
+    "left_intersections": ENTRY_YOLO_merge.OUTPUT_LEFT_JSON,
+    "left_non_intersections": ENTRY_YOLO_merge.OUTPUT_LEFT_NON_INTERSECTIONS_JSON,
+    "filtered_left_intersections": filterjson2.OUTPUT_LEFT_JSON,
+    "filtered_right_intersections": filterjson2.OUTPUT_RIGHT_JSON,
+    "new_left_intersections": adjust2Dmerged.NEW_JSON_LEFT_INTERSECTION,
+    "new_right_intersections": adjust2Dmerged.NEW_JSON_RIGHT_INTERSECTION,
+    "merged": unifyforbytetrack.OUTPUT_JSON,
+    "border_filtered": filterjson3.OUTPUT_JSON_FILE,
+    "final": "95_final.json",
+    "compressed": "95_iou_compressed.json",
+    "compressed_binary": "95_iou_compressed.bin",
+}
+
+# ioudelete and jsoncompress wrote with indent=4, every other stage with indent=2
+OUTPUT_INDENT = {"final": 4, "compressed": 4}
+
+# Artifacts that leave the host (uploaded or handed to the client)
+FINAL_OUTPUTS = [
+    "right_intersections", "right_non_intersections", "left_intersections", "left_non_intersections", "compressed",
+    "compressed_binary",
+]
+
+
+def default_stages(with_video=False):
+    """The stage graph in execution order, optionally with the video stage after adjust2Dmerged."""
+    if not with_video:
+        return list(STAGES)
+    position = [stage.name for stage in STAGES].index("adjust2Dmerged") + 1
+    return STAGES[:position] + [VIDEO_STAGE] + STAGES[position:]
+
+
+def write_artifact(name, value, output_dir=None):
+    """Write an artifact to its OUTPUT_FILES path (in output_dir) the way the stage scripts did."""
+    path = _path(output_dir, OUTPUT_FILES[name])
+    if isinstance(value, bytes):
+        with open(path, "wb") as f:
+            f.write(value)
+    elif isinstance(value, list):
+        write_frames(value, path, indent=OUTPUT_INDENT.get(name, 2))
+    else:
+        with open(path, "w") as f:
+            json.dump(value, f, indent=OUTPUT_INDENT.get(name, 2))
+
+
+def needed_after(stages, index):
+    """Artifacts still read by stages after stages[index]."""
+    return {name for stage in stages[index + 1:] for name in stage.inputs}
+
+
+def save_checkpoint(checkpoint_dir, stages, index, artifacts):
+    """Persist every artifact later stages need, then record stages[:index + 1] as completed."""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    keep = {name: artifacts[name] for name in needed_after(stages, index) if name in artifacts}
+    checkpoint_file = f"{index:02d}_{stages[index].name}.pkl"
+
+    # Write to a temporary file first so a crash never leaves a half-written checkpoint
+    tmp_path = os.path.join(checkpoint_dir, checkpoint_file + ".tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(keep, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, os.path.join(checkpoint_dir, checkpoint_file))
+
+    manifest = {"completed": [stage.name for stage in stages[:index + 1]], "checkpoint": checkpoint_file}
+    tmp_path = os.path.join(checkpoint_dir, CHECKPOINT_MANIFEST + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(checkpoint_dir, CHECKPOINT_MANIFEST))
+
+    # Only the newest checkpoint is ever resumed from
+    for file_name in os.listdir(checkpoint_dir):
+        if file_name.endswith(".pkl") and file_name != checkpoint_file:
+            os.remove(os.path.join(checkpoint_dir, file_name))
+
+
+def load_checkpoint(checkpoint_dir, stages):
+    """
+    Return (number of completed stages, saved artifacts) from the last checkpoint,
+    or (0, {}) if there is none.
+    """
+    manifest_path = os.path.join(checkpoint_dir, CHECKPOINT_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return 0, {}
+
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    completed = manifest["completed"]
+    if completed != [stage.name for stage in stages[:len(completed)]]:
+        raise ValueError(f"Checkpoint in '{checkpoint_dir}' was made by a different stage graph: {completed}")
+
+    with open(os.path.join(checkpoint_dir, manifest["checkpoint"]), "rb") as f:
+        return len(completed), pickle.load(f)
+
+
+def run_stage_cached(stage, artifacts, cache, digests, config, record=None, pool=None, workers=1):
+    """
+    Run a stage, or load its outputs from cache if its inputs, parameters and code are unchanged.
+    Adds the digests of the outputs to digests; without input digests the stage just runs.
+    - record: StageRecord told whether the outputs came from the cache.
+    - pool / workers: shard_pool the stage runs in frame shards on, if it has frame_inputs.
+    """
+    key = stage.cache_key(digests, config) if cache is not None and stage.outputs else None
+    if key is None:
+        return stage.run(artifacts, config, pool, workers)
+
+    hit, produced = cache.get_value(key)
+    if record is not None:
+        record["cached"] = hit
+    if hit:
+        print(f"Stage '{stage.name}' inputs unchanged, using cached outputs")
+    else:
+        produced = stage.run(artifacts, config, pool, workers)
+        cache.put_value(key, produced)
+    for name in produced:
+        digests[name] = hash_value(key, name)
+    return produced
+
+
+def run_stages(stages, artifacts, save_outputs=None, checkpoint_dir=None, checkpoint_stages=None, resume=False,
+               cache=None, digests=None, config=None, output_dir=None, keep_outputs=(), report=None, workers=1):
+    """
+    Run stages in order, passing artifacts in memory.
+    - save_outputs: artifact names written to their OUTPUT_FILES path as soon as they are produced.
+    - checkpoint_dir: if set, checkpoint after each stage (or only after checkpoint_stages).
+    - resume: skip the stages recorded in checkpoint_dir and continue from their saved artifacts.
+    - cache / digests: a StageCache and content digests of the initial artifacts; stages whose
+      inputs have digests are looked up in the cache before running.
+    - config: the PipelineConfig the stages take their parameters from (default values if None).
+    - output_dir: directory save_outputs are written to (default: working directory).
+    - keep_outputs: artifact names returned even if an earlier stage produced them; they are
+      copied when later stages still read them, since those may modify objects in place.
+    - report: RunReport each stage (including its output files and checkpoint) is measured into.
+    - workers: processes the per-frame stages (merge, filterjson2, filterjson3, ioudelete) are
+      spread over in frame shards; the outputs are identical to a run with workers=1.
+    Returns the artifacts dict after the last stage, plus keep_outputs.
+    """
+    save_outputs = set(FINAL_OUTPUTS if save_outputs is None else save_outputs)
+    config = config or PipelineConfig()
+    artifacts = dict(artifacts)
+    digests = dict(digests or {})
+    kept = {}
+    start = 0
+
+    if resume and checkpoint_dir:
+        start, saved = load_checkpoint(checkpoint_dir, stages)
+        artifacts.update(saved)
+        if start:
+            print(f"Resuming after stage '{stages[start - 1].name}' ({start}/{len(stages)} completed)")
+
+    with shard_pool(workers if any(stage.frame_inputs for stage in stages[start:]) else 1) as pool:
+        for index in range(start, len(stages)):
+            stage = stages[index]
+            print(f"Running stage '{stage.name}'...")
+            # Inputs are counted before the stage runs, since stages may modify them in place
+            with stage_scope(report, stage.name, [artifacts.get(name) for name in stage.inputs]) as record:
+                produced = run_stage_cached(stage, artifacts, cache, digests, config, record, pool, workers)
+                artifacts.update(produced)
+                if record is not None:
+                    record.outputs(produced.values())
+
+                # Save requested outputs now; later stages may modify objects in place
+                still_needed = needed_after(stages, index)
+                for name, value in produced.items():
+                    if name in save_outputs:
+                        write_artifact(name, value, output_dir)
+                        print(f"{name} saved to {_path(output_dir, OUTPUT_FILES[name])}")
+                    if name in keep_outputs:
+                        kept[name] = copy.deepcopy(value) if name in still_needed else value
+
+                if checkpoint_dir and (checkpoint_stages is None or stage.name in checkpoint_stages):
+                    save_checkpoint(checkpoint_dir, stages, index, artifacts)
+
+            # Drop artifacts no later stage reads so memory does not grow with the graph
+            if index < len(stages) - 1:
+                for name in [name for name in artifacts if name not in still_needed]:
+                    del artifacts[name]
+
+    print("✅ All stages completed")
+    artifacts.update(kept)
+    return artifacts
+
+
+def process_match(calibration, right_detections, left_detections, config=None, outputs=FINAL_OUTPUTS,
+                  cache=None, digests=None, report=None, workers=1):
+    """
+    Run every post-YOLO stage on one match held in memory and return {name: artifact} for
+    outputs, without touching the working directory. Safe to call from several threads at
+    once: nothing is read from or written to module state.
+    - calibration: as returned by load_calibration.
+    - right_detections / left_detections: frames as read by detection_store.read_frames; the
+      lists are modified in place.
+    - workers: processes for the per-frame stages (see run_stages).
+    """
+    artifacts = {"calibration": calibration, "right_detections": right_detections,
+                 "left_detections": left_detections}
+    produced = run_stages(STAGES, artifacts, save_outputs=(), cache=cache, digests=digests, config=config,
+                          keep_outputs=outputs, report=report, workers=workers)
+    return {name: produced[name] for name in outputs}
+
+
+def run_default_pipeline(checkpoint_dir=None, checkpoint_stages=None, resume=False, save_all=False, with_video=False,
+                         cache_dir=None, cache_bytes=DEFAULT_MAX_BYTES, config=None, directory=None, report=None,
+                         workers=1):
+    """
+    Load the detection files and calibration from directory (default: working directory),
+    run every stage and write the outputs next to them.
+    - cache_dir: reuse the outputs of stages whose inputs did not change since an earlier run.
+    - config: the PipelineConfig to run with (default values if None).
+    - report: RunReport the stages are measured into.
+    - workers: processes for the per-frame stages (see run_stages).
+    """
+    stages = default_stages(with_video)
+    if with_video and directory:
+        raise ValueError("The video stage reads and writes the working directory; run it without directory")
+    cache = StageCache(cache_dir, cache_bytes) if cache_dir else None
+    digests = None
+    if resume and checkpoint_dir and os.path.exists(os.path.join(checkpoint_dir, CHECKPOINT_MANIFEST)):
+        artifacts = {}  # Everything the remaining stages need is in the checkpoint
+    else:
+        artifacts = {"calibration": load_calibration(directory), **load_detections(directory)}
+        digests = input_digests(cache, directory) if cache else None
+    save_outputs = OUTPUT_FILES.keys() if save_all else None
+    return run_stages(stages, artifacts, save_outputs, checkpoint_dir, checkpoint_stages, resume, cache, digests,
+                      config, directory, report=report, workers=workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the post-YOLO stages in one process.")
+    parser.add_argument("--checkpoint-dir", help="Directory for stage checkpoints (disabled if omitted)")
+    parser.add_argument("--checkpoint-stages", help="Comma-separated stage names to checkpoint after (default: all)")
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint in --checkpoint-dir")
+    parser.add_argument("--save-all", action="store_true", help="Also write every intermediate JSON")
+    parser.add_argument("--with-video", action="store_true", help="Run the bos video stage as well")
+    parser.add_argument("--cache-dir", help="Stage cache directory; unchanged stages are skipped (disabled if omitted)")
+    parser.add_argument("--cache-gb", type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3, help="Stage cache size limit")
+    parser.add_argument("--report-file", help="Write a JSON report of per-stage time, memory, counts and I/O here")
+    parser.add_argument("--profile", action="store_true", help="Add sampled hot functions of every stage to the report")
+    parser.add_argument("--no-progress", action="store_true", help="Disable progress bars (headless runs)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes the per-frame stages run on in frame shards (output is unchanged)")
+    args = parser.parse_args(argv)
+
+    if args.no_progress:
+        configure_progress(enabled=False)
+    report = RunReport(profile=args.profile) if args.report_file or args.profile else None
+    checkpoint_stages = set(args.checkpoint_stages.split(",")) if args.checkpoint_stages else None
+    run_default_pipeline(args.checkpoint_dir, checkpoint_stages, args.resume, args.save_all, args.with_video,
+                         args.cache_dir, int(args.cache_gb * 1024 ** 3), report=report, workers=args.workers)
+    if report:
+        print(f"Run report saved to {report.write(args.report_file or 'run_report.json')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+
+PITCH_WIDTH = 400  # Transformed (bird's-eye) frame the homographies map onto
+PITCH_HEIGHT = 300
+ROI_MARGIN = 0.1  # Share of the frame height the pitch polygon is grown by, for bodies above feet on its edge
+MASK_VALUE = 114  # Grey YOLO pads letterboxed images with, so masked pixels look like padding
+
+ROI_MODES = ("crop", "mask")
+
+
+def pitch_polygon(homography_matrix, pitch_width=PITCH_WIDTH, pitch_height=PITCH_HEIGHT):
+    """
+    Camera-image corners of the pitch rectangle, through the inverse homography, as a (4, 2)
+    array; None if the rectangle reaches behind the camera (its image is then no quadrilateral).
+    """
+    corners = np.array([[0, 0, 1], [pitch_width, 0, 1], [pitch_width, pitch_height, 1], [0, pitch_height, 1]],
+                       dtype=np.float64)
+    projected = corners @ np.linalg.inv(homography_matrix).T
+    w = projected[:, 2]
+    if not (np.all(w > 0) or np.all(w < 0)):
+        return None
+    return projected[:, :2] / w[:, None]
+
+
+class PitchROI:
+    """
+    Part of a camera's frames where players on the pitch can appear: the pitch polygon grown by
+    margin * frame height pixels, computed once per camera from its homography.
+    - box: (x1, y1, x2, y2) of the crop, the bounding box of the grown polygon within the frame.
+    - mask: with mask=True, pixels of the crop outside the grown polygon are set to MASK_VALUE.
+    apply() turns a frame into what YOLO sees; boxes found in it are moved back by box[:2].
+    If the pitch is not visible or its image is no quadrilateral, the whole frame is used.
+    """
+
+    def __init__(self, homography_matrix, frame_width, frame_height, mask=False, margin=ROI_MARGIN):
+        self.box = (0, 0, frame_width, frame_height)
+        self.mask = None
+        polygon = pitch_polygon(homography_matrix)
+        if polygon is None:
+            return
+
+        region = np.zeros((frame_height, frame_width), dtype=np.uint8)
+        cv2.fillPoly(region, [np.round(polygon).astype(np.int32)], 255)
+        grow = round(margin * frame_height)
+        if grow > 0:
+            region = cv2.dilate(region, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * grow + 1, 2 * grow + 1)))
+        x, y, width, height = cv2.boundingRect(region)
+        if width == 0 or height == 0:
+            return
+
+        self.box = (x, y, x + width, y + height)
+        if mask:
+            self.mask = region[y:y + height, x:x + width]
+            self._background = np.full((height, width, 3), MASK_VALUE, dtype=np.uint8)
+
+    @property
+    def offset(self):
+        return self.box[0], self.box[1]
+
+    def pixel_share(self, frame_width, frame_height):
+        """Share of the frame's pixels YOLO still gets (the masked ones included)."""
+        x1, y1, x2, y2 = self.box
+        return (x2 - x1) * (y2 - y1) / (frame_width * frame_height)
+
+    def apply(self, frame):
+        x1, y1, x2, y2 = self.box
+        crop = frame[y1:y2, x1:x2]
+        if self.mask is None:
+            return crop
+        return cv2.copyTo(crop, self.mask, self._background.copy())
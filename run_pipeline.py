@@ -1,66 +1,326 @@
 import os
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 # Import our backblaze functions from our package
-from backblaze_sdk import download_file, upload_json
+from backblaze_sdk import download_file
 
 # Import your YOLO detection functions (assumed to be in the same folder)
 from save_yolo_left import save_yolo_left
 from save_yolo_right import save_yolo_right
 
-# Import the merge function from ENTRY_YOLO_merge.py (make sure it is defined there)
-import ENTRY_YOLO_merge as merge_module
+# Import the in-process stage runner (ENTRY_YOLO_merge through jsoncompress)
+import pipeline
+import pitch_roi
+import yolo_detection
+from stage_cache import StageCache, DEFAULT_MAX_BYTES, hash_value, module_digest
+from video_download import HttpRangeSource, LocalFileSource, fetch_video
+from artifact_upload import BackblazeBackend, LocalDirectoryBackend, upload_files
+from instrumentation import RunReport, configure_progress, measure, measure_call
 
-def run_pipeline(match_id: str, device: str = "cpu"):
+# Cameras processed by the pipeline: (name, remote/local video file, detection output, detection function)
+CAMERAS = [
+    ("left", "left_video.mp4", "left5shifted.jsonl", save_yolo_left),
+    ("right", "right_video.mp4", "right5.jsonl", save_yolo_right),
+]
+
+MODEL_FILE = "model.pt"  # YOLO weights the save_yolo_* functions load
+
+# Homography matrix each camera's pitch ROI is computed from, next to its video
+CAMERA_HOMOGRAPHIES = {"left": "al2_homography_matrix.txt", "right": "al1_homography_matrix.txt"}
+RUN_REPORT_FILE = "run_report.json"  # Per-stage time, memory, counts and I/O of the last run
+
+# Outputs uploaded back to the match folder
+FINAL_JSONS = [
+    "right_intersections.json",
+    "right_non_intersections.json",
+    "left_intersections.json",
+    "left_non_intersections.json"
+]
+
+def detection_cache_key(cache, video_file, device, detection_options, homography_file=None):
+    """
+    Cache key of a camera's detections: video bytes, model weights, inference settings and code,
+    plus the camera's homography matrix when a pitch ROI is used.
+    """
+    parts = ["yolo", cache.hash_file(video_file), cache.hash_file(MODEL_FILE), device, detection_options,
+             module_digest(yolo_detection)]
+    if detection_options.get("roi"):
+        parts += [cache.hash_file(homography_file), module_digest(pitch_roi)]
+    return hash_value(*parts)
+
+def restore_detections(cache, name, video_file, output_file, device, detection_options):
+    """
+    Copy cached detections for an unchanged video/model/settings to output_file.
+    Returns (restored, key): key is where fresh detections should be stored (None without a cache).
+    """
+    if cache is None:
+        return False, None
+    homography_file = os.path.join(os.path.dirname(video_file), CAMERA_HOMOGRAPHIES[name])
+    key = detection_cache_key(cache, video_file, device, detection_options, homography_file)
+    if cache.get_files(key, {"detections": output_file}):
+        print(f"{name} video unchanged, reusing cached detections in {output_file}")
+        return True, key
+    return False, key
+
+def lookup_detections(cache, name, video_file, output_file, device, detection_options, report=None):
+    """restore_detections, recorded in report as a cached save_yolo_{name} stage when it hits."""
+    with measure(f"save_yolo_{name}") as record:
+        restored, key = restore_detections(cache, name, video_file, output_file, device, detection_options)
+    if restored and report is not None:
+        record["cached"] = True
+        report.add(record.values)
+    return restored, key
+
+def add_detection_record(report, measured):
+    """Add the (stats, values) of a measure_call around a save_yolo_* function to report."""
+    stats, values = measured
+    values["outputs"] = {"frames": stats["frames"], "objects": stats["objects"]}
+    values["detection"] = {key: stats[key] for key in ("seconds", "fps", "decode", "roi")}
+    if report is not None:
+        report.add(values)
+
+def fetch_match_video(match_id, video_file, video_source=None, cache=None, local_path=None):
+    """
+    Put a match video at local_path (default: video_file in the working directory), returning
+    a download_file-style result ({"error": ...} on failure).
+    - video_source: an HttpRangeSource / LocalFileSource for parallel, resumable, checksummed
+      range downloads; None uses backblaze_sdk's single whole-file download_file.
+    - cache: keep videos fetched from a video_source that reports their SHA-1, keyed by their
+      remote size and checksum, so a rerun of the same match copies them instead. Whole-file
+      downloads and videos without a remote SHA-1 are not cached: a re-uploaded video could
+      not be told from the cached one.
+    """
+    local_path = local_path or video_file
+    if video_source is not None:
+        try:
+            result = fetch_video(video_source, match_id, video_file, local_path, cache)
+        except OSError as error:  # Includes urllib's HTTP and connection errors
+            return {"error": str(error)}
+        if result["cached"]:
+            print(f"{video_file} taken from the local video cache")
+        return result
+    return download_file(match_id, video_file, local_path=local_path)
+
+def report_uploads(upload_results):
+    """Print the outcome of upload_files; returns False if any upload failed."""
+    ok = True
+    for fname, upload_result in upload_results.items():
+        if "error" in upload_result:
+            print(f"Error uploading {fname}: {upload_result['error']}")
+            ok = False
+        else:
+            print(f"{upload_result['name']} uploaded to: {upload_result['url']} "
+                  f"({upload_result['uploaded_bytes'] / 1e6:.1f} of {upload_result['bytes'] / 1e6:.1f} MB)")
+    return ok
+
+def make_video_source(spec):
+    """--video-source value: an http(s) base URL (auth from VIDEO_SOURCE_AUTHORIZATION) or a local directory."""
+    if spec is None:
+        return None
+    if spec.startswith(("http://", "https://")):
+        return HttpRangeSource(spec, authorization=os.environ.get("VIDEO_SOURCE_AUTHORIZATION"))
+    return LocalFileSource(spec)
+
+def partition_cores(num_parts):
+    """
+    Split the CPU cores this process may use into num_parts disjoint groups.
+    If there are fewer cores than parts, every group gets all of them.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    if len(cores) < num_parts:
+        return [cores] * num_parts
+    return [cores[i::num_parts] for i in range(num_parts)]
+
+def pin_to_cores(cores):
+    """Process-pool initializer restricting a worker (and its torch threads) to the given cores."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    try:
+        import torch
+        torch.set_num_threads(len(cores))
+    except ImportError:
+        pass
+
+def download_and_detect(match_id: str, device: str = "cpu", detection_options: dict = None, cache: StageCache = None,
+                        video_source=None, report: RunReport = None):
+    """
+    Download both videos, then run YOLO on each, one step at a time. Returns False if a download failed.
+    - detection_options: batch_size / stride / imgsz passed to the save_yolo_* functions.
+    - cache: reuse videos cached by fetch_match_video, and the detections of a camera whose video, weights and
+      settings are unchanged.
+    - video_source: see fetch_match_video.
+    - report: RunReport the detection stages are measured into.
+    """
+    detection_options = detection_options or {}
     # --- 1. Download Videos from Backblaze ---
     print("Downloading left video...")
-    result_left = download_file(match_id, "left_video.mp4", local_path="left_video.mp4")
+    result_left = fetch_match_video(match_id, "left_video.mp4", video_source, cache)
     if "error" in result_left:
         print(f"Error downloading left video: {result_left['error']}")
-        return
+        return False
 
     print("Downloading right video...")
-    result_right = download_file(match_id, "right_video.mp4", local_path="right_video.mp4")
+    result_right = fetch_match_video(match_id, "right_video.mp4", video_source, cache)
     if "error" in result_right:
         print(f"Error downloading right video: {result_right['error']}")
-        return
+        return False
 
     # --- 2. Run YOLO detections ---
     # These functions are assumed to read local files "left_video.mp4" and "right_video.mp4"
-    # and produce "left5shifted.json" and "right5.json" respectively in the current directory.
-    print("Running YOLO detection on left video...")
-    save_yolo_left(device=device)
-    print("Running YOLO detection on right video...")
-    save_yolo_right(device=device)
-
-    # --- 3. Merge the outputs ---
-    # This function is expected to combine the two detection JSON files (along with any other necessary files)
-    # and produce the final merged outputs: right_intersections.json, right_non_intersections.json,
-    # left_intersections.json, and left_non_intersections.json in the current directory.
-    print("Running merge step...")
-    merge_module.run_merge()
-
-    # --- 4. Upload Final JSONs Back to Backblaze ---
-    final_jsons = [
-        "right_intersections.json",
-        "right_non_intersections.json",
-        "left_intersections.json",
-        "left_non_intersections.json"
+    # and produce "left5shifted.jsonl" and "right5.jsonl" respectively in the current directory.
+    for name, video_file, output_file, detect in CAMERAS:
+        restored, key = lookup_detections(cache, name, video_file, output_file, device, detection_options, report)
+        if restored:
+            continue
+        print(f"Running YOLO detection on {name} video...")
+        add_detection_record(report, measure_call(f"save_yolo_{name}", detect, device=device,
+                                                  profiler=report and report.profiler, **detection_options))
+        if key is not None:
+            cache.put_files(key, {"detections": output_file})
+    return True
+
+def download_and_detect_concurrently(match_id: str, device: str = "cpu", detection_options: dict = None,
+                                     cache: StageCache = None, video_source=None, report: RunReport = None):
+    """
+    Download both videos in parallel and start each camera's YOLO run as soon as
+    its own video has arrived. Each camera runs in its own worker process pinned
+    to a disjoint group of CPU cores. Returns False if a download failed.
+    - cache: reuse videos cached by fetch_match_video, and the detections of a camera whose video, weights and
+      settings are unchanged.
+    - video_source: see fetch_match_video.
+    - report: RunReport the detection stages are measured into (inside the worker processes).
+    """
+    detection_options = detection_options or {}
+    core_groups = partition_cores(len(CAMERAS))
+    # spawn keeps CUDA and OpenCV state from being forked into the workers
+    context = multiprocessing.get_context("spawn")
+    inference_pools = [
+        ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=pin_to_cores, initargs=(cores,))
+        for cores in core_groups
     ]
-    for fname in final_jsons:
-        print(f"Uploading {fname}...")
-        upload_result = upload_json(match_id, fname, fname)
-        if "error" in upload_result:
-            print(f"Error uploading {fname}: {upload_result['error']}")
+    try:
+        with ThreadPoolExecutor(max_workers=len(CAMERAS)) as downloads:
+            download_futures = {}
+            for (name, video_file, output_file, detect), pool, cores in zip(CAMERAS, inference_pools, core_groups):
+                print(f"Downloading {name} video...")
+                future = downloads.submit(fetch_match_video, match_id, video_file, video_source, cache)
+                download_futures[future] = (name, video_file, output_file, detect, pool, cores)
+
+            inference_futures = []
+            failed = False
+            for future in as_completed(download_futures):
+                name, video_file, output_file, detect, pool, cores = download_futures[future]
+                result = future.result()
+                if "error" in result:
+                    print(f"Error downloading {name} video: {result['error']}")
+                    failed = True
+                    continue
+                restored, key = lookup_detections(cache, name, video_file, output_file, device, detection_options,
+                                                  report)
+                if restored:
+                    continue
+                print(f"Running YOLO detection on {name} video (cores {cores})...")
+                future = pool.submit(measure_call, f"save_yolo_{name}", detect, device=device,
+                                     profiler=report and report.profiler, **detection_options)
+                inference_futures.append((name, output_file, key, future))
+
+        for name, output_file, key, future in inference_futures:
+            add_detection_record(report, future.result())  # Re-raises any inference error here
+            print(f"YOLO detection on {name} video complete")
+            if key is not None:
+                cache.put_files(key, {"detections": output_file})
+        return not failed
+    finally:
+        for pool in inference_pools:
+            pool.shutdown()
+
+def run_pipeline(match_id: str, device: str = "cpu", checkpoint_dir: str = None, resume: bool = False,
+                 concurrent: bool = False, detection_options: dict = None, cache_dir: str = None,
+                 cache_bytes: int = DEFAULT_MAX_BYTES, video_source=None, storage=None,
+                 upload_compression: str = None, upload_workers: int = 4, report_file: str = RUN_REPORT_FILE,
+                 profile: bool = False, postprocess_workers: int = 1):
+    """
+    Download, detect, post-process and upload one match.
+    - storage: backend the final JSONs are uploaded to (default: BackblazeBackend).
+    - upload_compression: None, "gzip" or "zstd"; compressed files get a .gz / .zst suffix.
+    - report_file: where the JSON run report (wall/CPU time, peak RSS, frames, objects and
+      bytes of every stage) is written, also when the run fails; None skips it.
+    - profile: add each stage's hottest functions, from a sampling profiler, to the report.
+    - postprocess_workers: processes the per-frame post-processing stages run on in frame shards.
+    """
+    # Content-addressed cache: YOLO and post-processing stages whose inputs are unchanged are skipped
+    cache = StageCache(cache_dir, cache_bytes) if cache_dir else None
+    report = RunReport(match_id, profile)
+    try:
+        # --- 1 + 2. Download videos and run YOLO detections ---
+        if concurrent:
+            ok = download_and_detect_concurrently(match_id, device, detection_options, cache, video_source, report)
         else:
-            print(f"{fname} uploaded to: {upload_result.get('final_file_url', 'unknown URL')}")
+            ok = download_and_detect(match_id, device, detection_options, cache, video_source, report)
+        if not ok:
+            return
+
+        # --- 3. Merge the outputs ---
+        # Runs every post-processing stage in memory and writes the final outputs:
+        # right_intersections.json, right_non_intersections.json, left_intersections.json,
+        # left_non_intersections.json, 95_iou_compressed.json and 95_iou_compressed.bin in the current directory.
+        print("Running merge step...")
+        pipeline.run_default_pipeline(checkpoint_dir=checkpoint_dir, resume=resume, cache_dir=cache_dir,
+                                      cache_bytes=cache_bytes, report=report, workers=postprocess_workers)
+
+        # --- 4. Upload Final JSONs Back to Backblaze ---
+        print(f"Uploading {', '.join(FINAL_JSONS)}...")
+        storage = storage or BackblazeBackend()
+        report_uploads(upload_files(storage, match_id, FINAL_JSONS, upload_compression, upload_workers))
 
-    print("✅ Pipeline complete")
+        print("✅ Pipeline complete")
+    finally:
+        if report_file:
+            print(f"Run report saved to {report.write(report_file)}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--match-id", required=True, help="Match folder ID in Backblaze B2")
     parser.add_argument("--device", choices=["cpu", "gpu"], default="cpu", help="Device for YOLO inference")
+    parser.add_argument("--checkpoint-dir", help="Checkpoint the post-processing stages to this directory")
+    parser.add_argument("--resume", action="store_true", help="Resume post-processing from the last checkpoint")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="Overlap downloads with inference and run both cameras in parallel worker processes")
+    parser.add_argument("--batch-size", type=int, default=1, help="Frames per YOLO forward pass")
+    parser.add_argument("--frame-stride", type=int, default=1, help="Run YOLO on every N-th frame only")
+    parser.add_argument("--imgsz", type=int, help="YOLO inference image size (model default if omitted)")
+    parser.add_argument("--pitch-roi", choices=["none", "crop", "mask"], default="none",
+                        help="Run YOLO only on the pitch region of each camera (mask: also grey out its surroundings)")
+    parser.add_argument("--cache-dir", help="Cache directory for videos fetched with --video-source, detections and stage outputs; "
+                                                "unchanged stages are skipped")
+    parser.add_argument("--cache-gb", type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3, help="Cache size limit")
+    parser.add_argument("--video-source",
+                        help="Base URL or local directory to fetch <match-id>/<video> from with parallel range requests "
+                             "(default: backblaze_sdk whole-file download)")
+    parser.add_argument("--upload-compression", choices=["none", "gzip", "zstd"], default="none",
+                        help="Compress the final JSONs before uploading them")
+    parser.add_argument("--upload-workers", type=int, default=4, help="Uploads in flight at once")
+    parser.add_argument("--upload-dir", help="Write the final JSONs to this directory instead of Backblaze B2")
+    parser.add_argument("--report-file", default=RUN_REPORT_FILE,
+                        help="JSON report of per-stage time, memory, frame/object counts and I/O")
+    parser.add_argument("--profile", action="store_true", help="Add sampled hot functions of every stage to the report")
+    parser.add_argument("--no-progress", action="store_true", help="Disable progress bars (headless runs)")
+    parser.add_argument("--postprocess-workers", type=int, default=1,
+                        help="Processes the per-frame post-processing stages run on in frame shards")
     args = parser.parse_args()
 
-    run_pipeline(args.match_id, args.device)
+    if args.no_progress:
+        configure_progress(enabled=False)
+    detection_options = {"batch_size": args.batch_size, "stride": args.frame_stride, "imgsz": args.imgsz}
+    if args.pitch_roi != "none":
+        detection_options["roi"] = args.pitch_roi
+    storage = LocalDirectoryBackend(args.upload_dir) if args.upload_dir else None
+    upload_compression = None if args.upload_compression == "none" else args.upload_compression
+    run_pipeline(args.match_id, args.device, args.checkpoint_dir, args.resume, args.concurrent, detection_options,
+                 args.cache_dir, int(args.cache_gb * 1024 ** 3), make_video_source(args.video_source), storage,
+                 upload_compression, args.upload_workers, args.report_file, args.profile, args.postprocess_workers)
@@ -1,11 +1,14 @@
 import os
-import json
-from ultralytics import YOLO
+from yolo_detection import run_detection
 
-def save_yolo_left():
+def save_yolo_left(device="gpu", batch_size=1, stride=1, imgsz=None, roi=None):
     """
     Perform object detection on the left-side video using YOLO
-    and save the output to left5shifted.json.
+    and stream the output to left5shifted.jsonl (one JSON line per frame).
+    - device: "gpu", "cpu" or an explicit torch device such as "cuda:1".
+    - batch_size / stride / imgsz / roi: see yolo_detection.run_detection; the pitch ROI
+      comes from this camera's homography matrix.
+    Returns the throughput stats from run_detection.
     """
     # Use the current working directory as the base
     base_dir = os.getcwd()
@@ -13,42 +16,21 @@ def save_yolo_left():
     # Define file names in the current directory (adjust the names as needed)
     video_filename = 'left_video.mp4'   # Your left video file
     model_filename = 'model.pt'           # Your YOLO model weights file (same as for right)
-    output_filename = 'left5shifted.json' # Output JSON file for left detections
+    output_filename = 'left5shifted.jsonl' # Output JSON file for left detections
+    homography_filename = 'al2_homography_matrix.txt'  # Left camera calibration, for the pitch ROI
 
     # Build full paths (all in the current directory)
     video_path = os.path.join(base_dir, video_filename)
     model_path = os.path.join(base_dir, model_filename)
     output_json = os.path.join(base_dir, output_filename)
-
-    # Initialize YOLO model
-    model = YOLO(model_path)
-
-    # Choose device option: 0 for GPU if available, else "cpu"
-    device_option = 0  # Change to "cpu" if needed
-
-    # Run prediction (streaming mode)
-    results = model.predict(video_path, verbose=True, save=False, stream=True,
-                            save_txt=False, save_conf=False, device=device_option)
-
-    detection_data = []
-    for frame_idx, result in enumerate(results):
-        frame_data = {"frame_index": frame_idx, "objects": []}
-        for box, conf, cls_id in zip(result.boxes.xyxy, result.boxes.conf, result.boxes.cls):
-            bbox = box.tolist()  # [x1, y1, x2, y2]
-            center_x = (bbox[0] + bbox[2]) / 2
-            center_y = (bbox[1] + bbox[3]) / 2
-            frame_data["objects"].append({
-                "class_id": int(cls_id.item()),
-                "confidence": float(conf.item()),
-                "bbox": list(map(float, bbox)),
-                "center": [float(center_x), float(center_y)]
-            })
-        detection_data.append(frame_data)
-
-    # Save the detection data to the output JSON file
-    with open(output_json, 'w') as json_file:
-        json.dump(detection_data, json_file, indent=4)
-    print(f"YOLO detection data saved to {output_json}")
+    homography_path = os.path.join(base_dir, homography_filename)
+
+    # Run prediction in batches, appending each frame to the output as it arrives
+    stats = run_detection(video_path, model_path, output_json, device=device,
+                          batch_size=batch_size, stride=stride, imgsz=imgsz, roi=roi,
+                          homography_path=homography_path)
+    print(f"YOLO detection data for {stats['frames']} frames saved to {output_json}")
+    return stats
 
 if __name__ == "__main__":
     save_yolo_left()
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+import numpy as np
+
+INDEX_FILE = "index.json"
+HASHES_FILE = "file_hashes.json"
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3  # 20 GB
+HASH_CHUNK = 8 * 1024 * 1024
+
+
+def _atomic_write_json(path, value):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+def _canonical(value):
+    """JSON-serialisable stand-in for a stage parameter or key part (arrays by content)."""
+    if isinstance(value, np.ndarray):
+        return {"ndarray": value.dtype.str, "shape": value.shape,
+                "sha256": hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(_canonical(item) for item in value)
+    return value
+
+
+def hash_value(*parts):
+    """sha256 of JSON-canonical parts (dicts, lists, numbers, strings, NumPy arrays)."""
+    text = json.dumps(_canonical(parts), sort_keys=True, separators=(",", ":"), default=repr)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def module_digest(module):
+    """Digest of a module's source, so editing a stage's code invalidates its cache entries."""
+    module = sys.modules[module] if isinstance(module, str) else module
+    return hash_file(module.__file__)
+
+
+class StageCache:
+    """
+    Content-addressed store for stage outputs, bounded to max_bytes with LRU eviction.
+
+    Keys are hash_value digests of everything a stage depends on (input digests, parameters,
+    code). An entry is a directory holding either named files (get_files / put_files) or one
+    pickled value (get_value / put_value). index.json records each entry's size and last use;
+    file_hashes.json remembers file digests by (path, size, mtime) so large videos are only
+    hashed again when they change. One instance may be shared by threads; separate processes
+    should use separate cache directories.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._index = self._load_json(INDEX_FILE)
+        self._file_hashes = self._load_json(HASHES_FILE)
+        self._lock = threading.RLock()  # Guards the index, the hash memo and entry removal
+
+    def _load_json(self, name):
+        path = os.path.join(self.root, name)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def hash_file(self, path):
+        """sha256 of a file's bytes, reusing the stored digest while size and mtime are unchanged."""
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        with self._lock:
+            known = self._file_hashes.get(path)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["sha256"]
+        digest = hash_file(path)
+        with self._lock:
+            self._file_hashes[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+            _atomic_write_json(os.path.join(self.root, HASHES_FILE), self._file_hashes)
+        return digest
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._index and os.path.isdir(self._entry_dir(key))
+
+    def _touch(self, key):
+        # Caller holds the lock
+        self._index[key]["last_used"] = time.time()
+        _atomic_write_json(os.path.join(self.root, INDEX_FILE), self._index)
+
+    def get_files(self, key, destinations):
+        """
+        Copy the files of entry key to destinations ({name: path}).
+        Returns False (and copies nothing) on a miss.
+        """
+        with self._lock:  # Keeps the entry from being evicted while it is copied
+            if key not in self:
+                return False
+            entry_dir = self._entry_dir(key)
+            for name, path in destinations.items():
+                shutil.copyfile(os.path.join(entry_dir, name), path)
+            self._touch(key)
+            return True
+
+    def put_files(self, key, sources):
+        """Store copies of sources ({name: path}) under key."""
+        def write(tmp_dir):
+            for name, path in sources.items():
+                shutil.copyfile(path, os.path.join(tmp_dir, name))
+        self._put(key, write)
+
+    def get_value(self, key):
+        """Return (True, value) for a stored value, or (False, None) on a miss."""
+        with self._lock:
+            if key not in self:
+                return False, None
+            with open(os.path.join(self._entry_dir(key), "value.pkl"), "rb") as f:
+                value = pickle.load(f)
+            self._touch(key)
+            return True, value
+
+    def put_value(self, key, value):
+        def write(tmp_dir):
+            with open(os.path.join(tmp_dir, "value.pkl"), "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._put(key, write)
+
+    def _put(self, key, write):
+        # Fill a temporary directory first so a crash never leaves a half-written entry
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        write(tmp_dir)
+        size = sum(entry.stat().st_size for entry in os.scandir(tmp_dir))
+        with self._lock:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            self._index[key] = {"bytes": size, "last_used": time.time()}
+            self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Drop least recently used entries until the cache fits in max_bytes (never keep itself)."""
+        with self._lock:
+            total = sum(entry["bytes"] for entry in self._index.values())
+            for key in sorted(self._index, key=lambda key: self._index[key]["last_used"]):
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+                total -= self._index.pop(key)["bytes"]
+            _atomic_write_json(os.path.join(self.root, INDEX_FILE), self._index)
+
+
+def hash_file(path):
+    """sha256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,206 @@
+import argparse
+import os
+import random
+import shutil
+from contextlib import redirect_stdout
+
+import cv2
+import numpy as np
+
+import ENTRY_YOLO_merge
+import bos
+import filterjson2
+import pipeline
+from detection_store import write_frames
+from homography import inverse_transform_points
+
+IMAGE_WIDTH = 1920  # Camera frame size the homographies were calibrated on
+IMAGE_HEIGHT = 1080
+PITCH_WIDTH = 400  # Size of each camera's transformed (bird's-eye) frame
+PITCH_HEIGHT = 300
+FPS = 25
+
+# Both cameras share one pitch: global x = left x = right x + filterjson2.OFFSET,
+# so global x between OFFSET and PITCH_WIDTH is seen by both cameras
+GLOBAL_WIDTH = PITCH_WIDTH + filterjson2.OFFSET
+
+PLAYER_WIDTH = 40  # Bbox size in camera pixels
+PLAYER_HEIGHT = 90
+STEP = 1.5  # Max pitch units a player moves per frame
+JITTER = 2.0  # Max camera-pixel noise on every detection
+DUPLICATE_SHIFT = 0.5  # Pixels a duplicate box is moved by; keeps its IoU with the original above 0.95
+
+# Calibration the synthetic matches are built from: the files checked in next to this module
+CALIBRATION_DIR = os.path.dirname(os.path.abspath(__file__))
+CALIBRATION_FILES = [
+    ENTRY_YOLO_merge.DIMENSIONS_FILE, ENTRY_YOLO_merge.HOMOGRAPHY_MATRIX_LEFT, ENTRY_YOLO_merge.HOMOGRAPHY_MATRIX_RIGHT
+]
+
+
+def load_geometry(directory=CALIBRATION_DIR):
+    """(homography_left, homography_right) from the calibration files in directory."""
+    files = [os.path.join(directory, name) for name in CALIBRATION_FILES]
+    *_, homography_left, homography_right = ENTRY_YOLO_merge.load_dimensions_and_homographies(*files)
+    return homography_left, homography_right
+
+
+class SyntheticMatch:
+    """
+    Players walking on the shared pitch, seen by the left and right cameras through the
+    calibration homographies.
+    - objects_per_frame: players on the pitch.
+    - overlap_fraction: share of players kept inside the band both cameras see, where the
+      intersection stages (filterjson2, adjust2Dmerged) do their work.
+    - duplicate_fraction: chance per detection of a second, slightly shifted, lower-confidence
+      box of the same player, for ioudelete to remove.
+    Detections are bboxes whose bottom middle is the player's pitch position mapped back into
+    the camera image, plus jitter; players outside a camera's image are not detected by it.
+    """
+
+    def __init__(self, objects_per_frame=20, overlap_fraction=0.2, duplicate_fraction=0.02, seed=0,
+                 homographies=None):
+        self.rng = random.Random(seed)
+        self.homography_left, self.homography_right = homographies or load_geometry()
+        self.duplicate_fraction = duplicate_fraction
+        num_overlap = round(objects_per_frame * overlap_fraction)
+        self.players = []  # [x, y, x_min, x_max] in global pitch coordinates
+        for index in range(objects_per_frame):
+            x_min, x_max = (filterjson2.OFFSET, PITCH_WIDTH) if index < num_overlap else (0, GLOBAL_WIDTH)
+            self.players.append([self.rng.uniform(x_min, x_max), self.rng.uniform(0, PITCH_HEIGHT), x_min, x_max])
+
+    def _step(self):
+        for player in self.players:
+            player[0] = min(max(player[0] + self.rng.uniform(-STEP, STEP), player[2]), player[3] - 1e-6)
+            player[1] = min(max(player[1] + self.rng.uniform(-STEP, STEP), 0), PITCH_HEIGHT - 1e-6)
+
+    def _camera_objects(self, homography, x_offset, bboxes_out):
+        """Detections of the players a camera covers; appends their clean bboxes to bboxes_out."""
+        visible = [player for player in self.players if x_offset <= player[0] < x_offset + PITCH_WIDTH]
+        if not visible:
+            return []
+        pitch_points = np.array([[player[0] - x_offset, player[1]] for player in visible], dtype=np.float64)
+        objects = []
+        for u, v in inverse_transform_points(pitch_points, homography).tolist():
+            if not (PLAYER_WIDTH / 2 <= u < IMAGE_WIDTH - PLAYER_WIDTH / 2 and PLAYER_HEIGHT <= v < IMAGE_HEIGHT):
+                continue
+            bboxes_out.append([u - PLAYER_WIDTH / 2, v - PLAYER_HEIGHT, u + PLAYER_WIDTH / 2, v])
+            boxes = [(self.rng.uniform(0.5, 0.99), u + self.rng.uniform(-JITTER, JITTER),
+                      v + self.rng.uniform(-JITTER, JITTER))]
+            if self.rng.random() < self.duplicate_fraction:
+                boxes.append((boxes[0][0] * 0.5, boxes[0][1] + DUPLICATE_SHIFT, boxes[0][2] + DUPLICATE_SHIFT))
+            for confidence, x, y in boxes:
+                bbox = [x - PLAYER_WIDTH / 2, y - PLAYER_HEIGHT, x + PLAYER_WIDTH / 2, y]
+                objects.append({
+                    "class_id": 0,
+                    "confidence": confidence,
+                    "bbox": bbox,
+                    "center": [x, y - PLAYER_HEIGHT / 2],
+                })
+        return objects
+
+    def frames(self, num_frames):
+        """Yield (frame_index, left_objects, right_objects, left_bboxes, right_bboxes) per frame."""
+        for frame_index in range(num_frames):
+            left_bboxes, right_bboxes = [], []
+            left = self._camera_objects(self.homography_left, 0, left_bboxes)
+            right = self._camera_objects(self.homography_right, filterjson2.OFFSET, right_bboxes)
+            yield frame_index, left, right, left_bboxes, right_bboxes
+            self._step()
+
+
+def make_detections(num_frames, objects_per_frame=20, overlap_fraction=0.2, duplicate_fraction=0.02, seed=0,
+                    homographies=None):
+    """(left_frames, right_frames) shaped like the save_yolo_* outputs."""
+    match = SyntheticMatch(objects_per_frame, overlap_fraction, duplicate_fraction, seed, homographies)
+    left_frames, right_frames = [], []
+    for frame_index, left, right, _, _ in match.frames(num_frames):
+        left_frames.append({"frame_index": frame_index, "objects": left})
+        right_frames.append({"frame_index": frame_index, "objects": right})
+    return left_frames, right_frames
+
+
+def make_stage_output(name, num_frames, objects_per_frame=20, overlap_fraction=0.2, duplicate_fraction=0.02, seed=0):
+    """
+    Artifact name of the pipeline (e.g. "merged", "final") for make_detections' match, from
+    running the stages up to the one producing it with the calibration in CALIBRATION_DIR.
+    """
+    producer = next(index for index, stage in enumerate(pipeline.STAGES) if name in stage.outputs)
+    left_frames, right_frames = make_detections(num_frames, objects_per_frame, overlap_fraction, duplicate_fraction, seed)
+    artifacts = {"calibration": pipeline.load_calibration(CALIBRATION_DIR),
+                 "left_detections": left_frames, "right_detections": right_frames}
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):  # The stages print summaries
+        produced = pipeline.run_stages(pipeline.STAGES[:producer + 1], artifacts, save_outputs=(), keep_outputs=[name])
+    return produced[name]
+
+
+def _background(homography):
+    """Grass with the pitch outline of one camera, drawn through the inverse homography."""
+    frame = np.full((IMAGE_HEIGHT, IMAGE_WIDTH, 3), (40, 110, 40), dtype=np.uint8)
+    corners = np.array([[0, 0], [PITCH_WIDTH, 0], [PITCH_WIDTH, PITCH_HEIGHT], [0, PITCH_HEIGHT]], dtype=np.float64)
+    outline = inverse_transform_points(corners, homography)
+    cv2.polylines(frame, [np.round(outline).astype(np.int32)], True, (230, 230, 230), 3)
+    return frame
+
+
+def write_videos(directory, num_frames, objects_per_frame=20, overlap_fraction=0.2, seed=0, homographies=None,
+                 left_file=bos.VIDEO_LEFT, right_file=bos.VIDEO_RIGHT):
+    """Short camera videos of the synthetic players (full IMAGE_WIDTH x IMAGE_HEIGHT, FPS)."""
+    match = SyntheticMatch(objects_per_frame, overlap_fraction, 0.0, seed, homographies)
+    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+    writers = [cv2.VideoWriter(os.path.join(directory, name), fourcc, FPS, (IMAGE_WIDTH, IMAGE_HEIGHT))
+               for name in (left_file, right_file)]
+    backgrounds = [_background(match.homography_left), _background(match.homography_right)]
+    try:
+        for _, _, _, left_bboxes, right_bboxes in match.frames(num_frames):
+            for writer, background, bboxes in zip(writers, backgrounds, (left_bboxes, right_bboxes)):
+                frame = background.copy()
+                for x1, y1, x2, y2 in bboxes:
+                    cv2.rectangle(frame, (round(x1), round(y1)), (round(x2), round(y2)), (200, 60, 30), -1)
+                writer.write(frame)
+    finally:
+        for writer in writers:
+            writer.release()
+
+
+def write_match(directory, num_frames, objects_per_frame=20, overlap_fraction=0.2, duplicate_fraction=0.02, seed=0,
+                video_frames=0, calibration_dir=CALIBRATION_DIR):
+    """
+    Create a working directory for the pipeline: the calibration files from calibration_dir,
+    the two detection files the post-processing stages read and, with video_frames, the two
+    camera videos bos renders.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for file_name in CALIBRATION_FILES:
+        source, target = os.path.join(calibration_dir, file_name), os.path.join(directory, file_name)
+        if os.path.abspath(source) != os.path.abspath(target):
+            shutil.copyfile(source, target)
+    homographies = load_geometry(directory)
+    left_frames, right_frames = make_detections(num_frames, objects_per_frame, overlap_fraction, duplicate_fraction,
+                                                seed, homographies)
+    write_frames(left_frames, os.path.join(directory, ENTRY_YOLO_merge.TRACKING_DATA_LEFT))
+    write_frames(right_frames, os.path.join(directory, ENTRY_YOLO_merge.TRACKING_DATA_RIGHT))
+    if video_frames:
+        write_videos(directory, video_frames, objects_per_frame, overlap_fraction, seed, homographies)
+    return directory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic match (detections, optionally videos).")
+    parser.add_argument("directory", help="Output directory")
+    parser.add_argument("--frames", type=int, default=1000, help="Number of frames")
+    parser.add_argument("--objects", type=int, default=20, help="Players on the pitch")
+    parser.add_argument("--overlap", type=float, default=0.2, help="Share of players in the band both cameras see")
+    parser.add_argument("--duplicates", type=float, default=0.02, help="Chance of a duplicate box per detection")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--video-frames", type=int, default=0, help="Also write camera videos of this many frames")
+    parser.add_argument("--calibration-dir", default=CALIBRATION_DIR,
+                        help="Directory with dimensions.txt and the homography matrices (default: this checkout)")
+    args = parser.parse_args()
+
+    write_match(args.directory, args.frames, args.objects, args.overlap, args.duplicates, args.seed,
+                args.video_frames, args.calibration_dir)
+    print(f"Synthetic match written to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
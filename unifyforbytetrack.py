@@ -1,8 +1,9 @@
-import json
-import numpy as np
+import heapq
+import itertools
 import os
-import cv2
-from tqdm import tqdm
+from instrumentation import progress
+from homography import load_homography_matrix, transform_points
+from detection_store import is_jsonl_path, iter_frames, read_frames, write_frames
 
 # TODO LEFT RIGHT COLORA GORE OLACAK
 # Input JSON files
@@ -25,54 +26,69 @@ def load_homography_matrices():
     """
     Load homography matrices from file.
     """
-    homography_matrix_left = np.loadtxt(HOMOGRAPHY_MATRIX_LEFT, delimiter=' ')
-    homography_matrix_right = np.loadtxt(HOMOGRAPHY_MATRIX_RIGHT, delimiter=' ')
+    homography_matrix_left = load_homography_matrix(HOMOGRAPHY_MATRIX_LEFT)
+    homography_matrix_right = load_homography_matrix(HOMOGRAPHY_MATRIX_RIGHT)
     return homography_matrix_left, homography_matrix_right
 
 
-def transform_point(point, homography_matrix):
-    """
-    Transform a single point using a homography matrix.
-    """
-    point = np.array([[point]], dtype=np.float32)
-    transformed_point = cv2.perspectiveTransform(point, homography_matrix)
-    return transformed_point[0][0].tolist()  # Convert to a list for JSON compatibility
+def _sorted_frames(frames):
+    """frames ordered by frame_index; an already ordered list is returned as is."""
+    frame_indices = [frame["frame_index"] for frame in frames]
+    if any(a > b for a, b in zip(frame_indices, frame_indices[1:])):
+        return sorted(frames, key=lambda frame: frame["frame_index"])
+    return frames
 
 
-def merge_jsons(json_files, homography_matrix_left, homography_matrix_right):
-    """
-    Merge multiple JSON files, grouping objects by frame_index and adding a source field and transformed_center.
-    Apply filtering based on transformed center coordinates.
-    """
-    merged_data = {}
+def _checked_order(frames, name):
+    """Pass a stream of frames through, raising ValueError when a frame_index goes down."""
+    previous = None
+    for frame in frames:
+        frame_index = frame["frame_index"]
+        if previous is not None and frame_index < previous:
+            raise ValueError(f"'{name}' is not ordered by frame_index: frame {frame_index} follows frame {previous}")
+        previous = frame_index
+        yield frame
 
-    for json_file, source in tqdm(json_files.items(), desc="Processing JSON files"):
-        if not os.path.exists(json_file):
-            print(f"Error: File '{json_file}' not found.")
-            continue
 
-        with open(json_file, "r") as f:
-            data = json.load(f)
+def _keyed_frames(frames, position):
+    """(frame_index, source position, frame) for each frame, so equal indices merge in source order."""
+    for frame in frames:
+        yield frame["frame_index"], position, frame
 
-        for frame in tqdm(data, desc=f"Processing frames in {json_file}", leave=False):
-            frame_index = frame["frame_index"]
-            objects = frame.get("objects", [])
 
-            filtered_objects = []
+def iter_merged_frames(sources, homography_matrix_left, homography_matrix_right):
+    """
+    k-way merge of detection streams that are each ordered by frame_index.
+    - sources: iterable of (name, frames, source) with source "left" or "right"; frames may be
+      a lazy iterator, and only the current frame of each source is held in memory.
+    Yields one frame per frame_index, in order, with the objects of all sources (in source
+    order) that survive the transformed-center filter, each given a source field and
+    transformed_center. The centers of a frame are projected with one call per camera.
+    """
+    sources = list(sources)
+    streams = [_keyed_frames(frames, position) for position, (_, frames, _) in enumerate(sources)]
+    merged = heapq.merge(*streams, key=lambda item: item[:2])
+
+    for frame_index, group in itertools.groupby(merged, key=lambda item: item[0]):
+        group = [(sources[position][2], frame.get("objects", [])) for _, position, frame in group]
+
+        # One projection per camera for the whole frame
+        transformed = {}
+        for source, homography_matrix in (("left", homography_matrix_left), ("right", homography_matrix_right)):
+            centers = [obj["center"] for frame_source, objects in group if frame_source == source for obj in objects]
+            if centers:
+                transformed[source] = iter(transform_points(centers, homography_matrix).tolist())
+
+        filtered_objects = []
+        for source, objects in group:
             for obj in objects:
-
-
                 # Add source field
                 obj["source"] = source
-
-                # Compute transformed center using the appropriate homography matrix
-                homography_matrix = homography_matrix_left if source == "left" else homography_matrix_right
-                obj["transformed_center"] = transform_point(obj["center"], homography_matrix)
+                obj["transformed_center"] = transformed_center = next(transformed[source])
 
                 # Apply filtering
-                transformed_center_x = obj["transformed_center"][0]
+                transformed_center_x = transformed_center[0]
 
-                
                 if source == "left" and transformed_center_x > 370:
                     continue  # Skip this object
                 if source == "right" and transformed_center_x < 30:
@@ -80,22 +96,47 @@ def merge_jsons(json_files, homography_matrix_left, homography_matrix_right):
 
                 filtered_objects.append(obj)
 
-            if frame_index not in merged_data:
-                merged_data[frame_index] = {"frame_index": frame_index, "objects": []}
+        yield {"frame_index": frame_index, "objects": filtered_objects}
 
-            # Append filtered objects to the appropriate frame
-            merged_data[frame_index]["objects"].extend(filtered_objects)
 
-    # Convert merged_data to a list sorted by frame_index
-    return sorted(merged_data.values(), key=lambda x: x["frame_index"])
+def merge_frames(sources, homography_matrix_left, homography_matrix_right):
+    """
+    Merge several in-memory detection lists with iter_merged_frames and return the merged list.
+    Lists that are not ordered by frame_index are sorted first.
+    """
+    ordered_sources = [(name, _sorted_frames(frames), source) for name, frames, source in sources]
+    return list(iter_merged_frames(ordered_sources, homography_matrix_left, homography_matrix_right))
+
+
+def merge_jsons(json_files, homography_matrix_left, homography_matrix_right):
+    """
+    Stream-merge the JSON files, skipping files that do not exist; returns an iterator over the
+    merged frames. Only JSON Lines inputs are read incrementally, so memory stays constant only
+    when every input is .jsonl: .json and .npz files are loaded whole, as the pipeline's
+    intersection files are, and sorted by frame_index if they are out of order. A .jsonl input
+    must already be ordered; ValueError is raised where it is not, instead of silently emitting
+    a frame_index twice.
+    """
+    sources = []
+    for json_file, source in json_files.items():
+        if not os.path.exists(json_file):
+            print(f"Error: File '{json_file}' not found.")
+            continue
+        if is_jsonl_path(json_file):
+            frames = _checked_order(iter_frames(json_file), json_file)
+        else:
+            frames = _sorted_frames(read_frames(json_file))
+        sources.append((json_file, frames, source))
+
+    merged = iter_merged_frames(sources, homography_matrix_left, homography_matrix_right)
+    return progress(merged, desc="Merging frames", unit="frame")
 
 
 def save_json(data, output_file):
     """
-    Save the merged JSON data to a file.
+    Save the merged JSON data to a file; an iterator of frames is written as it is consumed.
     """
-    with open(output_file, "w") as f:
-        json.dump(data, f, indent=2)
+    write_frames(data, output_file)
     print(f"Merged JSON saved as '{output_file}'")
 
 
@@ -110,11 +151,6 @@ def main():
     save_json(merged_data, OUTPUT_JSON)
 
 
-    import filterjson3
-    print("fifth script completed. Now running the sixth script...")
-    filterjson3.main()  # Call the second script after finishing the first
-
-
 if __name__ == "__main__":
     main()
     
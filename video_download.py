@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from stage_cache import hash_value
+
+CHUNK_BYTES = 32 * 1024 * 1024  # Bytes fetched per range request
+WORKERS = 8  # Range requests in flight per file
+PARTIAL_SUFFIX = ".part"  # Data of an unfinished download
+STATE_SUFFIX = ".part.json"  # Chunks of the .part file that are already complete
+
+# Headers the storage service may report the content SHA-1 in (B2 names them like this)
+SHA1_HEADERS = ("x-bz-content-sha1", "x-bz-info-large_file_sha1")
+
+
+class HttpRangeSource:
+    """
+    Files served over HTTP(S) at {base_url}/{match_id}/{name}, fetched with Range requests.
+    For B2 the base URL is the friendly download URL, e.g. https://f000.backblazeb2.com/file/<bucket>.
+    """
+
+    def __init__(self, base_url, authorization=None, timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.authorization = authorization
+        self.timeout = timeout
+
+    def _request(self, match_id, name, method="GET", headers=None):
+        request = urllib.request.Request(f"{self.base_url}/{match_id}/{name}", method=method, headers=headers or {})
+        if self.authorization:
+            request.add_header("Authorization", self.authorization)
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def stat(self, match_id, name):
+        """(size in bytes, hex SHA-1 or None) of a remote file."""
+        with self._request(match_id, name, method="HEAD") as response:
+            size = int(response.headers["Content-Length"])
+            sha1 = None
+            for header in SHA1_HEADERS:
+                value = response.headers.get(header, "")
+                value = value[len("unverified:"):] if value.startswith("unverified:") else value
+                if len(value) == 40:
+                    sha1 = value.lower()
+                    break
+        return size, sha1
+
+    def read_range(self, match_id, name, start, end):
+        """Bytes start .. end - 1 of a remote file."""
+        with self._request(match_id, name, headers={"Range": f"bytes={start}-{end - 1}"}) as response:
+            if response.status != 206 and not (start == 0 and response.status == 200):
+                raise IOError(f"Server ignored the range request for '{name}' (HTTP {response.status}).")
+            data = response.read()
+        if len(data) != end - start:
+            raise IOError(f"Short read for '{name}' bytes {start}-{end - 1}: got {len(data)} bytes.")
+        return data
+
+
+class LocalFileSource:
+    """Stand-in for the storage service: files under {root}/{match_id}/{name}, for tests and benchmarks."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, match_id, name):
+        return os.path.join(self.root, match_id, name)
+
+    def stat(self, match_id, name):
+        path = self._path(match_id, name)
+        return os.path.getsize(path), file_sha1(path)
+
+    def read_range(self, match_id, name, start, end):
+        with open(self._path(match_id, name), "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+
+def _load_state(state_path, size, sha1):
+    """Completed chunk indices of a partial download, or an empty set if it belongs to another file."""
+    if not os.path.exists(state_path):
+        return set()
+    with open(state_path, "r") as f:
+        state = json.load(f)
+    if state.get("size") != size or state.get("sha1") != sha1 or state.get("chunk_bytes") != CHUNK_BYTES:
+        return set()
+    return set(state["done"])
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download_ranged(source, match_id, name, local_path, workers=WORKERS, stat=None):
+    """
+    Download a file with up to workers concurrent range requests of CHUNK_BYTES.
+    Data goes to local_path + PARTIAL_SUFFIX and finished chunks are recorded next to it, so
+    an interrupted download resumes with the missing chunks only. The SHA-1 is checked when the
+    source reports one, and local_path only appears once the whole file is complete.
+    - stat: (size, sha1) if the caller already asked the source for it.
+    Returns {"bytes", "resumed_bytes"}; raises IOError on a checksum mismatch.
+    """
+    size, sha1 = stat or source.stat(match_id, name)
+    partial_path = local_path + PARTIAL_SUFFIX
+    state_path = local_path + STATE_SUFFIX
+    chunks = [(start, min(start + CHUNK_BYTES, size)) for start in range(0, size, CHUNK_BYTES)]
+
+    done = _load_state(state_path, size, sha1) if os.path.exists(partial_path) else set()
+    if not done:
+        with open(partial_path, "wb") as f:
+            f.truncate(size)
+    resumed_bytes = sum(chunks[index][1] - chunks[index][0] for index in done)
+
+    lock = threading.Lock()
+
+    def fetch(index):
+        start, end = chunks[index]
+        data = source.read_range(match_id, name, start, end)
+        with open(partial_path, "r+b") as f:
+            f.seek(start)
+            f.write(data)
+        with lock:
+            done.add(index)
+            tmp_path = state_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"size": size, "sha1": sha1, "chunk_bytes": CHUNK_BYTES, "done": sorted(done)}, f)
+            os.replace(tmp_path, state_path)
+
+    missing = [index for index in range(len(chunks)) if index not in done]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for future in [pool.submit(fetch, index) for index in missing]:
+            future.result()  # Re-raise the first failed range; finished chunks stay recorded
+
+    if sha1 is not None and file_sha1(partial_path) != sha1:
+        for path in (partial_path, state_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise IOError(f"Checksum mismatch for '{name}'; the partial download was discarded.")
+    os.replace(partial_path, local_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return {"bytes": size, "resumed_bytes": resumed_bytes}
+
+
+def fetch_video(source, match_id, name, local_path, cache=None, workers=WORKERS):
+    """
+    Put a match video at local_path, from cache if possible, else with download_ranged.
+    - cache: a StageCache keeping downloaded videos, keyed by the remote size and SHA-1 so a
+      re-uploaded video is fetched again. Videos whose source reports no SHA-1 are not cached,
+      since a re-upload of the same size could not be told apart.
+    Returns {"bytes", "resumed_bytes", "cached"}.
+    """
+    stat = source.stat(match_id, name)
+    size, sha1 = stat
+    key = hash_value("video", match_id, name, size, sha1) if cache is not None and sha1 is not None else None
+    if key is not None and cache.get_files(key, {name: local_path}):
+        return {"bytes": stat[0], "resumed_bytes": 0, "cached": True}
+
+    result = download_ranged(source, match_id, name, local_path, workers, stat)
+    if key is not None:
+        cache.put_files(key, {name: local_path})
+    return {**result, "cached": False}
+
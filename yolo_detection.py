@@ -0,0 +1,113 @@
+import time
+import numpy as np
+from instrumentation import progress
+from ultralytics import YOLO
+
+from detection_store import DetectionWriter
+from frame_source import FrameSource
+from homography import load_homography_matrix
+from pitch_roi import ROI_MODES, PitchROI
+
+
+def resolve_device(device):
+    """Map the pipeline's "cpu"/"gpu" choice (or an explicit torch device) to a YOLO device argument."""
+    if device is None or device == "gpu":
+        return 0  # First CUDA device
+    return device
+
+
+def frame_detections(result, frame_idx, offset=(0, 0)):
+    """
+    Convert one YOLO result into a frame dict.
+    Boxes, confidences and classes are moved to NumPy in one transfer per frame
+    instead of one .tolist()/.item() call per box.
+    - offset: (x, y) of the crop the result was found in, added to move boxes to full-frame coordinates.
+    """
+    boxes = result.boxes
+    xyxy = boxes.xyxy.cpu().numpy().astype(np.float64)  # [x1, y1, x2, y2]
+    xyxy += (offset[0], offset[1], offset[0], offset[1])
+    confidences = boxes.conf.cpu().numpy().astype(np.float64).tolist()
+    class_ids = boxes.cls.cpu().numpy().astype(np.int64).tolist()
+    centers = np.column_stack(((xyxy[:, 0] + xyxy[:, 2]) / 2, (xyxy[:, 1] + xyxy[:, 3]) / 2)).tolist()
+
+    objects = [
+        {"class_id": class_id, "confidence": confidence, "bbox": bbox, "center": center}
+        for class_id, confidence, bbox, center in zip(class_ids, confidences, xyxy.tolist(), centers)
+    ]
+    return {"frame_index": frame_idx, "objects": objects}
+
+
+def iter_frame_batches(source, batch_size=1):
+    """
+    Yield (frame_indices, frames) batches of up to batch_size frames from a FrameSource
+    (which already applies the stride and decodes ahead of inference).
+    """
+    indices, frames = [], []
+    for frame_idx, frame in source:
+        indices.append(frame_idx)
+        frames.append(frame)
+        if len(frames) == batch_size:
+            yield indices, frames
+            indices, frames = [], []
+    if frames:
+        yield indices, frames
+
+
+def run_detection(video_path, model_path, output_path, device="gpu", batch_size=1, stride=1, imgsz=None, prefetch=32,
+                  flush_every=100, roi=None, homography_path=None):
+    """
+    Run YOLO over a video and stream one JSON line per processed frame to output_path.
+    - batch_size: frames per forward pass.
+    - stride: keep every stride-th frame; frame_index stays the index in the video.
+    - imgsz: inference size passed to YOLO (model default if None).
+    - prefetch: frames decoded ahead of inference (at least two batches).
+    - flush_every: frames between flushes of output_path; lower it when another process
+      follows the file while it is written (see live_pipeline).
+    - roi: "crop" runs YOLO only on the bounding box of the pitch seen through the camera's
+      homography (homography_path), "mask" also greys out the pixels around the pitch; boxes
+      are written in full-frame coordinates either way. None uses the whole frame.
+    Returns {"frames", "objects", "seconds", "fps", "decode"} for throughput tuning; "decode" holds FrameSource.stats().
+    """
+    if roi is not None and roi not in ROI_MODES:
+        raise ValueError(f"Unknown ROI mode '{roi}'")
+    if roi is not None and homography_path is None:
+        raise ValueError("A pitch ROI needs the camera's homography_path")
+
+    # Initialize YOLO model
+    model = YOLO(model_path)
+
+    predict_args = {"verbose": False, "save": False, "device": resolve_device(device)}
+    if imgsz:
+        predict_args["imgsz"] = imgsz
+
+    # Decodes ahead on a background thread; skipped frames are only grabbed, not decoded
+    source = FrameSource(video_path, stride=stride, prefetch=max(prefetch, 2 * batch_size))
+
+    # The pitch region is fixed per camera, so it is computed once from the video size
+    pitch_roi = None
+    if roi:
+        pitch_roi = PitchROI(load_homography_matrix(homography_path), source.width, source.height, mask=roi == "mask")
+        print(f"Pitch ROI {pitch_roi.box}: {pitch_roi.pixel_share(source.width, source.height):.0%} of each frame"
+              f"{', masked' if pitch_roi.mask is not None else ''}")
+    offset = pitch_roi.offset if pitch_roi else (0, 0)
+
+    start = time.perf_counter()
+    with source, DetectionWriter(output_path, flush_every) as writer, \
+            progress(total=len(source) or None, desc=f"Detecting {video_path}", unit="frame") as bar:
+        for indices, frames in iter_frame_batches(source, batch_size):
+            if pitch_roi:
+                frames = [pitch_roi.apply(frame) for frame in frames]
+            results = model.predict(frames, **predict_args)
+            for frame_idx, result in zip(indices, results):
+                writer.write(frame_detections(result, frame_idx, offset))
+            bar.update(len(frames))
+    elapsed = time.perf_counter() - start
+
+    fps = writer.frames_written / elapsed if elapsed > 0 else 0.0
+    decode = source.stats()
+    print(f"Processed {writer.frames_written} frames in {elapsed:.1f}s ({fps:.1f} frames/sec, "
+          f"batch={batch_size}, stride={stride}, imgsz={imgsz or 'default'}, device={predict_args['device']})")
+    print(f"Decoder: mean queue depth {decode['queue_depth_mean']:.1f}, "
+          f"waited for frames {decode['consumer_stalls']}x ({decode['consumer_stall_seconds']:.1f}s)")
+    return {"frames": writer.frames_written, "objects": writer.objects_written, "seconds": elapsed, "fps": fps,
+            "decode": decode, "roi": list(pitch_roi.box) if pitch_roi else None}